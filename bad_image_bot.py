@@ -1,42 +1,267 @@
-import config
-import re
-import requests
-from pwiki.wiki import Wiki
+import argparse
+import bad_image_parser
+import common_utils
+import csv
+import json
+import metrics
+import os
+import rate_limit
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-wiki = Wiki("meta.wikimedia.org", "TNTBot", config.TNT_BOT_BADIMAGE_PASS)
 page = "MediaWiki:Bad image list"
-filename = re.compile(r"\[\[:?.*?:(?P<file>.*?\..*?)\]\]")
-bad_images = []
+WORKERS = 16
+STATE_FILE = "./cache/bad_images_state.json"
 
 
-def get_all_sites() -> list:
-    response = requests.get("https://wm-domains.toolforge.org/domains.json")
+def get_all_sites(session=None) -> list:
+    if session is None:
+        session = common_utils.make_session()
+    response = rate_limit.http_get(
+        session, "https://wm-domains.toolforge.org/domains.json"
+    )
+    response.raise_for_status()
     json = response.json()
     return json["domains"]
 
 
-def get_bad_images(site: str, bad_images: list) -> list:
-    response = requests.get(
-        f"https://{site}/w/api.php?action=parse&format=json&page={page}&prop=wikitext&formatversion=2"
+def get_file_namespaces(session, site: str) -> frozenset:
+    """Get the names a site has for the File namespace, or None on an error"""
+    json = rate_limit.api_get(
+        session,
+        f"https://{site}/w/api.php",
+        {
+            "action": "query",
+            "format": "json",
+            "meta": "siteinfo",
+            "siprop": "namespaces|namespacealiases",
+            "formatversion": 2,
+        },
     )
+    if "error" in json:
+        print(f"{site}: Error: {json['error']['info']}", file=sys.stderr)
+        return None
+    namespace = json["query"]["namespaces"]["6"]
+    names = [namespace["name"], namespace.get("canonical", "File")]
+    names += [
+        alias["alias"]
+        for alias in json["query"].get("namespacealiases", [])
+        if alias["id"] == 6
+    ]
+    return bad_image_parser.file_namespace_names(names)
 
-    json = response.json()
+
+def get_bad_images(session, site: str) -> list:
+    """Get the entries on a site's bad image list, or None if it can't be read
+
+    Each entry is a [file, [exception pages]] pair. The raw wikitext is
+    streamed and parsed line by line. Like MediaWiki, only entries whose
+    first link is in the File namespace (by any of the site's names for
+    it) count.
+    """
+    response = rate_limit.http_get(
+        session,
+        f"https://{site}/w/index.php",
+        params={"title": page, "action": "raw"},
+        stream=True,
+    )
+    with response:
+        if response.status_code == 404:
+            return []
+        if response.status_code != 200:
+            print(f"{site}: Error: HTTP {response.status_code}", file=sys.stderr)
+            return None
+        file_namespaces = get_file_namespaces(session, site)
+        if file_namespaces is None:
+            return None
+        response.encoding = "utf-8"
+        lines = response.iter_lines(decode_unicode=True)
+        return [
+            list(entry)
+            for entry in bad_image_parser.parse_lines(lines, file_namespaces)
+        ]
+
+
+def get_revision_id(session, site: str):
+    """Get the current revision ID of a site's bad image list
+
+    Returns 0 if the page doesn't exist, or None if it can't be checked.
+    """
+    json = rate_limit.api_get(
+        session,
+        f"https://{site}/w/api.php",
+        {
+            "action": "query",
+            "format": "json",
+            "prop": "revisions",
+            "titles": page,
+            "rvprop": "ids",
+            "formatversion": 2,
+        },
+    )
     if "error" in json:
-        print(f"Error: {json['error']['info']}")
-        return
+        print(f"{site}: Error: {json['error']['info']}", file=sys.stderr)
+        return None
+    page_info = json["query"]["pages"][0]
+    if "missing" in page_info or "invalid" in page_info:
+        return 0
+    return page_info["revisions"][0]["revid"]
+
+
+def sync_bad_images(session, site: str, state: dict) -> list:
+    """Get a site's bad image list, only re-fetching it if it has changed
+
+    state holds the last seen revision ID and entries for each site, and is
+    updated in place.
+    """
+    revid = get_revision_id(session, site)
+    if revid is None:
+        return None
+    known = state.get(site)
+    if known is not None and known["revid"] == revid and "entries" in known:
+        metrics.cache("bad_image_list", True)
+        return known["entries"]
+    metrics.cache("bad_image_list", False)
+    entries = get_bad_images(session, site) if revid else []
+    if entries is not None:
+        state[site] = {"revid": revid, "entries": entries}
+    return entries
+
+
+def load_state(path: str) -> dict:
+    """Load the last seen revision IDs and entries of each site"""
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: dict) -> None:
+    """Save the sync state, replacing the old file only once it's written"""
+    common_utils.save_json(path, state)
+
+
+def fetch_all(
+    sites: list[str], session=None, workers: int = WORKERS, state: dict = None
+) -> dict:
+    """Get every site's bad image list, several sites at a time
 
-    wikitext = json["parse"]["wikitext"]
-    for line in wikitext.splitlines():
-        matches = re.search(filename, line)
-        if matches:
-            bad_images.append(matches.group("file"))
-    return bad_images
+    If a sync state is given, only lists that changed since it was saved
+    are fetched. Returns a dict of site -> list of [file, [exceptions]]
+    entries (None if it couldn't be read).
+    """
+    if session is None:
+        session = common_utils.make_session()
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if state is None:
+            futures = {
+                executor.submit(get_bad_images, session, site): site for site in sites
+            }
+        else:
+            futures = {
+                executor.submit(sync_bad_images, session, site, state): site
+                for site in sites
+            }
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                results[site] = future.result()
+            except Exception as e:
+                print(f"{site}: Error: {e}", file=sys.stderr)
+                results[site] = None
+    return results
+
+
+def build_index(results: dict) -> dict:
+    """Build an index of file -> set of sites that list it"""
+    index = {}
+    for site, entries in results.items():
+        for file, exceptions in entries or []:
+            index.setdefault(file, set()).add(site)
+    return index
+
+
+def build_exceptions(results: dict) -> dict:
+    """Build an index of file -> site -> pages where the file is allowed"""
+    exceptions = {}
+    for site, entries in results.items():
+        for file, pages in entries or []:
+            if pages:
+                exceptions.setdefault(file, {}).setdefault(site, []).extend(pages)
+    return exceptions
+
+
+def write_json(index: dict, results: dict, output) -> None:
+    json.dump(
+        {
+            "sites": len(results),
+            "failed_sites": sorted(
+                site for site, files in results.items() if files is None
+            ),
+            "files": {file: sorted(index[file]) for file in sorted(index)},
+            "exceptions": build_exceptions(results),
+        },
+        output,
+        indent=2,
+        ensure_ascii=False,
+    )
+    output.write("\n")
+
+
+def write_csv(index: dict, results: dict, output) -> None:
+    writer = csv.writer(output)
+    writer.writerow(["file", "wiki_count", "wikis"])
+    for file in sorted(index):
+        writer.writerow([file, len(index[file]), " ".join(sorted(index[file]))])
+
+
+FORMATS = {"json": write_json, "csv": write_csv}
 
 
 if __name__ == "__main__":
-    sites = get_all_sites()
-    for site in sites:
-        print(site)
-        if get_bad_images(site, bad_images) is not None:
-            bad_images = get_bad_images(site, bad_images)
-    print(len(bad_images))
+    parser = argparse.ArgumentParser(
+        prog="bad_image_bot.py",
+        description="Collect the bad image lists of every Wikimedia wiki",
+    )
+    parser.add_argument(
+        "--workers", help="How many sites to fetch at once", default=WORKERS, type=int
+    )
+    parser.add_argument(
+        "--format", help="Output format", choices=sorted(FORMATS), default="json"
+    )
+    parser.add_argument(
+        "-o", "--output", help="Write to a file instead of stdout", metavar="FILE"
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Only re-fetch lists that changed since the last incremental run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--state",
+        help="Where to keep the incremental sync state",
+        default=STATE_FILE,
+        metavar="FILE",
+    )
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("bad_image_bot", args.report, args.prometheus)
+
+    session = common_utils.make_session()
+    sites = get_all_sites(session)
+    print(f"Fetching bad image lists from {len(sites)} sites...", file=sys.stderr)
+    state = load_state(args.state) if args.incremental else None
+    results = fetch_all(sites, session, args.workers, state)
+    if state is not None:
+        save_state(args.state, state)
+    index = build_index(results)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            FORMATS[args.format](index, results, f)
+    else:
+        FORMATS[args.format](index, results, sys.stdout)
+    print(
+        f"{len(index)} unique files from {len(results)} sites.",
+        file=sys.stderr,
+    )
@@ -0,0 +1,72 @@
+"""Parser for MediaWiki:Bad image list pages
+
+Follows MediaWiki's own rules: only lines starting with "*" count, the first
+link on a line is the bad file (and must be in the File namespace), and any
+later links on the same line are pages where the file is still allowed
+(exceptions).
+"""
+
+import re
+from collections import namedtuple
+
+BadImage = namedtuple("BadImage", ["file", "exceptions"])
+# The File namespace's names on every wiki, in lower case. Wikis also have
+# local names for it (e.g. "Datei"); see file_namespace_names().
+FILE_NAMESPACES = frozenset({"file", "image"})
+# An entry line: "*", then the first link (namespace and title), then the
+# rest of the line. Anchored to the start of each line and with no lazy .*?
+# scanning, so each line is matched in one pass.
+entry = re.compile(
+    r"^\*[^\n\[]*\[\[:?([^\[\]|\n:]*):([^\[\]|\n]+)(?:\|[^\[\]\n]*)?\]\]([^\n]*)",
+    re.MULTILINE,
+)
+# A link target without surrounding whitespace, ignoring any |label
+link = re.compile(
+    r"\[\[:?\s*([^\[\]|\s](?:[^\[\]|]*[^\[\]|\s])?)\s*(?:\|[^\[\]]*)?\]\]"
+)
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a title the way MediaWiki would"""
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+def file_namespace_names(names) -> frozenset:
+    """Get the names the parsers accept for the File namespace
+
+    names are a wiki's own names and aliases for it, as siteinfo gives them.
+    Namespace names aren't case sensitive.
+    """
+    return FILE_NAMESPACES | {
+        " ".join(name.replace("_", " ").split()).lower() for name in names
+    }
+
+
+def _make_entry(namespace: str, file: str, rest: str, file_namespaces: frozenset):
+    if "." not in file:
+        return None
+    if namespace.lower() not in file_namespaces:
+        if " ".join(namespace.split()).lower() not in file_namespaces:
+            return None
+    if not file[:1].isupper() or "  " in file or file.strip() != file:
+        file = normalize_title(file)
+    return BadImage(file, link.findall(rest) if "[[" in rest else [])
+
+
+def parse_line(line: str, file_namespaces: frozenset = FILE_NAMESPACES):
+    """Parse one line of a bad image list, or return None if it isn't an entry"""
+    # Titles treat _ and space the same, so fix them all in one go
+    match = entry.match(line.replace("_", " "))
+    if match is None:
+        return None
+    return _make_entry(*match.groups(), file_namespaces)
+
+
+def parse_lines(lines, file_namespaces: frozenset = FILE_NAMESPACES):
+    """Parse a stream of lines, yielding a BadImage for each entry"""
+    for line in lines:
+        if line[:1] == "*":
+            bad_image = parse_line(line, file_namespaces)
+            if bad_image is not None:
+                yield bad_image
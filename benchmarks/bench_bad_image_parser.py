@@ -0,0 +1,87 @@
+"""Compare the bad image list parser with the old per-line regex loop
+
+Run with: python -m benchmarks.bench_bad_image_parser [lines]
+
+The like-for-like comparison is with the legacy loop that also collects
+exceptions. The files-only loop does less work (no exceptions, title
+normalization or namespace check) and is faster than the parser.
+"""
+
+import bad_image_parser
+import random
+import re
+import sys
+import time
+
+# The regex bad_image_bot used before bad_image_parser
+legacy_filename = re.compile(r"\[\[:?.*?:(?P<file>.*?\..*?)\]\]")
+
+
+def legacy_parse(wikitext: str) -> list:
+    bad_images = []
+    for line in wikitext.splitlines():
+        matches = re.search(legacy_filename, line)
+        if matches:
+            bad_images.append(matches.group("file"))
+    return bad_images
+
+
+legacy_link = re.compile(r"\[\[:?(.*?)\]\]")
+
+
+def legacy_parse_with_exceptions(wikitext: str) -> list:
+    """The old approach, extended to also collect exception links"""
+    bad_images = []
+    for line in wikitext.splitlines():
+        matches = re.search(legacy_filename, line)
+        if matches:
+            bad_images.append(
+                (matches.group("file"), re.findall(legacy_link, line)[1:])
+            )
+    return bad_images
+
+
+def make_list(lines: int, seed: int = 1) -> str:
+    """Make a synthetic bad image list, with some exceptions and noise"""
+    rng = random.Random(seed)
+    out = ["Images on this list may not be used inline.", ""]
+    for i in range(lines):
+        name = f"Example_file_{i}_{rng.randrange(10**6)}.jpg"
+        exceptions = " ".join(
+            f"[[Article {rng.randrange(10**5)}]]"
+            for _ in range(rng.choice([0, 0, 1, 3]))
+        )
+        if rng.random() < 0.05:
+            out.append(f"Some commentary about entry {i} without links")
+        out.append(f"* [[:File:{name}]] {exceptions}".rstrip())
+    return "\n".join(out)
+
+
+def bench(name: str, func, wikitext: str, lines: int, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(wikitext)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>24}: {best:.3f}s, {lines / best:,.0f} lines/s")
+    return best
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    wikitext = make_list(lines)
+    print(f"Synthetic bad image list: {lines:,} entries, {len(wikitext):,} bytes")
+    legacy = bench("legacy (files only)", legacy_parse, wikitext, lines)
+    legacy_full = bench(
+        "legacy (with exceptions)", legacy_parse_with_exceptions, wikitext, lines
+    )
+    # As bad_image_bot uses it
+    parser = bench(
+        "bad_image_parser",
+        lambda text: list(bad_image_parser.parse_lines(text.splitlines())),
+        wikitext,
+        lines,
+    )
+    print(f"Speedup vs legacy (files only): {legacy / parser:.2f}x")
+    print(f"Speedup vs legacy (with exceptions): {legacy_full / parser:.2f}x")
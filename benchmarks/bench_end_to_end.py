@@ -0,0 +1,199 @@
+"""End-to-end throughput of each tool against a local fake wiki farm
+
+Run with: python -m pytest benchmarks/bench_end_to_end.py
+
+Every request goes over HTTP to tests.fake_wiki_server, so nothing touches
+the real wikis. Set BENCH_USERS to change the size of the seeded data sets
+(default 10000; the fake is happy with up to about a million) and
+BENCH_LATENCY to add a delay (in seconds) to every request. Alongside the
+wall time, each benchmark records the requests made per user and the
+process's peak RSS (see --benchmark-json for them).
+"""
+
+import bad_image_bot
+import cleanup_cat_uaa
+import common_utils
+import defaults
+import io
+import mass_cache
+import os
+import pytest
+import rate_limit
+import resource
+import tempfile
+import wiki_sessions
+import wmf_staff_accounts
+from tests import fake_wiki_server
+from types import SimpleNamespace
+
+USERS = int(os.environ.get("BENCH_USERS", 10_000))
+LATENCY = float(os.environ.get("BENCH_LATENCY", 0))
+STAFF_CATEGORY = "Category:Wikimedia Foundation staff"
+UAA_CATEGORY = "Category:Wikipedia usernames with possible policy issues"
+UAA_SUBCAT = "Category:Wikipedia usernames that may be promotional"
+# How many wikis mass_cache and bad_image_bot run over
+WIKIS = 8
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """A running fake wiki farm that every tool talks to"""
+    server = fake_wiki_server.FakeWikiServer(LATENCY).start()
+
+    def make_wiki(domain, username, password, cookie_dir):
+        from pwiki.wiki import Wiki
+
+        # The fake accepts any password, and config.py's may well be empty
+        wiki = Wiki(domain, username, "password", None, server.api(domain))
+        # Keep per-wiki rate limiters keyed on the real domain
+        wiki.domain = domain
+        return wiki
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(common_utils, "make_session", server.session)
+    monkeypatch.setattr(wiki_sessions, "make_wiki", make_wiki)
+    monkeypatch.setattr(wiki_sessions, "_managers", {})
+    monkeypatch.setattr(defaults, "COOKIE_DIR", str(tmp_path / "cookies"))
+    # Measure the tools, not the politeness delays
+    monkeypatch.setattr(defaults, "READ_RATE", 1_000_000)
+    monkeypatch.setattr(defaults, "DELAY", 0.000_001)
+    monkeypatch.setattr(
+        wmf_staff_accounts, "time", SimpleNamespace(sleep=lambda seconds: None)
+    )
+    rate_limit.reset()
+    yield server
+    server.stop()
+    rate_limit.reset()
+
+
+def run_benchmark(benchmark, server, seed, run, users: int) -> None:
+    """Time run() on freshly seeded data, and report requests and memory"""
+    rss_before = peak_rss_mb()
+
+    def setup():
+        server.wikis.clear()
+        seed()
+        server.request_count = 0
+        server.requests_by_wiki.clear()
+        return (), {}
+
+    benchmark.pedantic(run, setup=setup, rounds=1, iterations=1)
+    benchmark.extra_info["users"] = users
+    benchmark.extra_info["requests"] = server.request_count
+    benchmark.extra_info["requests_per_user"] = round(server.request_count / users, 3)
+    benchmark.extra_info["meta_requests"] = server.requests_by_wiki.get(
+        "meta.wikimedia.org", 0
+    )
+    benchmark.extra_info["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    benchmark.extra_info["rss_growth_mb"] = round(peak_rss_mb() - rss_before, 1)
+
+
+def test_wmf_staff_accounts(benchmark, server, tmp_path):
+    args = SimpleNamespace(
+        yes=True,
+        regen_cache=False,
+        dry=False,
+        diff=False,
+        category=STAFF_CATEGORY,
+        resume=False,
+        delta=False,
+    )
+
+    def seed():
+        fake_wiki_server.seed_staff(server, "meta.wikimedia.org", STAFF_CATEGORY, USERS)
+
+    def run():
+        cache_dir = tempfile.mkdtemp(dir=tmp_path)
+        assert wmf_staff_accounts.main(
+            args, "meta.wikimedia.org", False, False, cache_dir
+        )
+
+    run_benchmark(benchmark, server, seed, run, USERS)
+
+
+def test_cleanup_cat_uaa(benchmark, server, monkeypatch):
+    monkeypatch.setattr(defaults, "DRY", False)
+    monkeypatch.setattr(cleanup_cat_uaa, "session", None)
+    monkeypatch.setattr(cleanup_cat_uaa, "uaa_log", None)
+    monkeypatch.setattr(cleanup_cat_uaa, "journal", None)
+
+    def seed():
+        fake_wiki_server.seed_uaa(server, UAA_SUBCAT, USERS)
+        server.wiki("en.wikipedia.org").categories[UAA_CATEGORY] = [
+            {"ns": 14, "title": UAA_SUBCAT}
+        ]
+
+    def run():
+        cleanup_cat_uaa.check_category(UAA_SUBCAT)
+        cleanup_cat_uaa.flush_uaa_log()
+
+    run_benchmark(benchmark, server, seed, run, USERS)
+
+
+def test_bad_image_bot(benchmark, server):
+    sites = [f"wiki{i}.example.org" for i in range(WIKIS)]
+    output = io.StringIO()
+
+    def seed():
+        fake_wiki_server.seed_bad_images(server, sites, USERS // WIKIS)
+
+    def run():
+        results = bad_image_bot.fetch_all(sites, common_utils.make_session())
+        assert all(results.values())
+        bad_image_bot.write_json(bad_image_bot.build_index(results), results, output)
+
+    run_benchmark(benchmark, server, seed, run, USERS)
+
+
+def test_mass_cache(benchmark, server, tmp_path):
+    domains = [f"wiki{i}.example.org" for i in range(WIKIS)]
+    projects = {
+        domain: {
+            "title": STAFF_CATEGORY,
+            "url": f"https://{domain}/wiki/Category:Wikimedia_Foundation_staff",
+        }
+        for domain in domains
+    }
+
+    def seed():
+        for i, domain in enumerate(domains):
+            fake_wiki_server.seed_staff(
+                server, domain, STAFF_CATEGORY, USERS // WIKIS, seed=i
+            )
+
+    def run():
+        cache_dir = tempfile.mkdtemp(dir=tmp_path)
+        results = mass_cache.run(projects, 4, cache_dir)
+        assert all(result["status"] == "ok" for result in results)
+
+    run_benchmark(benchmark, server, seed, run, USERS)
+
+
+@pytest.mark.parametrize("two_phase", [False, True], ids=["per_wiki", "two_phase"])
+def test_mass_cache_shared_staff(benchmark, server, tmp_path, two_phase):
+    """The same staff on every wiki, as with the real sitelinked categories"""
+    domains = [f"wiki{i}.example.org" for i in range(WIKIS)]
+    projects = {
+        domain: {
+            "title": STAFF_CATEGORY,
+            "url": f"https://{domain}/wiki/Category:Wikimedia_Foundation_staff",
+        }
+        for domain in domains
+    }
+    users = USERS // WIKIS
+
+    def seed():
+        for domain in domains:
+            fake_wiki_server.seed_staff(server, domain, STAFF_CATEGORY, users)
+
+    def run():
+        cache_dir = tempfile.mkdtemp(dir=tmp_path)
+        results = mass_cache.run(projects, 4, cache_dir, two_phase=two_phase)
+        assert all(result["status"] == "ok" for result in results)
+
+    run_benchmark(benchmark, server, seed, run, users * WIKIS)
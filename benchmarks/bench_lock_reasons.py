@@ -0,0 +1,92 @@
+"""Compare the lock reason classifier with searching commentRegex each time
+
+Run with: python -m benchmarks.bench_lock_reasons [comments]
+"""
+
+import common_regexes
+import lock_reasons
+import random
+import sys
+import time
+
+# Comments like the ones stewards leave in the globalauth log, with a
+# placeholder for whatever varies between them
+TEMPLATES = [
+    ("No longer works at WMF", 30),
+    ("No longer works for the Wikimedia Foundation", 10),
+    ("No longer employed at WMF - {n}", 5),
+    ("WMF Contractor; Contract ended.", 8),
+    ("Contract ended ({n})", 3),
+    ("Offboarding", 6),
+    ("off-boarding per [[phab:T{n}]]", 3),
+    ("laid off", 2),
+    ("Long-term abuse", 40),
+    ("[[m:NOP|Open proxy]]: Webhost", 25),
+    ("Spam-only account: spambot", 40),
+    ("Cross-wiki abuse", 30),
+    ("Long-term abuse: [[m:Special:MyLanguage/LTA/{n}|LTA]]", 15),
+    ("Compromised account ([[Special:Diff/{n}|diff]])", 5),
+    ("Sockpuppet of [[User:Vandal {n}]]", 10),
+    ("Abusing multiple accounts: [[Special:CentralAuth/Sock {n}|Sock {n}]]", 10),
+    ("relocking per temp unlock last week", 2),
+    ("Renamed", 4),
+]
+
+
+def make_corpus(count: int, seed: int = 1) -> list[str]:
+    """Make lock comments, where a few common ones repeat a lot"""
+    rng = random.Random(seed)
+    templates = [template for template, weight in TEMPLATES]
+    weights = [weight for template, weight in TEMPLATES]
+    return [
+        template.format(n=rng.randrange(count // 10 + 1))
+        for template in rng.choices(templates, weights, k=count)
+    ]
+
+
+def search_each(comments: list[str]) -> list:
+    """What wmf_staff_accounts did before lock_reasons"""
+    return [common_regexes.commentRegex.search(comment) for comment in comments]
+
+
+def classify_each(comments: list[str]) -> list:
+    classifier = lock_reasons.Classifier()
+    return [classifier.classify(comment) for comment in comments]
+
+
+def classify_batch(comments: list[str]) -> dict:
+    return lock_reasons.Classifier().classify_many(comments)
+
+
+def classify_uncached(comments: list[str]) -> dict:
+    """One pass over the comments, with a cache too small to help"""
+    return lock_reasons.Classifier(size=0).classify_many(comments)
+
+
+def bench(name: str, func, comments: list[str], repeat: int = 5) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(comments)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>28}: {best:.4f}s, {len(comments) / best:,.0f} comments/s")
+    return best
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    comments = make_corpus(count)
+    unique = set(comments)
+    print(f"{count:,} lock comments, {len(unique):,} unique")
+    assert {
+        comment: lock_reasons.Classifier().classify(comment).matched
+        for comment in unique
+    } == {comment: search_each([comment])[0] is not None for comment in unique}
+    search = bench("commentRegex.search() each", search_each, comments)
+    each = bench("classify() each", classify_each, comments)
+    batch = bench("classify_many()", classify_batch, comments)
+    uncached = bench("classify_many(), no cache", classify_uncached, comments)
+    print(f"Speedup of classify() each: {search / each:.2f}x")
+    print(f"Speedup of classify_many(): {search / batch:.2f}x")
+    print(f"Speedup of one pass alone: {search / uncached:.2f}x")
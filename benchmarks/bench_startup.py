@@ -0,0 +1,85 @@
+"""Measure how long each tool takes to import everything and print --help
+
+Run with: python -m benchmarks.bench_startup
+
+Exits with an error if any tool goes over STARTUP_BUDGET_MS. (The tests
+only check that no heavy modules are loaded, as timings are too noisy on
+shared machines.)
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS = [
+    "bad_image_bot.py",
+    "cleanup_cat_uaa.py",
+    "lock_cache.py",
+    "mass_cache.py",
+    "wmf_staff_accounts.py",
+]
+# Modules that are slow to import and need the network, so --help shouldn't
+# load them
+HEAVY_MODULES = ["requests", "pwiki"]
+# How long (in ms) a tool may spend on its own imports before --help prints
+STARTUP_BUDGET_MS = 150
+
+
+def parse_importtime(output: str, top_level_only: bool = False) -> dict:
+    """Get the cumulative import time (in microseconds) of each module"""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented under the module that imported them
+        if top_level_only and name[1:].startswith(" "):
+            continue
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run_importtime(args: list[str]) -> tuple:
+    """Run Python with -X importtime, returning the result and its wall time"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    return result, time.perf_counter() - start
+
+
+def measure(tool: str) -> dict:
+    """Run a tool's --help, timing the imports it adds to a bare interpreter"""
+    bare, _ = run_importtime(["-c", "pass"])
+    interpreter = parse_importtime(bare.stderr, top_level_only=True)
+    result, seconds = run_importtime([tool, "--help"])
+    imports = parse_importtime(result.stderr, top_level_only=True)
+    return {
+        "tool": tool,
+        "returncode": result.returncode,
+        "seconds": seconds,
+        "import_us": sum(us for name, us in imports.items() if name not in interpreter),
+        "modules": parse_importtime(result.stderr),
+    }
+
+
+if __name__ == "__main__":
+    over_budget = []
+    for tool in TOOLS:
+        result = measure(tool)
+        heavy = [name for name in HEAVY_MODULES if name in result["modules"]]
+        if result["import_us"] / 1000 >= STARTUP_BUDGET_MS:
+            over_budget.append(tool)
+        print(
+            f"{tool:>24}: {result['seconds'] * 1000:6.0f}ms total, "
+            f"{result['import_us'] / 1000:6.1f}ms importing"
+            + (f" (loads {', '.join(heavy)})" if heavy else "")
+        )
+    if over_budget:
+        sys.exit(f"Over the {STARTUP_BUDGET_MS}ms budget: {', '.join(over_budget)}")
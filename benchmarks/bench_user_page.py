@@ -0,0 +1,64 @@
+"""Compare transform_user_page() with the old regex chain
+
+transform_user_page() runs the same chain, and compares each step's output
+to report which rules fired. The old modify_user_page() also split both
+texts for the diff whether or not it was shown.
+
+Run with: python -m benchmarks.bench_user_page [pages]
+"""
+
+import sys
+import time
+import wmf_staff_accounts
+
+
+def chain(page_content: str) -> str:
+    """The four substitutions modify_user_page() used to make"""
+    page_content = wmf_staff_accounts.rm_formerstaff(page_content)
+    page_content = wmf_staff_accounts.rm_category(page_content)
+    page_content = wmf_staff_accounts.cleanup_params(page_content)
+    return wmf_staff_accounts.add_formerparam(page_content)
+
+
+def old_modify(page_content: str) -> list[str]:
+    """What modify_user_page() used to do before editing: the chain, plus
+    splitting both texts for the diff whether or not it was shown"""
+    new_content = chain(page_content)
+    return [page_content.splitlines(1), new_content.splitlines(1)]
+
+
+def make_page(i: int) -> str:
+    """Make a staff user page, padded out like a real one"""
+    about = "\n".join(f"Paragraph {n} about my work on project {i}." for n in range(40))
+    return (
+        "{{former staff}}\n{{user info\n"
+        f"| full name = Person {i}\n| former = yes\n| about me =\n{about}\n"
+        "}}\n\n[[Category:Wikimedia Foundation staff]]\n"
+    )
+
+
+def bench(name: str, func, pages: list[str], repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            func(page)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>14}: {best:.3f}s, {len(pages) / best:,.0f} pages/s")
+    return best
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    pages = [make_page(i) for i in range(count)]
+    print(f"{count:,} pages, {sum(len(page) for page in pages) // count:,} bytes each")
+    old = bench("chain", chain, pages)
+    old_full = bench("chain + diff", old_modify, pages)
+    new = bench(
+        "transform",
+        lambda page: wmf_staff_accounts.transform_user_page(page)[0],
+        pages,
+    )
+    print(f"transform is {old / new:.2f}x the speed of the chain alone")
+    print(f"transform is {old_full / new:.2f}x the speed of chain + diff")
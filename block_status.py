@@ -0,0 +1,126 @@
+import common_utils
+import rate_limit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+EN_API = "https://en.wikipedia.org/w/api.php"
+# Most bkusers values per request without apihighlimits
+BKUSERS_LIMIT = 50
+WORKERS = 4
+
+
+def join_values(values: list[str]) -> str:
+    """Join values for a multi-value API parameter
+
+    If any value contains a |, the values are separated with U+001F instead,
+    which MediaWiki accepts when the parameter starts with it.
+    """
+    if any("|" in value for value in values):
+        return "\x1f" + "\x1f".join(values)
+    return "|".join(values)
+
+
+def normalize_username(user: str) -> str:
+    """Normalize a username (or user talk page title) the way MediaWiki does"""
+    user = common_utils.global_username(user).strip()
+    return user[:1].upper() + user[1:]
+
+
+def get_indef_blocked(
+    session: "requests.Session", users: list[str], api: str = EN_API
+) -> set[str]:
+    """Get which of a batch of users are blocked indefinitely
+
+    Returns the normalized usernames that have at least one indefinite
+    block. If the batch is rejected (e.g. because of an invalid username),
+    each user is checked on their own instead. Raises rate_limit.ApiError if
+    the batch couldn't be checked.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "list": "blocks",
+        "bkusers": join_values([normalize_username(user) for user in users]),
+        "bkshow": "!temp",
+        "bkprop": "user|expiry",
+        "bklimit": "max",
+    }
+    blocked = set()
+    while True:
+        json = rate_limit.api_get(session, api, params)
+        if "error" in json:
+            if len(users) > 1:
+                return set().union(
+                    *(get_indef_blocked(session, [user], api) for user in users)
+                )
+            if json["error"]["code"].startswith("baduser"):
+                # Not a valid username, so it can't be blocked
+                return set()
+            raise rate_limit.ApiError.from_json(api, json)
+        for block in json["query"]["blocks"]:
+            blocked.add(normalize_username(block["user"]))
+        if "continue" not in json:
+            return blocked
+        params.update(json["continue"])
+
+
+def resolve_blocks(
+    users: list[str],
+    session: "requests.Session" = None,
+    api: str = EN_API,
+    batch_size: int = BKUSERS_LIMIT,
+    workers: int = WORKERS,
+) -> dict:
+    """Check many users for indefinite blocks
+
+    Users are checked batch_size at a time, with several batches in flight
+    at once. Returns a dict of user -> whether they're blocked indefinitely
+    (or the rate_limit.ApiError if that couldn't be checked), keyed by the
+    names (or user talk page titles) that were passed in.
+    """
+    return dict(iter_blocks(dict.fromkeys(users), session, api, batch_size, workers))
+
+
+def iter_blocks(
+    users,
+    session: "requests.Session" = None,
+    api: str = EN_API,
+    batch_size: int = BKUSERS_LIMIT,
+    workers: int = WORKERS,
+):
+    """Check a stream of users for indefinite blocks
+
+    Yields (user, blocked indefinitely) in the order the users came in,
+    without waiting for the whole stream. Up to workers batches are checked
+    at once. If a batch couldn't be checked, its users are yielded with the
+    rate_limit.ApiError instead, which must not be taken to mean they aren't
+    blocked.
+    """
+    if session is None:
+        session = common_utils.make_session()
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in common_utils.chunked(users, batch_size):
+            in_flight.append(
+                (batch, executor.submit(get_indef_blocked, session, batch, api))
+            )
+            if len(in_flight) >= workers:
+                yield from _finish_batch(*in_flight.popleft())
+        while in_flight:
+            yield from _finish_batch(*in_flight.popleft())
+
+
+def _finish_batch(batch: list[str], future):
+    try:
+        blocked = future.result()
+    except rate_limit.ApiError as e:
+        for user in batch:
+            yield user, e
+        return
+    for user in batch:
+        yield user, normalize_username(user) in blocked
@@ -0,0 +1,114 @@
+import atexit
+import defaults
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from termcolor import colored
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+_listeners = {}
+_lock = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """Formats records as "<time>: <message>" """
+
+    def __init__(self):
+        super().__init__("%(asctime)s: %(message)s", DATE_FORMAT)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {
+                "time": self.formatTime(record, DATE_FORMAT),
+                "level": record.levelname,
+                "message": record.getMessage(),
+            }
+        )
+
+
+class ColourHandler(logging.StreamHandler):
+    """Prints records to the terminal with termcolor colours"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        attrs = ["underline"] if getattr(record, "underline", False) else None
+        return colored(
+            super().format(record), getattr(record, "colour", None), attrs=attrs
+        )
+
+
+def _only(attribute: str):
+    def check(record: logging.LogRecord) -> bool:
+        return getattr(record, attribute, True)
+
+    return check
+
+
+def get_logger(
+    filename: str,
+    json_lines: bool = None,
+    max_bytes: int = None,
+    backup_count: int = None,
+    stream=None,
+) -> logging.Logger:
+    """Get a logger that writes to a file (and the terminal) in the background
+
+    The file is opened once and rotated when it reaches max_bytes. Records
+    are handed to a writer thread, so callers never wait on the disk or the
+    terminal. Pass extra={"to_file": ..., "to_terminal": ..., "colour": ...,
+    "underline": ...} to control where and how each record goes.
+    """
+    logger = logging.getLogger(f"bot_logging.{filename}")
+    with _lock:
+        if filename in _listeners:
+            return logger
+        if json_lines is None:
+            json_lines = defaults.LOG_JSON
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename,
+            maxBytes=max_bytes if max_bytes is not None else defaults.LOG_MAX_BYTES,
+            backupCount=(
+                backup_count if backup_count is not None else defaults.LOG_BACKUPS
+            ),
+            delay=True,
+        )
+        file_handler.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+        file_handler.addFilter(_only("to_file"))
+        terminal_handler = ColourHandler(stream or sys.stdout)
+        terminal_handler.setFormatter(TextFormatter())
+        terminal_handler.addFilter(_only("to_terminal"))
+
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        listener = logging.handlers.QueueListener(
+            records, file_handler, terminal_handler, respect_handler_level=True
+        )
+        listener.start()
+        _listeners[filename] = (logger, listener)
+    return logger
+
+
+def close(filename: str = None) -> None:
+    """Write out everything queued and close the log (or every log)"""
+    with _lock:
+        filenames = [filename] if filename is not None else list(_listeners)
+        for name in filenames:
+            if name not in _listeners:
+                continue
+            logger, listener = _listeners.pop(name)
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+
+
+atexit.register(close)
@@ -0,0 +1,90 @@
+import json
+import metrics
+import os
+import threading
+import time
+
+
+def journal_path(
+    directory: str, name: str, dry: bool = False, cache_only: bool = False
+) -> str:
+    """Get the journal file for one kind of run of a tool
+
+    Dry and cache-only runs don't do the work a real run does (their
+    "locked" and "edited" accounts were never edited), so each mode keeps
+    its own journal, and resuming one never skips work for another.
+    """
+    mode = "-cache-only" if cache_only else "-dry" if dry else ""
+    return os.path.join(directory, f"{name}{mode}.jsonl")
+
+
+class Journal:
+    """Records which titles a run has finished, so a later run can resume
+
+    Each outcome is appended to a JSON lines file as soon as it's known, so
+    nothing is lost if the run crashes. Titles are grouped by scope (e.g. a
+    category), and a whole scope can be marked as finished. Without resume,
+    the file is started afresh.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done = {}
+        self.finished = set()
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if resume and os.path.isfile(path):
+            self._load()
+        self.file = open(path, "a" if resume else "w")
+
+    def _load(self) -> None:
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line can be cut short by a crash
+                    continue
+                if entry.get("finished"):
+                    self.finished.add(entry["scope"])
+                else:
+                    self.done.setdefault(entry["scope"], {})[entry["title"]] = entry[
+                        "outcome"
+                    ]
+
+    def _write(self, entry: dict) -> None:
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def is_done(self, scope: str, title: str) -> bool:
+        """Check if a title was finished by an earlier run"""
+        return title in self.done.get(scope, ())
+
+    def outcome(self, scope: str, title: str):
+        """Get what happened to a title, or None if it wasn't finished"""
+        return self.done.get(scope, {}).get(title)
+
+    def record(self, scope: str, title: str, outcome: str) -> None:
+        """Record that a title is finished"""
+        self.done.setdefault(scope, {})[title] = outcome
+        # Every outcome passes through here, so count them for the run report
+        metrics.count(f"outcome:{outcome}")
+        self._write(
+            {"scope": scope, "title": title, "outcome": outcome, "time": time.time()}
+        )
+
+    def is_finished(self, scope: str) -> bool:
+        """Check if a whole scope was finished by an earlier run"""
+        return scope in self.finished
+
+    def finish(self, scope: str) -> None:
+        """Record that a whole scope is finished"""
+        self.finished.add(scope)
+        self._write({"scope": scope, "finished": True, "time": time.time()})
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
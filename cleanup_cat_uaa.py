@@ -1,38 +1,112 @@
 import argparse
-import config
+import atexit
+import block_status
+import bot_logging
+import checkpoint
+import common_utils
 import defaults
-import random
+import delta
+import metrics
+import pipeline
+import rate_limit
 import re
-import requests
 import sys
 import time
+import wiki_log
+import wiki_pages
+import wiki_sessions
 from datetime import datetime
-from pwiki.wiki import Wiki
 from termcolor import cprint
 
-wiki = Wiki("en.wikipedia.org", "TNTBot", config.TNT_BOT_PASS)
 # TODO: Remember that non-capturing regex exists, silly (:
 removal_regex = re.compile(
     r"<!-- THE FOLLOWING( TWO)? CATEGOR.*?(!<-- \*\*\* -->)? ?<!-- Template:",
     re.IGNORECASE,
 )
 edit_summary = "Removing [[CAT:UAA]] from indefinitely blocked editor ([[Wikipedia:Bots/Requests for approval/TNTBot 6|BRFA]])"
+NS_USER_TALK = 3
+NS_CATEGORY = 14
+session = None
+uaa_log = None
+# Set to a checkpoint.Journal to record (and skip, with --resume) finished work
+journal = None
 stats = {}
 stats["checked_subcats"] = 0
 stats["checked_users"] = 0
 stats["start_time"] = round(time.time())
 
 
-def get_subcats() -> list[str]:
+def get_wiki():
+    """Get the enwiki client, logging in on first use"""
+    return wiki_sessions.get_wiki("en.wikipedia.org")
+
+
+def get_session():
+    """Get the session for API reads, making it on first use"""
+    global session
+    if session is None:
+        session = common_utils.make_session()
+    return session
+
+
+def get_uaa_log() -> wiki_log.WikiLog:
+    """Get the on-wiki log, making it on first use"""
+    global uaa_log
+    if uaa_log is None:
+        uaa_log = wiki_log.WikiLog(
+            get_wiki(), "User:TNTBot/Logs/UAA Cleanup", "Logging UAA cleanup"
+        )
+    return uaa_log
+
+
+def flush_uaa_log() -> None:
+    """Write out any queued on-wiki log lines"""
+    if uaa_log is not None:
+        uaa_log.flush()
+
+
+def record_outcome(subcat: str, user: str, outcome: str) -> None:
+    """Record what happened to a user in the checkpoint journal"""
+    if journal is not None:
+        journal.record(subcat, user, outcome)
+
+
+def delta_candidates(index: delta.DeltaIndex, subcats) -> dict:
+    """Find the members of each subcategory that may have changed
+
+    That's anyone added to a subcategory, or blocked or unblocked, since the
+    last delta run, and anyone the last delta run couldn't finish. Returns a
+    dict of subcategory -> list of members.
+    """
+    # Block log entries are for User:, the category holds User talk: pages
+    blocked = {
+        title.replace("User:", "User talk:", 1)
+        for title in index.changed_titles(get_session(), block_status.EN_API, "block")
+    }
+    candidates = {}
+    for subcat in subcats:
+        added = index.update(get_session(), block_status.EN_API, subcat, [NS_USER_TALK])
+        candidates[subcat] = sorted(
+            added | ((blocked | index.retries(subcat)) & index.members(subcat))
+        )
+    return candidates
+
+
+def get_subcats():
     """Get the subcategories of the UAA category"""
-    return wiki.category_members(
-        "Category:Wikipedia usernames with possible policy issues", ["Category"]
+    return pipeline.iter_category_members(
+        get_session(),
+        block_status.EN_API,
+        "Category:Wikipedia usernames with possible policy issues",
+        [NS_CATEGORY],
     )
 
 
-def get_category_members(category: str) -> list[str]:
+def get_category_members(category: str):
     """Get the members of a category"""
-    return wiki.category_members(category, ["User talk"])
+    return pipeline.iter_category_members(
+        get_session(), block_status.EN_API, category, [NS_USER_TALK]
+    )
 
 
 def log_data(
@@ -43,82 +117,50 @@ def log_data(
     colour_print=None,
     underline: bool = False,
 ) -> None:
-    """Log data to a file/terminal"""
-    with open(filename, "a+") as f:
-        dt_string = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        content = f"{dt_string}: {data}"
-        if not dont_write_to_file:
-            f.write(content + "\n")
-        if also_print:
-            if underline:
-                cprint(content, colour_print, attrs=["underline"])
-            else:
-                cprint(content, colour_print)
+    """Log data to a file/terminal (written in the background)"""
+    bot_logging.get_logger(filename).info(
+        data,
+        extra={
+            "to_file": not dont_write_to_file,
+            "to_terminal": also_print,
+            "colour": colour_print,
+            "underline": underline,
+        },
+    )
 
 
 def log_to_wiki(data: str) -> None:
-    """Log data to a subpage"""
-    log_page = "User:TNTBot/Logs/UAA Cleanup"
-    content = wiki.page_text(log_page)
-    content += f"\n* {data}"
-    if not defaults.DRY:
-        wiki.edit(
-            title=log_page,
-            text=content,
-            summary="Logging UAA cleanup",
-            minor=True,
-        )
-    else:
-        print(f"Dry run, not logging {data}")
+    """Log data to a subpage (queued, see wiki_log.WikiLog)"""
+    get_uaa_log().add(data)
+
 
+def remove_page_from_category(page: str, base: wiki_pages.Page):
+    """Remove a page (fetched as base) from the UAA category
 
-def remove_page_from_category(page: str) -> None:
-    """Remove a page from the UAA category"""
-    content = wiki.page_text(page)
-    new_content = removal_regex.sub("<!-- Template:", content)
+    Returns the wiki_pages.EditResult, or None on a dry run. Pages that
+    wouldn't change aren't edited at all, as the edit would be a no-op.
+    """
+    new_content = removal_regex.sub("<!-- Template:", base.text)
+    if new_content == base.text:
+        return wiki_pages.EditResult(None, True, False, None)
     if not defaults.DRY:
         log_data(f"Editing {page}...", "cleanup_cat_uaa-debug.log", also_print=True)
-        wiki.edit(
-            title=page,
-            text=new_content,
-            summary=edit_summary,
-            minor=True,
+        return wiki_pages.edit(
+            get_wiki(), page, new_content, edit_summary, minor=True, base=base
         )
     else:
         log_data(
             f"Dry run, not editing {page}", "cleanup_cat_uaa-debug.log", also_print=True
         )
-    time.sleep(1)
+        return None
 
 
-def get_last_edit(expected_page: str):
-    bot_contribs = wiki.contribs("User:TNTBot", ns=["User talk"])
-    return bot_contribs[0]
+def check_for_block(user: str):
+    """Check if a user is blocked indefinitely
 
-
-def get_page_last_edit(page: str):
-    last_edit = wiki.revisions(page)[0]
-    if last_edit.user == "TNTBot":
-        return last_edit
-    else:
-        return False
-
-
-def check_for_block(user: str) -> bool:
-    """Check if a user is blocked indefinitely"""
-    user = user.replace("User talk:", "")
-    response = requests.get(
-        f"https://en.wikipedia.org/w/api.php?action=query&format=json&list=blocks&formatversion=2&bkusers={user}&bkshow=!temp",
-        headers=defaults.HEADERS,
-    )
-    json = response.json()
-    if "error" in json:
-        print(f"Error: {json['error']['info']}")
-        return False
-    if len(json["query"]["blocks"]) == 0:
-        return False
-    else:
-        return True
+    Returns the rate_limit.ApiError instead if that couldn't be checked.
+    """
+    return block_status.resolve_blocks([user])[user]
 
 
 def make_log_message(user: str, subcat: str, revid) -> str:
@@ -132,12 +174,87 @@ def make_log_message(user: str, subcat: str, revid) -> str:
         return f"{dt_string}: Removed {template_str} from [[:{subcat}]] -- ~~~~"
 
 
-def check_category(subcat: str) -> None:
-    """Check a UAA subcategory for indefinitely blocked users"""
+def remove_blocked_users(users: list[str], subcat: str) -> list[str]:
+    """Fetch the pages of blocked users together and remove them from subcat
+
+    Returns the users that couldn't be removed.
+    """
+    if not users:
+        return []
+    failed = []
+    wiki = get_wiki()
+    for user, page in wiki_pages.iter_pages(users, wiki.client, wiki.endpoint):
+        if isinstance(page, rate_limit.ApiError):
+            # Not recorded, so a resumed run tries again
+            log_data(
+                f"Couldn't fetch {user}: {page}",
+                "cleanup_cat_uaa-debug.log",
+                also_print=True,
+                colour_print="red",
+            )
+            failed.append(user)
+            continue
+        if page is None:
+            log_data(
+                f"{user} doesn't exist any more, skipping.",
+                "cleanup_cat_uaa-debug.log",
+                also_print=True,
+                colour_print="yellow",
+            )
+            record_outcome(subcat, user, "missing")
+            continue
+        result = remove_page_from_category(user, page)
+        if result is None:
+            record_outcome(subcat, user, "dry run")
+            continue
+        if not result.ok:
+            # Not recorded, so a resumed run tries again
+            failed.append(user)
+            continue
+        record_outcome(subcat, user, "unchanged" if result.nochange else "removed")
+        if result.nochange:
+            log_data(
+                f"{user} wasn't in the category any more, nothing to do.",
+                "cleanup_cat_uaa-debug.log",
+                also_print=True,
+                colour_print="yellow",
+            )
+            continue
+        log_to_wiki(make_log_message(user, subcat, result.revid))
+        log_data(
+            f"Removed {user} from {subcat}.",
+            "cleanup_cat_uaa-debug.log",
+            also_print=True,
+            colour_print="green",
+        )
+        if defaults.SUPERVISED:
+            cprint(
+                "1 edit made, and supervised testing is enabled. Exiting.",
+                "blue",
+            )
+            sys.exit()
+    return failed
+
+
+def check_category(subcat: str, members=None) -> list[str]:
+    """Check a UAA subcategory for indefinitely blocked users
+
+    Checks every member, unless only some members are given. Returns the
+    members that couldn't be checked or removed.
+    """
+    if journal is not None and journal.is_finished(subcat):
+        log_data(
+            f"Already finished {subcat}, skipping.",
+            "cleanup_cat_uaa-debug.log",
+            also_print=True,
+            colour_print="blue",
+        )
+        return []
     stats["checked_subcats"] += 1
+    metrics.count("checked_subcats")
+    wiki = get_wiki()
     wiki.purge(subcat)
-    subcat_members = get_category_members(subcat)
-    subcat_size = len(subcat_members)
+    subcat_size = wiki.category_size(subcat)
     log_data(
         f"Checking category {subcat} ({subcat_size})...",
         "cleanup_cat_uaa-debug.log",
@@ -145,16 +262,42 @@ def check_category(subcat: str) -> None:
         colour_print="blue",
         underline=True,
     )
-    time.sleep(0.3)
-    random.shuffle(subcat_members)
-    for user in subcat_members:
+    # Members are paged in, shuffled and checked for blocks in the
+    # background, while the edits below are being made
+    subcat_members = members if members is not None else get_category_members(subcat)
+    if journal is not None:
+        subcat_members = (
+            user for user in subcat_members if not journal.is_done(subcat, user)
+        )
+    subcat_members = pipeline.window_shuffle(pipeline.prefetch(subcat_members))
+    blocks = pipeline.prefetch(
+        block_status.iter_blocks(subcat_members, get_session()),
+        block_status.BKUSERS_LIMIT * block_status.WORKERS,
+    )
+    # Blocked users' pages are fetched and edited in batches
+    blocked_users = []
+    # Users left for a resumed run to try again
+    failed = []
+    for user, user_blocked in blocks:
+        get_uaa_log().maybe_flush()
         stats["checked_users"] += 1
+        metrics.count("checked_users")
         log_data(
             f"Checking {user} for an indef block...",
             "cleanup_cat_uaa-debug.log",
             also_print=True,
         )
-        user_blocked = check_for_block(user)
+        if isinstance(user_blocked, rate_limit.ApiError):
+            # Not recorded, so a resumed run checks them again
+            log_data(
+                f"Couldn't check {user} for blocks: {user_blocked}",
+                "cleanup_cat_uaa-debug.log",
+                also_print=True,
+                colour_print="red",
+            )
+            metrics.count("failed_users")
+            failed.append(user)
+            continue
         if user_blocked:
             log_data(
                 f"{user} is blocked indefinitely.",
@@ -162,27 +305,10 @@ def check_category(subcat: str) -> None:
                 also_print=True,
                 colour_print="green",
             )
-            remove_page_from_category(user)
-            if not defaults.DRY:
-                revision = get_page_last_edit(user)
-                if revision:
-                    revision_id = revision.revid
-                else:
-                    revision_id = False
-                log_to_wiki(make_log_message(user, subcat, revision_id))
-                log_data(
-                    f"Removed {user} from {subcat}.",
-                    "cleanup_cat_uaa-debug.log",
-                    also_print=True,
-                    colour_print="green",
-                )
-                time.sleep(1)
-                if defaults.SUPERVISED:
-                    cprint(
-                        "1 edit made, and supervised testing is enabled. Exiting.",
-                        "blue",
-                    )
-                    sys.exit()
+            blocked_users.append(user)
+            if len(blocked_users) >= wiki_pages.PROP_TITLE_MAX:
+                failed += remove_blocked_users(blocked_users, subcat)
+                blocked_users = []
         else:
             log_data(
                 f"{user} is not yet blocked indefinitely.",
@@ -190,6 +316,13 @@ def check_category(subcat: str) -> None:
                 also_print=True,
                 colour_print="yellow",
             )
+            record_outcome(subcat, user, "not blocked")
+    failed += remove_blocked_users(blocked_users, subcat)
+    # A resumed run skips finished subcategories, so only finish this one if
+    # nobody in it is left to try again
+    if journal is not None and not failed:
+        journal.finish(subcat)
+    return failed
 
 
 if __name__ == "__main__":
@@ -204,16 +337,43 @@ if __name__ == "__main__":
     )
     parser.add_argument("--shuffle", help="Shuffle subcategories", action="store_true")
     parser.add_argument("--dry", help="Don't make any edits", action="store_true")
+    parser.add_argument(
+        "--json-log", help="Write the debug log as JSON lines", action="store_true"
+    )
     parser.add_argument(
         "--supervised",
         help="Supervised testing (make 1 edit and exit)",
         action="store_true",
     )
+    parser.add_argument(
+        "--delta",
+        help="Only check users added or (un)blocked since the last --delta run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip users and categories the last run already finished",
+        action="store_true",
+    )
+    metrics.add_arguments(parser)
     args = parser.parse_args()
+    metrics.start("cleanup_cat_uaa", args.report, args.prometheus)
     defaults.DRY = args.dry
     defaults.SUPERVISED = args.supervised
+    defaults.LOG_JSON = args.json_log
 
     print("Starting UAA cleanup...")
+    # Write out queued log lines however the run ends (including Ctrl+C and
+    # the sys.exit() in supervised mode)
+    atexit.register(flush_uaa_log)
+    journal = checkpoint.Journal(
+        checkpoint.journal_path(
+            defaults.CHECKPOINT_DIR, "cleanup_cat_uaa", defaults.DRY
+        ),
+        args.resume,
+    )
+    if args.resume:
+        cprint(f"Resuming from {journal.path}.", "blue")
 
     if defaults.DRY:
         cprint("Dry run enabled. No edits will be made.", "blue")
@@ -225,12 +385,24 @@ if __name__ == "__main__":
 
     if args.cat:
         cprint(f"Only checking {args.cat}", "blue")
-        check_category(args.cat)
+        uaa_subcats = [args.cat]
     else:
         uaa_subcats = get_subcats()
         if args.shuffle:
             cprint("Shuffling subcategories...", "blue")
-            random.shuffle(uaa_subcats)
+            uaa_subcats = pipeline.window_shuffle(uaa_subcats)
+    if args.delta:
+        index = delta.DeltaIndex(defaults.DELTA_INDEX_FILE)
+        if index.since is None:
+            cprint("No earlier delta run, checking everyone.", "blue")
+        else:
+            cprint(f"Only checking changes since {index.since}.", "blue")
+        for subcat, members in delta_candidates(index, list(uaa_subcats)).items():
+            # Nothing since this run would bring them up again, so keep them
+            for user in check_category(subcat, members):
+                index.record_failure(subcat, user)
+        index.save()
+    else:
         for subcat in uaa_subcats:
             check_category(subcat)
 
@@ -5,6 +5,16 @@ commentRegex = re.compile(
     r"no longer (wokrs?|works?|employed)?.*?(WMF|Wikimedia|here|for (us|the)|at foundation)|laid(-| )?off|contract ended|off(-| )?board(ing)?",
     re.IGNORECASE,
 )
+# commentRegex's alternatives as named rules, so lock_reasons can say which
+# one matched. Each rule ends in an empty named group, so match.lastgroup
+# names it.
+lockReasonRegex = re.compile(
+    r"no longer (wokrs?|works?|employed)?.*?(WMF|Wikimedia|here|for (us|the)|at foundation)(?P<no_longer_here>)"
+    r"|laid(-| )?off(?P<laid_off>)"
+    r"|contract ended(?P<contract_ended>)"
+    r"|off(-| )?board(ing)?(?P<offboarding>)",
+    re.IGNORECASE,
+)
 fsRegex = re.compile(r"{{former( |_)?staff}}\n", re.IGNORECASE)
 categoryRegex = re.compile(
     r"\[\[Category:Wikimedia( |_)Foundation( |_)staff\]\]", re.IGNORECASE
@@ -1,15 +1,42 @@
 import common_regexes
 import defaults
+import itertools
+import json
+import metrics
+import os
+import rate_limit
 import re
-import requests
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+POOL_SIZE = 10
+SITELINKS_URL = (
+    "https://www.wikidata.org/w/rest.php/wikibase/v1/entities/items/Q7205263/sitelinks"
+)
+
+
+def make_session() -> "requests.Session":
+    """Make a pooled session for API requests"""
+    # requests is slow to import, so only load it once it's needed
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers.update(defaults.HEADERS)
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return metrics.instrument(session)
 
 
 def get_projects():
     """Get all projects with a sitelink to the staff category"""
-    response = requests.get(
-        "https://www.wikidata.org/w/rest.php/wikibase/v1/entities/items/Q7205263/sitelinks",
-        headers=defaults.HEADERS,
-    )
+    response = rate_limit.http_get(make_session(), SITELINKS_URL)
+    response.raise_for_status()
     json = response.json()
     return json
 
@@ -22,6 +49,20 @@ def get_wiki_domain_from_url(url):
     return None
 
 
+def global_username(user):
+    """Get the global username from a user page title (in any language)"""
+    if ":" in user:
+        user = user.split(":", 1)[1]
+    return user.replace("_", " ")
+
+
+def chunked(iterable, size: int):
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
 def parse_project(projects, project):
     title = projects[project]["title"]
     url = projects[project]["url"]
@@ -31,10 +72,98 @@ def parse_project(projects, project):
     return title, wiki_domain
 
 
+class ProjectDirectory:
+    """The staff category's sitelinks (Q7205263), indexed by wiki domain"""
+
+    def __init__(self, projects: dict):
+        self.projects = projects
+        self.by_domain = {}
+        for project in projects:
+            title, wiki_domain = parse_project(projects, project)
+            if wiki_domain is not None and title is not None:
+                self.by_domain[wiki_domain] = (project, title)
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def lookup(self, wiki_domain):
+        """Get (site id, category title) for a wiki domain, or None"""
+        return self.by_domain.get(wiki_domain)
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Load the directory from a file of sitelinks (or a cache file)"""
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["sitelinks"] if "fetched_at" in data else data)
+
+    @classmethod
+    def load(cls, cache_file: str = None, ttl: float = None, session=None):
+        """Load the directory, using a disk cache that expires after ttl seconds
+
+        Once the cache has expired, the sitelinks are only downloaded again
+        if their ETag has changed.
+        """
+        if cache_file is None:
+            cache_file = defaults.PROJECTS_CACHE_FILE
+        if ttl is None:
+            ttl = defaults.PROJECTS_CACHE_TTL_HOURS * 60 * 60
+        cached = None
+        if os.path.isfile(cache_file):
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            if time.time() - cached["fetched_at"] < ttl:
+                metrics.cache("projects", True)
+                return cls(cached["sitelinks"])
+
+        if session is None:
+            session = make_session()
+        headers = {}
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        response = rate_limit.http_get(session, SITELINKS_URL, headers=headers)
+        metrics.cache("projects", response.status_code == 304)
+        if response.status_code == 304:
+            sitelinks = cached["sitelinks"]
+        else:
+            response.raise_for_status()
+            sitelinks = response.json()
+        save_json(
+            cache_file,
+            {
+                "etag": response.headers.get("ETag"),
+                "fetched_at": time.time(),
+                "sitelinks": sitelinks,
+            },
+        )
+        return cls(sitelinks)
+
+
+def save_json(path: str, data) -> None:
+    """Write JSON to a file, replacing the old file only once it's written"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory() -> ProjectDirectory:
+    """Get the project directory, loading it on first use"""
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = ProjectDirectory.load()
+        return _directory
+
+
 def get_project_info_by_domain(wiki_domain):
     """Get the project info by the wiki domain"""
-    projects = get_projects()
-    for project in projects:
-        title, domain = parse_project(projects, project)
-        if domain == wiki_domain:
-            return title, domain
+    project = get_directory().lookup(wiki_domain)
+    if project is not None:
+        return project[1], wiki_domain
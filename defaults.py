@@ -8,7 +8,32 @@ EXCEPTIONS = [
 CATEGORY = "Category:Wikimedia Foundation staff"
 HEADERS = {"User-Agent": "TNTBot (https://meta.wikimedia.org/wiki/User:TNTBot)"}
 DELAY = 5
+READ_RATE = 50
+MAXLAG = 5
+TIMEOUT = 30
+RETRIES = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 120
+LOG_FLUSH_EVERY = 10
+LOG_FLUSH_INTERVAL = 600
+LOG_JSON = False
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
 SUMMARY = "([[:m:User:TNTBot#Marking_former_WMF_staff_accounts|automated]]) Marking user as former staff — many thanks, and best wishes for the future."
 DRY = False
 VIEW_DIFF = False
 SUPERVISED = False
+CACHE_TTL_HOURS = 48
+CACHE_FLUSH_EVERY = 25
+# How many looked up accounts have their lock reasons classified together
+LOCK_REASON_BATCH = 25
+PROJECTS_CACHE_FILE = "./cache/projects.json"
+PROJECTS_CACHE_TTL_HOURS = 24
+DELTA_OVERLAP = 10 * 60
+DELTA_INDEX_FILE = "./cache/uaa_delta_index.json"
+CHECKPOINT_DIR = "./cache/checkpoints"
+COOKIE_DIR = "./cache/cookies"
+COOKIE_TTL_HOURS = 12
+REPORT_DIR = "./cache/reports"
@@ -0,0 +1,170 @@
+import common_utils
+import defaults
+import json
+import os
+import pipeline
+import rate_limit
+import time
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def timestamp(seconds: float = None) -> str:
+    """Format a time as a MediaWiki timestamp (UTC)"""
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+
+def iter_log_titles(session, api: str, letype: str, since: str):
+    """Yield the title of every log entry of one type since a timestamp"""
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "list": "logevents",
+        "letype": letype,
+        "leprop": "title",
+        "ledir": "newer",
+        "lestart": since,
+        "lelimit": "max",
+    }
+    while True:
+        json = rate_limit.api_get(session, api, params)
+        if "error" in json:
+            raise rate_limit.ApiError.from_json(api, json)
+        for event in json["query"]["logevents"]:
+            if "title" in event:
+                yield event["title"]
+        if "continue" not in json:
+            return
+        params.update(json["continue"])
+
+
+def count_category_pages(session, api: str, category: str) -> int:
+    """Count a category's members that are neither files nor subcategories"""
+    json = rate_limit.api_get(
+        session,
+        api,
+        {
+            "action": "query",
+            "format": "json",
+            "formatversion": 2,
+            "prop": "categoryinfo",
+            "titles": category,
+        },
+    )
+    if "error" in json:
+        raise rate_limit.ApiError.from_json(api, json)
+    return json["query"]["pages"][0].get("categoryinfo", {}).get("pages", 0)
+
+
+class DeltaIndex:
+    """Cached category members and the time of the last run, for delta runs
+
+    Each run only lists the members added to a category since the last run,
+    and only needs the log entries since then to see who else may have
+    changed. The index is only saved once a run has finished, so an
+    interrupted run is simply repeated. Titles a run couldn't finish (e.g.
+    a failed lookup) are kept in the index, as nothing since the last run
+    would bring them up again, and handed to the next run by retries().
+    """
+
+    def __init__(self, path: str, overlap: float = None):
+        self.path = path
+        self.overlap = overlap if overlap is not None else defaults.DELTA_OVERLAP
+        self.last_run = None
+        self.categories = {}
+        # Category -> titles that failed in the last run / in this one
+        self.retry = {}
+        self.failed = {}
+        self.started = time.time()
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.last_run = data["last_run"]
+            self.categories = {
+                category: set(members)
+                for category, members in data["categories"].items()
+            }
+            self.retry = {
+                category: set(titles)
+                for category, titles in data.get("failed", {}).items()
+            }
+
+    @property
+    def since(self):
+        """When to look back to (a little before the last run), or None"""
+        if self.last_run is None:
+            return None
+        return timestamp(self.last_run - self.overlap)
+
+    def update(
+        self, session, api: str, category: str, namespaces: list[int] = None
+    ) -> set:
+        """Bring a category's members up to date, returning the new ones
+
+        Categories that haven't been seen before are listed in full, and
+        all their members count as new. Listing by timestamp can't show
+        members that left, so if the index ends up with more members than
+        the category has pages, the category is listed in full again.
+        """
+        known = self.categories.get(category)
+        if known is None:
+            members = set(
+                pipeline.iter_category_members(session, api, category, namespaces)
+            )
+            self.categories[category] = members
+            return members
+        added = set(
+            pipeline.iter_category_members(
+                session, api, category, namespaces, self.since
+            )
+        )
+        members = known | added
+        if len(members) > count_category_pages(session, api, category):
+            members = set(
+                pipeline.iter_category_members(session, api, category, namespaces)
+            )
+            added = (added | (members - known)) & members
+        self.categories[category] = members
+        return added
+
+    def members(self, category: str) -> set:
+        return self.categories.get(category, set())
+
+    def retries(self, category: str) -> set:
+        """Take the titles of a category that the last run couldn't finish
+
+        They're kept for the next run unless this run checks them again.
+        """
+        return self.retry.pop(category, set())
+
+    def record_failure(self, category: str, title: str) -> None:
+        """Record that this run couldn't finish a title, so the next run retries it"""
+        self.failed.setdefault(category, set()).add(title)
+
+    def changed_titles(self, session, api: str, letype: str) -> set:
+        """Get the titles with log entries of one type since the last run"""
+        if self.since is None:
+            return set()
+        return set(iter_log_titles(session, api, letype, self.since))
+
+    def save(self) -> None:
+        """Save the index, with this run's start as the last run"""
+        failed = {category: set(titles) for category, titles in self.retry.items()}
+        for category, titles in self.failed.items():
+            failed.setdefault(category, set()).update(titles)
+        common_utils.save_json(
+            self.path,
+            {
+                "last_run": self.started,
+                "categories": {
+                    category: sorted(members)
+                    for category, members in self.categories.items()
+                },
+                "failed": {
+                    category: sorted(titles)
+                    for category, titles in failed.items()
+                    if titles
+                },
+            },
+        )
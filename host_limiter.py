@@ -0,0 +1,49 @@
+import threading
+from contextlib import contextmanager
+
+# host -> max concurrent users of that host (None means unbounded)
+limits = {}
+default_limit = None
+_semaphores = {}
+_lock = threading.Lock()
+_held = threading.local()
+
+
+def configure(per_host: int = None, overrides: dict = None) -> None:
+    """Set the default per-host limit and any per-host overrides"""
+    global default_limit
+    with _lock:
+        default_limit = per_host
+        limits.clear()
+        limits.update(overrides or {})
+        _semaphores.clear()
+
+
+def _get_semaphore(host: str):
+    with _lock:
+        if host not in _semaphores:
+            limit = limits.get(host, default_limit)
+            _semaphores[host] = (
+                threading.BoundedSemaphore(limit) if limit is not None else None
+            )
+        return _semaphores[host]
+
+
+@contextmanager
+def slot(host: str):
+    """Hold one of the concurrency slots for a host
+
+    A thread that already holds a slot for the host doesn't take another,
+    so nested calls can't deadlock.
+    """
+    held = _held.__dict__.setdefault("hosts", set())
+    semaphore = _get_semaphore(host)
+    if semaphore is None or host in held:
+        yield
+        return
+    with semaphore:
+        held.add(host)
+        try:
+            yield
+        finally:
+            held.discard(host)
@@ -0,0 +1,213 @@
+import argparse
+import common_utils
+import defaults
+import glob
+import json
+import metrics
+import os
+import sqlite3
+import time
+
+CACHE_FILENAME = "lock_status.sqlite3"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lock_status (
+    username TEXT PRIMARY KEY,
+    locked INTEGER NOT NULL,
+    comment TEXT,
+    checked_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class LockCache:
+    """On-disk cache of global lock status, keyed by global username
+
+    Lock status is global (CentralAuth), so one store is shared by every
+    wiki. Each entry expires on its own, ttl seconds after it was checked.
+    """
+
+    def __init__(self, path: str, ttl: float = None):
+        self.path = path
+        self.ttl = ttl if ttl is not None else defaults.CACHE_TTL_HOURS * 60 * 60
+        self.is_new = not os.path.isfile(path)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, username: str, now: float = None):
+        """Get (locked, comment) for a user, or None if not cached or expired"""
+        if now is None:
+            now = time.time()
+        row = self.connection.execute(
+            "SELECT locked, comment FROM lock_status WHERE username = ? AND expires_at > ?",
+            (username, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), row[1]
+
+    def is_unlocked(self, username: str, now: float = None) -> bool:
+        """Check if a user is cached as not locked"""
+        entry = self.get(username, now)
+        return entry is not None and entry[0] is False
+
+    def unlocked_users(self, now: float = None) -> set[str]:
+        """Get every user cached as not locked"""
+        if now is None:
+            now = time.time()
+        rows = self.connection.execute(
+            "SELECT username FROM lock_status WHERE locked = 0 AND expires_at > ?",
+            (now,),
+        )
+        return {row[0] for row in rows}
+
+    def upsert_many(self, entries, now: float = None) -> None:
+        """Store many (username, locked, comment) entries in one transaction"""
+        if now is None:
+            now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lock_status VALUES (?, ?, ?, ?, ?)",
+                [
+                    (username, int(locked), comment, now, now + self.ttl)
+                    for username, locked, comment in entries
+                ],
+            )
+
+    def purge_expired(self, now: float = None) -> int:
+        """Delete expired entries, returning how many were deleted"""
+        if now is None:
+            now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM lock_status WHERE expires_at <= ?", (now,)
+            )
+        return cursor.rowcount
+
+    def count(self, now: float = None) -> int:
+        """Count the entries that haven't expired"""
+        if now is None:
+            now = time.time()
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM lock_status WHERE expires_at > ?", (now,)
+        ).fetchone()[0]
+
+    def import_json_files(self, cache_dir: str) -> int:
+        """Import the old per-wiki *_unlocked_accounts.json cache files
+
+        Entries keep the file's modification time as their checked time, and
+        never replace an entry that was checked more recently.
+        """
+        imported = 0
+        for filename in sorted(glob.glob(f"{cache_dir}/*_unlocked_accounts.json")):
+            checked_at = os.path.getmtime(filename)
+            with open(filename, "r") as f:
+                try:
+                    users = json.loads(f.read())
+                except ValueError:
+                    print(f"Skipping unreadable cache file {filename}")
+                    continue
+            with self.connection:
+                for user in users:
+                    cursor = self.connection.execute(
+                        "INSERT INTO lock_status VALUES (?, 0, NULL, ?, ?) "
+                        "ON CONFLICT(username) DO UPDATE SET "
+                        "locked = 0, comment = NULL, checked_at = excluded.checked_at, "
+                        "expires_at = excluded.expires_at "
+                        "WHERE excluded.checked_at > lock_status.checked_at",
+                        (
+                            common_utils.global_username(user),
+                            checked_at,
+                            checked_at + self.ttl,
+                        ),
+                    )
+                    imported += cursor.rowcount
+        return imported
+
+
+class RunCache:
+    """Load-once view of a LockCache for one run
+
+    The unlocked accounts are read into a set when the run starts, so
+    membership checks don't touch the disk. New results are written back
+    every flush_every accounts (and by flush() at the end), each batch in a
+    single transaction, so an interrupted run keeps what it learned.
+    """
+
+    def __init__(self, cache: LockCache, flush_every: int = None):
+        self.cache = cache
+        self.flush_every = (
+            flush_every if flush_every is not None else defaults.CACHE_FLUSH_EVERY
+        )
+        self.unlocked = cache.unlocked_users()
+        self.pending = []
+
+    def __contains__(self, username: str) -> bool:
+        hit = username in self.unlocked
+        metrics.cache("lock_status", hit)
+        return hit
+
+    def __len__(self) -> int:
+        return len(self.unlocked)
+
+    def record(self, username: str, locked: bool, comment: str = None) -> None:
+        """Record the lock status of a user"""
+        if locked:
+            self.unlocked.discard(username)
+        else:
+            self.unlocked.add(username)
+        self.pending.append((username, locked, comment))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write any recorded statuses to the cache"""
+        if self.pending:
+            self.cache.upsert_many(self.pending)
+            self.pending = []
+
+
+def open_cache(cache_dir: str) -> LockCache:
+    """Open the shared lock cache in a directory, importing old JSON caches"""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    cache = LockCache(os.path.join(cache_dir, CACHE_FILENAME))
+    if cache.is_new:
+        imported = cache.import_json_files(cache_dir)
+        if imported:
+            print(f"Imported {imported} accounts from old cache files.")
+    return cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="lock_cache.py",
+        description="Manage the shared lock status cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache directory",
+        default="./cache",
+        type=str,
+        metavar="/path/to/dir",
+    )
+    parser.add_argument(
+        "--import-json",
+        help="Import old *_unlocked_accounts.json files from the cache directory",
+        action="store_true",
+    )
+    parser.add_argument("--purge", help="Delete expired entries", action="store_true")
+    args = parser.parse_args()
+
+    cache = open_cache(args.cache_dir)
+    if args.import_json:
+        print(f"Imported {cache.import_json_files(args.cache_dir)} accounts.")
+    if args.purge:
+        print(f"Deleted {cache.purge_expired()} expired entries.")
+    print(f"{cache.count()} cached accounts in {cache.path}.")
+    cache.close()
@@ -0,0 +1,158 @@
+"""Classifies global lock comments: was the account locked for leaving?
+
+The same few lock comments come up for thousands of accounts, so verdicts
+are kept in an LRU cache keyed by the comment. A batch of comments can
+also be classified with one pass of the regex over all of them. Each
+verdict names the rule that matched (see common_regexes.lockReasonRegex),
+so the "locked for another reason" accounts can be audited.
+"""
+
+import argparse
+import common_regexes
+import metrics
+import sys
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+CACHE_SIZE = 4096
+
+
+class Verdict(namedtuple("Verdict", ["rule", "text"])):
+    """The rule that matched a comment (or None), and the text it matched"""
+
+    @property
+    def matched(self) -> bool:
+        return self.rule is not None
+
+    def explain(self) -> str:
+        if self.rule is None:
+            return "no rule matched"
+        return f"{self.rule} matched {self.text!r}"
+
+
+NO_MATCH = Verdict(None, None)
+
+
+def _verdict(match) -> Verdict:
+    return NO_MATCH if match is None else Verdict(match.lastgroup, match.group())
+
+
+class Classifier:
+    """Classifies lock comments, remembering the last size verdicts"""
+
+    def __init__(self, regex=None, size: int = CACHE_SIZE):
+        self.regex = regex or common_regexes.lockReasonRegex
+        self.size = size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _lookup(self, comment: str):
+        # Must hold self.lock
+        verdict = self.cache.get(comment)
+        if verdict is not None:
+            self.cache.move_to_end(comment)
+        return verdict
+
+    def _store(self, verdicts: dict) -> None:
+        with self.lock:
+            for comment, verdict in verdicts.items():
+                self.cache[comment] = verdict
+                self.cache.move_to_end(comment)
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+    def classify(self, comment: str) -> Verdict:
+        """Classify one comment"""
+        with self.lock:
+            verdict = self._lookup(comment)
+        metrics.cache("lock_reasons", verdict is not None)
+        if verdict is None:
+            verdict = _verdict(self.regex.search(comment))
+            self._store({comment: verdict})
+        return verdict
+
+    def classify_many(self, comments) -> dict:
+        """Classify many comments, returning a dict of comment -> Verdict
+
+        The comments that aren't cached are joined with newlines and
+        searched in one go. No rule can match across a newline, so each
+        match belongs to one comment, and the search skips to the next
+        comment as soon as one matches.
+        """
+        verdicts = {}
+        batch = []
+        with self.lock:
+            for comment in dict.fromkeys(comments):
+                verdict = self._lookup(comment)
+                if verdict is not None:
+                    verdicts[comment] = verdict
+                elif "\n" not in comment:
+                    batch.append(comment)
+                else:
+                    verdicts[comment] = None
+        hits = sum(verdict is not None for verdict in verdicts.values())
+        metrics.cache("lock_reasons", True, hits)
+        metrics.cache("lock_reasons", False, len(verdicts) - hits + len(batch))
+        new = {
+            comment: _verdict(self.regex.search(comment))
+            for comment, verdict in verdicts.items()
+            if verdict is None
+        }
+        starts = []
+        offset = 0
+        for comment in batch:
+            starts.append(offset)
+            offset += len(comment) + 1
+            new[comment] = NO_MATCH
+        text = "\n".join(batch)
+        position = 0
+        while (match := self.regex.search(text, position)) is not None:
+            index = bisect_right(starts, match.start()) - 1
+            new[batch[index]] = _verdict(match)
+            position = starts[index + 1] if index + 1 < len(starts) else len(text)
+        self._store(new)
+        verdicts.update(new)
+        return verdicts
+
+
+_classifier = Classifier()
+
+
+def classify(comment: str) -> Verdict:
+    """Classify a lock comment with the shared classifier"""
+    return _classifier.classify(comment)
+
+
+def classify_many(comments) -> dict:
+    """Classify a batch of lock comments with the shared classifier"""
+    return _classifier.classify_many(comments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="lock_reasons.py",
+        description="Show which rule (if any) matches each lock comment",
+    )
+    parser.add_argument(
+        "files",
+        help="Files of lock comments, one per line (default: stdin)",
+        nargs="*",
+        type=argparse.FileType("r"),
+    )
+    args = parser.parse_args()
+
+    comments = [
+        line.rstrip("\n")
+        for f in args.files or [sys.stdin]
+        for line in f
+        if line.strip()
+    ]
+    verdicts = classify_many(comments)
+    counts = {}
+    for comment in comments:
+        rule = verdicts[comment].rule or "(other reason)"
+        counts[rule] = counts.get(rule, 0) + 1
+        print(f"{rule}\t{comment}")
+    for rule, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"{count:>8}  {rule}", file=sys.stderr)
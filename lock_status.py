@@ -0,0 +1,96 @@
+import common_utils
+import host_limiter
+import rate_limit
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+META_HOST = "meta.wikimedia.org"
+META_API = f"https://{META_HOST}/w/api.php"
+
+
+def get_lock_info(session: "requests.Session", user: str):
+    """Get the lock status and the latest lock event of a user in one request
+
+    meta=globaluserinfo only takes a single user, and list=logevents only
+    takes a single title, so both modules are combined into one query
+    instead of one request each. Raises rate_limit.ApiError if the lookup
+    fails.
+    """
+    username = common_utils.global_username(user)
+    with host_limiter.slot(META_HOST):
+        json = rate_limit.api_get(
+            session,
+            META_API,
+            {
+                "action": "query",
+                "format": "json",
+                "formatversion": 2,
+                "meta": "globaluserinfo",
+                "guiuser": username,
+                "list": "logevents",
+                "letype": "globalauth",
+                "letitle": f"User:{username}@global",
+                "lelimit": 1,
+            },
+        )
+    if "error" in json:
+        raise rate_limit.ApiError.from_json(META_API, json)
+    lock_status = json["query"]["globaluserinfo"]
+    lock_events = json["query"]["logevents"]
+    if len(lock_events) == 0:
+        return lock_status, False  # https://w.wiki/6bLq ??
+    return lock_status, lock_events[0]
+
+
+def iter_lock_statuses(users: list[str], session: "requests.Session" = None):
+    """Get the lock status and the latest lock event for many users
+
+    Yields (user, lock status, lock event) as each user is resolved. The
+    lock event is False if there isn't one. If the lookup failed, the lock
+    status is the rate_limit.ApiError instead, which must not be taken to
+    mean the user isn't locked.
+    """
+    if session is None:
+        session = common_utils.make_session()
+    seen = set()
+    for user in users:
+        if user in seen:
+            continue
+        seen.add(user)
+        try:
+            yield (user, *get_lock_info(session, user))
+        except rate_limit.ApiError as e:
+            yield user, e, False
+
+
+def iter_known_statuses(
+    users: list[str], known: dict, session: "requests.Session" = None
+):
+    """Like iter_lock_statuses(), but using statuses that were already resolved
+
+    known is a dict of global username -> (lock status, lock event), e.g.
+    from mass_cache's cross-wiki index. Only the users missing from it are
+    looked up, after the known ones have been yielded.
+    """
+    missing = []
+    for user in dict.fromkeys(users):
+        status = known.get(common_utils.global_username(user))
+        if status is None:
+            missing.append(user)
+        else:
+            yield (user, *status)
+    yield from iter_lock_statuses(missing, session)
+
+
+def resolve_lock_statuses(users: list[str], session: "requests.Session" = None) -> dict:
+    """Get the lock status and the latest lock event for many users
+
+    Returns a dict of user -> (lock status, lock event), as yielded by
+    iter_lock_statuses().
+    """
+    return {
+        user: (user_status, lock_event)
+        for user, user_status, lock_event in iter_lock_statuses(users, session)
+    }
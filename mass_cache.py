@@ -1,19 +1,78 @@
+import argparse
 import common_utils
+import defaults
+import host_limiter
+import io
+import lock_cache
+import lock_status
+import metrics
+import sys
+import threading
+import time
+import wiki_sessions
 import wmf_staff_accounts
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
 
 
+class ThreadOutput(io.TextIOBase):
+    """Sends each worker thread's output to its own buffer
+
+    Anything written from a thread that hasn't started capturing goes
+    straight to the real stdout.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def capture(self) -> None:
+        self.local.buffer = io.StringIO()
+
+    def release(self) -> str:
+        buffer = getattr(self.local, "buffer", None)
+        self.local.buffer = None
+        return buffer.getvalue() if buffer is not None else ""
+
+    def write(self, data: str) -> int:
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(data)
+        with self.lock:
+            return self.stream.write(data)
+
+    def emit(self, data: str) -> None:
+        """Write a whole block of output without interleaving"""
+        with self.lock:
+            self.stream.write(data)
+            self.stream.flush()
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+
+
 def manually_login(project) -> bool:
+    """Throw away the saved session and log in to a project again"""
     print(f"[mass_cache] Logging in to {project}...")
-    print("TODO")
-    return False
+    try:
+        wiki_sessions.get_manager().login(project)
+    except Exception as e:
+        print(f"[mass_cache] Login failed: {e}")
+        return False
+    return True
 
 
-def do_cache(args, project) -> bool:
-    return wmf_staff_accounts.main(args, project, True, True, "./cache")
+def do_cache(args, project, staff_accounts=None, lock_statuses=None) -> bool:
+    return wmf_staff_accounts.main(
+        args, project, True, True, args.cache_dir, staff_accounts, lock_statuses
+    )
 
 
-def get_args(category):
+def get_args(category, cache_dir="./cache", resume=False, delta=False):
     # Create a fake args object to pass to wmf_staff_accounts.main()
     args = SimpleNamespace(
         yes=True,
@@ -22,36 +81,294 @@ def get_args(category):
         diff=False,
         cache_only=True,
         category=category,
+        cache_dir=cache_dir,
+        resume=resume,
+        delta=delta,
     )
     return args
 
 
-if __name__ == "__main__":
-    projects = common_utils.get_projects()
-    print(f"[mass_cache] Got {len(projects)} projects to cache...")
+def cache_project(
+    title: str,
+    wiki_domain: str,
+    cache_dir: str,
+    resume: bool = False,
+    delta: bool = False,
+    staff_accounts: list[str] = None,
+    lock_statuses: dict = None,
+) -> dict:
+    """Cache one project, returning a result row for the summary"""
+    start = time.time()
+    result = {"wiki": wiki_domain, "status": "failed", "error": ""}
+    with host_limiter.slot(wiki_domain):
+        try:
+            if do_cache(
+                get_args(title, cache_dir, resume, delta),
+                wiki_domain,
+                staff_accounts,
+                lock_statuses,
+            ):
+                result["status"] = "ok"
+            else:
+                # Try a manual login then try again, carrying on from where
+                # the first attempt got to
+                if manually_login(wiki_domain) and do_cache(
+                    get_args(title, cache_dir, True, delta),
+                    wiki_domain,
+                    staff_accounts,
+                    lock_statuses,
+                ):
+                    result["status"] = "ok"
+                else:
+                    result["error"] = "cache failed"
+        except Exception as e:
+            print(f"[mass_cache] Error: {e}")
+            result["error"] = str(e)
+    result["seconds"] = round(time.time() - start)
+    return result
 
-    # Run for each project
-    for project in projects:
-        title, wiki_domain = common_utils.parse_project(projects, project)
-        if wiki_domain is None or title is None:
-            print(f"[mass_cache] Skipping {project} due to missing data.\n\n")
-            continue
 
+def run_project(
+    output: ThreadOutput,
+    title: str,
+    wiki_domain: str,
+    cache_dir: str,
+    resume: bool = False,
+    delta: bool = False,
+    staff_accounts: list[str] = None,
+    lock_statuses: dict = None,
+):
+    """Run cache_project() in a worker, printing its output in one block"""
+    output.capture()
+    try:
         print(f"[mass_cache] Starting cache for {wiki_domain}...")
+        result = cache_project(
+            title, wiki_domain, cache_dir, resume, delta, staff_accounts, lock_statuses
+        )
+        if result["status"] == "ok":
+            print(f"[mass_cache] Done caching for {wiki_domain}.")
+        else:
+            print(f"[mass_cache] Cache failed for {wiki_domain}.")
+    finally:
+        output.emit(output.release() + "\n\n")
+    return result
+
+
+def list_project(title: str, wiki_domain: str) -> list[str]:
+    """List the staff category of one project (phase one of --two-phase)"""
+    with host_limiter.slot(wiki_domain):
+        wiki = wiki_sessions.get_wiki(wiki_domain)
+        if wmf_staff_accounts.check_category_exists(wiki, title) is False:
+            raise LookupError(f"Category {title} on {wiki_domain} does not exist")
+        return wmf_staff_accounts.get_staff_accounts(wiki, title)
+
+
+def list_projects(executor, jobs: list[tuple]) -> tuple[dict, list[dict]]:
+    """List every project's staff category, several projects at a time
+
+    Returns a dict of wiki domain -> staff accounts, and a result row for
+    each project that couldn't be listed.
+    """
+    futures = {
+        executor.submit(list_project, title, wiki_domain): wiki_domain
+        for title, wiki_domain in jobs
+    }
+    members = {}
+    failed = []
+    for future, wiki_domain in futures.items():
         try:
-            print(get_args(title))
-            result = do_cache(get_args(title), wiki_domain)
+            members[wiki_domain] = future.result()
         except Exception as e:
-            print(f"[mass_cache] Error: {e}")
-            print("[mass_cache] Continuing to next project...\n\n")
+            print(f"[mass_cache] Couldn't list {wiki_domain}: {e}")
+            failed.append({"wiki": wiki_domain, "status": "failed", "error": str(e)})
+    return members, failed
+
+
+def build_staff_index(members: dict) -> dict:
+    """Build an index of global username -> set of wikis that list the user
+
+    Accounts every wiki would skip anyway (subpages and exceptions) are
+    left out.
+    """
+    index = {}
+    for wiki_domain, users in members.items():
+        for user in users:
+            if (
+                wmf_staff_accounts.validate_user(user) is not None
+                or user in defaults.EXCEPTIONS
+            ):
+                continue
+            index.setdefault(common_utils.global_username(user), set()).add(wiki_domain)
+    return index
+
+
+def resolve_index(executor, index: dict, cache_dir: str, workers: int) -> dict:
+    """Look up the lock status of each account in the index once
+
+    Accounts cached as not locked are skipped, as each wiki's run skips
+    them too. Returns a dict of global username -> (lock status, lock
+    event), as lock_status.iter_known_statuses() takes.
+    """
+    store = lock_cache.open_cache(cache_dir)
+    try:
+        unlocked = store.unlocked_users()
+    finally:
+        store.close()
+    users = [
+        f"User:{username}" for username in sorted(index) if username not in unlocked
+    ]
+    print(
+        f"[mass_cache] Looking up {len(users)} accounts "
+        f"({len(index) - len(users)} cached as not locked)..."
+    )
+    chunks = [users[i::workers] for i in range(workers)]
+    statuses = {}
+    for chunk in executor.map(lock_status.resolve_lock_statuses, chunks):
+        for user, status in chunk.items():
+            statuses[common_utils.global_username(user)] = status
+    return statuses
+
+
+def print_summary(results: list[dict]) -> None:
+    """Print a summary table of every project"""
+    width = max([len("Wiki")] + [len(result["wiki"]) for result in results])
+    print(f"{'Wiki'.ljust(width)}  {'Status'.ljust(7)}  {'Time'.rjust(6)}  Error")
+    for result in sorted(results, key=lambda result: result["wiki"]):
+        seconds = f"{result.get('seconds', 0)}s"
+        print(
+            f"{result['wiki'].ljust(width)}  {result['status'].ljust(7)}  {seconds.rjust(6)}  {result['error']}"
+        )
+    failed = [result for result in results if result["status"] != "ok"]
+    print(f"\n[mass_cache] {len(results) - len(failed)} ok, {len(failed)} failed.")
+
+
+def run(
+    projects: dict,
+    workers: int,
+    cache_dir: str,
+    resume: bool = False,
+    delta: bool = False,
+    two_phase: bool = False,
+) -> list[dict]:
+    """Cache every project, running several wikis at once
+
+    With two_phase, every project's staff category is listed first, and
+    each global account's lock status is looked up once for all of them,
+    instead of once per wiki that lists it. The wikis then only do their
+    own work. (This doesn't combine with delta, which lists each category
+    its own way.)
+    """
+    results = []
+    jobs = []
+    for project in projects:
+        title, wiki_domain = common_utils.parse_project(projects, project)
+        if wiki_domain is None or title is None:
+            print(f"[mass_cache] Skipping {project} due to missing data.")
+            results.append(
+                {"wiki": project, "status": "skipped", "error": "missing data"}
+            )
             continue
-        if result:
-            print(f"[mass_cache] Done caching for {wiki_domain}.\n\n")
-        else:
-            # Try a manual login then try again
-            manually_login(wiki_domain)
-            result = do_cache(get_args(title), wiki_domain)
-            if result:
-                print(f"[mass_cache] Done caching for {wiki_domain}.\n\n")
-            else:
-                print(f"[mass_cache] Cache failed for {wiki_domain}.\n\n")
+        jobs.append((title, wiki_domain))
+
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            members = {}
+            statuses = None
+            if two_phase:
+                print(f"[mass_cache] Listing staff on {len(jobs)} wikis...")
+                members, failed = list_projects(executor, jobs)
+                results += failed
+                jobs = [job for job in jobs if job[1] in members]
+                index = build_staff_index(members)
+                listed = sum(len(users) for users in members.values())
+                metrics.count("staff_index:listed", listed)
+                metrics.count("staff_index:unique", len(index))
+                print(
+                    f"[mass_cache] Listed {listed} staff accounts, "
+                    f"{len(index)} unique global accounts."
+                )
+                statuses = resolve_index(executor, index, cache_dir, workers)
+            futures = [
+                executor.submit(
+                    run_project,
+                    output,
+                    title,
+                    wiki_domain,
+                    cache_dir,
+                    resume,
+                    delta,
+                    members.get(wiki_domain),
+                    statuses,
+                )
+                for title, wiki_domain in jobs
+            ]
+            results += [future.result() for future in futures]
+    finally:
+        sys.stdout = output.stream
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="mass_cache.py",
+        description="Cache unlocked staff accounts on every project",
+    )
+    parser.add_argument(
+        "--workers", help="How many wikis to run at once", default=4, type=int
+    )
+    parser.add_argument(
+        "--per-domain",
+        help="How many workers can use the same wiki at once",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--meta-limit",
+        help="How many workers can query meta.wikimedia.org at once",
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache directory",
+        default="./cache",
+        type=str,
+        metavar="/path/to/dir",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--delta",
+        help="Only check accounts added or locked since each wiki's last --delta run",
+        action="store_true",
+    )
+    mode.add_argument(
+        "--two-phase",
+        help="List every wiki first, then look up each global account only once",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip accounts each wiki's last run already finished",
+        action="store_true",
+    )
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("mass_cache", args.report, args.prometheus)
+    host_limiter.configure(
+        per_host=args.per_domain,
+        overrides={lock_status.META_HOST: args.meta_limit},
+    )
+
+    projects = common_utils.get_directory().projects
+    print(f"[mass_cache] Got {len(projects)} projects to cache...")
+    results = run(
+        projects,
+        args.workers,
+        args.cache_dir,
+        args.resume,
+        args.delta,
+        args.two_phase,
+    )
+    print_summary(results)
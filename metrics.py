@@ -0,0 +1,400 @@
+"""Run metrics: API requests, time spent sleeping, cache hit rates
+
+Sessions passed to instrument() record every response they get, keyed by
+wiki and endpoint (e.g. "query:blocks" or "edit"). Tools count their own
+events with count() and cache lookups with cache(). At the end of a run
+(see start()), everything is written as a JSON report and optionally as a
+Prometheus textfile for node_exporter.
+"""
+
+import atexit
+import defaults
+import json
+import os
+import rate_limit
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+PERCENTILES = (50, 90, 99)
+PREFIX = "tntbot"
+
+
+class Histogram:
+    """Counts of latencies per bucket, plus exact totals"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram") -> None:
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Estimate a percentile, interpolating within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = (
+                    LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+                )
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class EndpointStats:
+    """Requests, errors, bytes and latencies for one endpoint of one wiki"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = Histogram()
+
+    def add(self, seconds: float, size: int, error: bool) -> None:
+        self.requests += 1
+        self.errors += error
+        self.bytes += size
+        self.latency.add(seconds)
+
+    def merge(self, other: "EndpointStats") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.bytes += other.bytes
+        self.latency.merge(other.latency)
+
+    def summary(self) -> dict:
+        summary = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": round(self.latency.sum, 3),
+        }
+        for percent in PERCENTILES:
+            summary[f"p{percent}_ms"] = round(
+                self.latency.percentile(percent) * 1000, 1
+            )
+        summary["max_ms"] = round(self.latency.max * 1000, 1)
+        return summary
+
+
+class Metrics:
+    """Everything measured during one run"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.endpoints = {}
+        self.caches = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record_request(
+        self, wiki: str, endpoint: str, seconds: float, size: int, error: bool = False
+    ) -> None:
+        with self.lock:
+            stats = self.endpoints.get((wiki, endpoint))
+            if stats is None:
+                stats = self.endpoints[(wiki, endpoint)] = EndpointStats()
+            stats.add(seconds, size, error)
+
+    def cache(self, name: str, hit: bool, amount: int = 1) -> None:
+        with self.lock:
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += amount
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _grouped(self, key) -> dict:
+        groups = {}
+        for wiki_endpoint, stats in self.endpoints.items():
+            group = groups.setdefault(key(wiki_endpoint), EndpointStats())
+            group.merge(stats)
+        return {name: groups[name].summary() for name in sorted(groups)}
+
+    def report(self, tool: str = None) -> dict:
+        """Summarise the run so far as a dict"""
+        finished = self.clock()
+        slept = rate_limit.slept_by_wiki()
+        with self.lock:
+            total = EndpointStats()
+            for stats in self.endpoints.values():
+                total.merge(stats)
+            return {
+                "tool": tool,
+                "started": self.started,
+                "finished": finished,
+                "wall_seconds": round(finished - self.started, 3),
+                "request_seconds": round(total.latency.sum, 3),
+                "slept_seconds": round(sum(slept.values()), 3),
+                "slept_by_wiki": {
+                    wiki: round(seconds, 3) for wiki, seconds in sorted(slept.items())
+                },
+                "requests": total.summary(),
+                "by_wiki": self._grouped(lambda wiki_endpoint: wiki_endpoint[0]),
+                "by_endpoint": self._grouped(lambda wiki_endpoint: wiki_endpoint[1]),
+                "by_wiki_endpoint": [
+                    {"wiki": wiki, "endpoint": endpoint, **stats.summary()}
+                    for (wiki, endpoint), stats in sorted(self.endpoints.items())
+                ],
+                "caches": {
+                    name: {
+                        "hits": hits,
+                        "misses": misses,
+                        "hit_rate": round(hits / (hits + misses), 4),
+                    }
+                    for name, (hits, misses) in sorted(self.caches.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+def endpoint_name(request) -> str:
+    """Name the endpoint a request was for, e.g. "query:globaluserinfo+logevents" """
+    url = urlsplit(request.url)
+    script = url.path.rsplit("/", 1)[-1]
+    if script != "api.php":
+        return script or url.path
+    params = dict(parse_qsl(url.query))
+    if isinstance(request.body, (str, bytes)):
+        body = (
+            request.body.decode() if isinstance(request.body, bytes) else request.body
+        )
+        params.update(parse_qsl(body))
+    action = params.get("action", "query")
+    if action != "query":
+        return action
+    modules = [
+        module
+        for kind in ("prop", "list", "meta")
+        for module in params.get(kind, "").split("|")
+        if module
+    ]
+    return f"query:{'+'.join(modules)}" if modules else "query"
+
+
+_metrics = Metrics()
+
+
+def get() -> Metrics:
+    """Get this run's metrics"""
+    return _metrics
+
+
+def reset(clock=time.time) -> Metrics:
+    """Start measuring afresh"""
+    global _metrics
+    _metrics = Metrics(clock)
+    return _metrics
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Count something a tool did (e.g. users checked)"""
+    _metrics.count(name, amount)
+
+
+def cache(name: str, hit: bool, amount: int = 1) -> None:
+    """Count a cache lookup (or several with the same result)"""
+    _metrics.cache(name, hit, amount)
+
+
+def record_response(response, *args, **kwargs):
+    """requests response hook recording a response's size and latency"""
+    seconds = response.elapsed.total_seconds()
+    if kwargs.get("stream"):
+        # Reading a streamed body here would spoil it for the caller
+        size = int(response.headers.get("Content-Length", 0))
+    else:
+        # The body is read straight after the hooks anyway, so time it too
+        start = time.monotonic()
+        size = len(response.content)
+        seconds += time.monotonic() - start
+    _metrics.record_request(
+        urlsplit(response.url).hostname,
+        endpoint_name(response.request),
+        seconds,
+        size,
+        response.status_code >= 400,
+    )
+    return response
+
+
+def instrument(session):
+    """Make a requests session (or a pwiki client's) record its responses"""
+    hooks = session.hooks.setdefault("response", [])
+    if record_response not in hooks:
+        hooks.append(record_response)
+    return session
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{_label(value)}"' for name, value in labels.items())
+
+
+def prometheus_text(report: dict, metrics: Metrics = None) -> str:
+    """Format a run's report in the Prometheus text exposition format"""
+    metrics = metrics or _metrics
+    tool = report["tool"]
+    lines = []
+
+    def family(name: str, kind: str, help: str) -> None:
+        lines.append(f"# HELP {PREFIX}_{name} {help}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+    def sample(name: str, value, **labels) -> None:
+        lines.append(f"{PREFIX}_{name}{{{_labels(tool=tool, **labels)}}} {value}")
+
+    family("last_run_timestamp_seconds", "gauge", "When the last run finished.")
+    sample("last_run_timestamp_seconds", round(report["finished"], 3))
+    family("run_duration_seconds", "gauge", "Wall time of the last run.")
+    sample("run_duration_seconds", report["wall_seconds"])
+    family("rate_limit_sleep_seconds", "gauge", "Time spent waiting for rate limits.")
+    for wiki, seconds in report["slept_by_wiki"].items():
+        sample("rate_limit_sleep_seconds", seconds, wiki=wiki)
+    family("api_requests", "gauge", "API requests made in the last run.")
+    for row in report["by_wiki_endpoint"]:
+        sample(
+            "api_requests", row["requests"], wiki=row["wiki"], endpoint=row["endpoint"]
+        )
+    family("api_errors", "gauge", "API requests with an HTTP error status.")
+    for row in report["by_wiki_endpoint"]:
+        sample("api_errors", row["errors"], wiki=row["wiki"], endpoint=row["endpoint"])
+    family("api_response_bytes", "gauge", "Bytes received from the API.")
+    for row in report["by_wiki_endpoint"]:
+        sample(
+            "api_response_bytes",
+            row["bytes"],
+            wiki=row["wiki"],
+            endpoint=row["endpoint"],
+        )
+    family("api_request_duration_seconds", "histogram", "API request latency.")
+    with metrics.lock:
+        endpoints = sorted(metrics.endpoints.items())
+        for (wiki, endpoint), stats in endpoints:
+            cumulative = 0
+            bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+            for bound, bucket in zip(bounds, stats.latency.buckets):
+                cumulative += bucket
+                sample(
+                    "api_request_duration_seconds_bucket",
+                    cumulative,
+                    wiki=wiki,
+                    endpoint=endpoint,
+                    le=bound,
+                )
+            sample(
+                "api_request_duration_seconds_sum",
+                round(stats.latency.sum, 6),
+                wiki=wiki,
+                endpoint=endpoint,
+            )
+            sample(
+                "api_request_duration_seconds_count",
+                stats.latency.count,
+                wiki=wiki,
+                endpoint=endpoint,
+            )
+    family("cache_lookups", "gauge", "Cache lookups in the last run.")
+    for name, cache_stats in report["caches"].items():
+        sample("cache_lookups", cache_stats["hits"], cache=name, result="hit")
+        sample("cache_lookups", cache_stats["misses"], cache=name, result="miss")
+    family("events", "gauge", "Things the tool counted in the last run.")
+    for name, value in report["counters"].items():
+        sample("events", value, event=name)
+    return "\n".join(lines) + "\n"
+
+
+def write_report(path: str, tool: str) -> dict:
+    """Write the JSON run report, returning it"""
+    report = _metrics.report(tool)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    os.replace(f"{path}.tmp", path)
+    return report
+
+
+def write_prometheus(path: str, report: dict) -> None:
+    """Write a Prometheus textfile, replacing the old one in one go
+
+    node_exporter's textfile collector may read the file at any time, so it
+    mustn't ever see a half-written one.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(f"{path}.tmp", "w") as f:
+        f.write(prometheus_text(report))
+    os.replace(f"{path}.tmp", path)
+
+
+def add_arguments(parser) -> None:
+    """Add the --report and --prometheus options to a tool's argparse parser"""
+    parser.add_argument(
+        "--report", help="Where to write the JSON run report", metavar="FILE"
+    )
+    parser.add_argument(
+        "--prometheus",
+        help="Also write the run's metrics as a Prometheus textfile",
+        metavar="FILE",
+    )
+
+
+def start(tool: str, report_path: str = None, textfile: str = None) -> None:
+    """Measure this run, writing the report (and textfile) when it exits"""
+    if report_path is None:
+        report_path = os.path.join(defaults.REPORT_DIR, f"{tool}.json")
+
+    def finish():
+        report = write_report(report_path, tool)
+        if textfile:
+            write_prometheus(textfile, report)
+
+    reset()
+    atexit.register(finish)
@@ -0,0 +1,104 @@
+import queue
+import random
+import rate_limit
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+SHUFFLE_WINDOW = 500
+PREFETCH_SIZE = 1000
+_DONE = object()
+
+
+def iter_category_members(
+    session: "requests.Session",
+    api: str,
+    category: str,
+    namespaces: list[int] = None,
+    since: str = None,
+):
+    """Yield the members of a category, one continuation page at a time
+
+    If since (a MediaWiki timestamp) is given, only members added to the
+    category since then are listed.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "list": "categorymembers",
+        "cmtitle": category,
+        "cmprop": "title",
+        "cmlimit": "max",
+    }
+    if namespaces:
+        params["cmnamespace"] = "|".join(str(ns) for ns in namespaces)
+    if since is not None:
+        params.update({"cmsort": "timestamp", "cmdir": "newer", "cmstart": since})
+    while True:
+        json = rate_limit.api_get(session, api, params)
+        if "error" in json:
+            # Stopping early would look like the category had fewer members
+            raise rate_limit.ApiError.from_json(api, json)
+        for member in json["query"]["categorymembers"]:
+            yield member["title"]
+        if "continue" not in json:
+            return
+        params.update(json["continue"])
+
+
+def window_shuffle(iterable, size: int = SHUFFLE_WINDOW, rng=random):
+    """Shuffle an iterable using a bounded window instead of the whole list
+
+    Items can only move about size places, but nothing waits for the whole
+    iterable and at most size items are held at once.
+    """
+    window = []
+    for item in iterable:
+        if len(window) < size:
+            window.append(item)
+            continue
+        i = rng.randrange(size)
+        yield window[i]
+        window[i] = item
+    rng.shuffle(window)
+    yield from window
+
+
+def prefetch(iterable, size: int = PREFETCH_SIZE):
+    """Run an iterable in a background thread, up to size items ahead
+
+    Lets a slow producer (e.g. API paging) overlap with the consumer.
+    Exceptions from the producer are raised in the consumer.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+        except Exception as e:
+            items.put((_DONE, e))
+            return
+        items.put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Let a producer blocked on a full queue see that we've stopped
+        stop.set()
+        while not items.empty():
+            items.get_nowait()
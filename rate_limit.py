@@ -0,0 +1,326 @@
+import defaults
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# API error codes that mean "slow down and try again"
+LAG_ERRORS = ("maxlag", "ratelimited")
+MAX_LAG_RETRIES = 5
+# HTTP statuses that mean the server is having trouble, so try again later
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class ApiError(Exception):
+    """A wiki couldn't answer a request, so its result is unknown
+
+    This is never a negative answer (e.g. "not locked"), so nothing should
+    be cached or recorded as done because of it.
+    """
+
+    def __init__(self, host: str, code: str, info: str):
+        super().__init__(f"{host}: {info}")
+        self.host = host
+        self.code = code
+        self.info = info
+
+    @classmethod
+    def from_json(cls, api: str, json: dict) -> "ApiError":
+        """Make the error for an API response that has one"""
+        return cls(urlparse(api).hostname, json["error"]["code"], json["error"]["info"])
+
+
+class RequestFailed(ApiError):
+    """No usable response came back, even after retrying"""
+
+
+class CircuitOpen(RequestFailed):
+    """The host has been failing, so the request wasn't sent at all"""
+
+
+class Clock:
+    """The real clock"""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class TokenBucket:
+    """Allows rate actions per second, with bursts of up to burst actions"""
+
+    def __init__(self, rate: float, burst: float = 1, clock: Clock = None):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock or Clock()
+        self.tokens = burst
+        self.updated = self.clock.now()
+        self.paused_until = 0
+        self.slept = 0
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, returning how long to wait before using them"""
+        with self.lock:
+            now = self.clock.now()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.paused_until - now)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Wait until tokens are available, returning how long that took"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self.clock.sleep(wait)
+            with self.lock:
+                self.slept += wait
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Don't allow anything for the next few seconds"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock.now() + seconds)
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host after threshold failures in a row
+
+    While open, requests fail straight away. After cooldown seconds, one
+    trial request is let through: if it works the breaker closes, and if it
+    fails the breaker stays open for another cooldown.
+    """
+
+    def __init__(
+        self, threshold: int = None, cooldown: float = None, clock: Clock = None
+    ):
+        self.threshold = (
+            threshold if threshold is not None else defaults.BREAKER_THRESHOLD
+        )
+        self.cooldown = cooldown if cooldown is not None else defaults.BREAKER_COOLDOWN
+        self.clock = clock or Clock()
+        self.failures = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.threshold
+
+    def allow(self) -> bool:
+        """Check if a request may be sent now"""
+        with self.lock:
+            if not self.is_open:
+                return True
+            now = self.clock.now()
+            if now < self.open_until:
+                return False
+            # Let this one request through as a trial, and hold back the
+            # rest until it's answered
+            self.open_until = now + self.cooldown
+            return True
+
+    def success(self) -> None:
+        with self.lock:
+            self.failures = 0
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.is_open:
+                self.open_until = self.clock.now() + self.cooldown
+
+
+class RateLimiter:
+    """Separate read and write budgets for one wiki"""
+
+    def __init__(
+        self, read_rate: float = None, write_interval: float = None, clock=None
+    ):
+        self.clock = clock or Clock()
+        read_rate = read_rate if read_rate is not None else defaults.READ_RATE
+        write_interval = (
+            write_interval if write_interval is not None else defaults.DELAY
+        )
+        self.reads = TokenBucket(read_rate, read_rate, self.clock)
+        self.writes = TokenBucket(1 / write_interval, 1, self.clock)
+        self.breaker = CircuitBreaker(clock=self.clock)
+
+    def read(self) -> float:
+        """Wait for a read (lookup) to be allowed"""
+        return self.reads.acquire()
+
+    def write(self) -> float:
+        """Wait for a write (edit) to be allowed"""
+        return self.writes.acquire()
+
+    def backoff(self, seconds: float) -> None:
+        """Pause reads and writes, e.g. because the wiki is lagged"""
+        self.reads.pause(seconds)
+        self.writes.pause(seconds)
+
+    @property
+    def slept(self) -> float:
+        return self.reads.slept + self.writes.slept
+
+
+def retry_after(response):
+    """Get the seconds a response's Retry-After header asks for, or None"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, rng=random) -> float:
+    """Get how long to wait before retrying, after attempt failed tries
+
+    The delay doubles with each try, up to BACKOFF_MAX, and is jittered so
+    that workers which failed together don't all retry together.
+    """
+    delay = min(defaults.BACKOFF_MAX, defaults.BACKOFF_BASE * 2**attempt)
+    return delay * rng.uniform(0.5, 1)
+
+
+def lag_delay(response, json: dict):
+    """Get how long to wait if a response says to slow down, else None"""
+    code = json.get("error", {}).get("code") if isinstance(json, dict) else None
+    if code not in LAG_ERRORS and response.status_code not in (429, 503):
+        return None
+    if (seconds := retry_after(response)) is not None:
+        return seconds
+    if code == "maxlag":
+        return max(float(json["error"].get("lag", 0)), 1)
+    return defaults.DELAY
+
+
+_clock = Clock()
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def for_wiki(domain: str) -> RateLimiter:
+    """Get the shared rate limiter for a wiki"""
+    with _limiters_lock:
+        if domain not in _limiters:
+            _limiters[domain] = RateLimiter(clock=_clock)
+        return _limiters[domain]
+
+
+def reset(clock: Clock = None) -> None:
+    """Forget every wiki's limiter, and optionally use another clock"""
+    global _clock
+    with _limiters_lock:
+        _limiters.clear()
+        _clock = clock or Clock()
+
+
+def slept_by_wiki() -> dict:
+    """Get how long each wiki's limiter has made us wait, in seconds"""
+    with _limiters_lock:
+        return {domain: limiter.slept for domain, limiter in _limiters.items()}
+
+
+def _send(send, host: str, wait, limiter: RateLimiter):
+    """Send a request, retrying timeouts, connection errors and server errors
+
+    Raises RequestFailed once the retries run out, or CircuitOpen (without
+    sending anything) while the host's circuit breaker is open.
+    """
+    for attempt in range(defaults.RETRIES):
+        if not limiter.breaker.allow():
+            raise CircuitOpen(
+                host, "circuitopen", "Too many failures, not trying for now"
+            )
+        wait()
+        delay = None
+        try:
+            response = send()
+        except OSError as e:
+            # requests' exceptions (timeouts, connection errors) are OSErrors
+            failure = f"{type(e).__name__}: {e}"
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                limiter.breaker.success()
+                return response
+            failure = f"HTTP {response.status_code}"
+            delay = retry_after(response)
+            response.close()
+        limiter.breaker.failure()
+        if attempt + 1 == defaults.RETRIES:
+            break
+        delay = max(delay or 0, backoff_delay(attempt))
+        print(f"{host}: {failure}, retrying in {delay:.1f} seconds...")
+        limiter.backoff(delay)
+    raise RequestFailed(host, "requestfailed", failure)
+
+
+def _api_call(send, api: str, wait, limiter: RateLimiter) -> dict:
+    host = urlparse(api).hostname
+    for _ in range(MAX_LAG_RETRIES):
+        response = _send(send, host, wait, limiter)
+        try:
+            json = response.json()
+        except ValueError:
+            raise RequestFailed(
+                host, "badjson", f"HTTP {response.status_code} didn't return JSON"
+            )
+        delay = lag_delay(response, json)
+        if delay is None:
+            return json
+        print(f"{host} asked us to wait {delay} seconds...")
+        limiter.backoff(delay)
+    raise RequestFailed(
+        host, json.get("error", {}).get("code", "lagged"), "Still lagged, giving up"
+    )
+
+
+def http_get(session, url: str, limiter: RateLimiter = None, **kwargs):
+    """GET any URL within its host's read budget, retrying failures
+
+    Returns the response whatever its status, except for server errors,
+    which are retried.
+    """
+    host = urlparse(url).hostname
+    if limiter is None:
+        limiter = for_wiki(host)
+    kwargs.setdefault("timeout", defaults.TIMEOUT)
+    return _send(lambda: session.get(url, **kwargs), host, limiter.read, limiter)
+
+
+def api_get(session, api: str, params: dict, limiter: RateLimiter = None) -> dict:
+    """GET from api.php within the wiki's read budget, honouring maxlag
+
+    Raises ApiError if no usable answer comes back. API errors (other than
+    lag) are returned for the caller to handle.
+    """
+    if limiter is None:
+        limiter = for_wiki(urlparse(api).hostname)
+    params = {"maxlag": defaults.MAXLAG, **params}
+    return _api_call(
+        lambda: session.get(api, params=params, timeout=defaults.TIMEOUT),
+        api,
+        limiter.read,
+        limiter,
+    )
+
+
+def api_post(session, api: str, data: dict, limiter: RateLimiter = None) -> dict:
+    """POST to api.php within the wiki's write budget, honouring maxlag
+
+    Raises ApiError if no usable answer comes back.
+    """
+    if limiter is None:
+        limiter = for_wiki(urlparse(api).hostname)
+    data = {"maxlag": defaults.MAXLAG, **data}
+    return _api_call(
+        lambda: session.post(api, data=data, timeout=defaults.TIMEOUT),
+        api,
+        limiter.write,
+        limiter,
+    )
@@ -0,0 +1,308 @@
+"""A fake api.php for tests, which answers from in-memory data and counts requests"""
+
+import time
+
+NAMESPACES = {
+    0: "",
+    1: "Talk",
+    2: "User",
+    3: "User talk",
+    4: "Project",
+    6: "File",
+    8: "MediaWiki",
+    10: "Template",
+    14: "Category",
+}
+
+
+class FakeResponse:
+    def __init__(self, data: dict, status_code: int = 200, headers: dict = None):
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self) -> dict:
+        if isinstance(self.data, Exception):
+            raise self.data
+        return self.data
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise OSError(f"HTTP {self.status_code}")
+
+    def close(self) -> None:
+        pass
+
+
+class FakeApiSession:
+    """Stands in for a requests.Session pointed at api.php"""
+
+    def __init__(self):
+        self.requests = []
+        # Headers sent with each GET, and canned responses for non-API URLs
+        self.request_headers = []
+        self.responses = {}
+        self.headers = {}
+        self.global_users = {}
+        self.lock_events = {}
+        self.blocks = []
+        self.blocks_by_user = {}
+        self.username = "TNTBot"
+        self.rights = ["read", "edit", "bot"]
+        self.categories = {}
+        self.log = []
+        self.pages = {}
+        self.last_revid = 1000
+        self.page_size = 500
+        self.lagged_responses = 0
+
+    def add_global_user(self, user: str, locked: bool = False, comment: str = None):
+        name = user.split(":", 1)[-1]
+        info = {"home": "metawiki", "id": len(self.global_users) + 1, "name": name}
+        if locked:
+            info["locked"] = True
+        self.global_users[name] = info
+        if comment is not None:
+            self.lock_events[f"User:{name}@global"] = [
+                {
+                    "type": "globalauth",
+                    "action": "setstatus",
+                    "title": f"User:{name}@global",
+                    "comment": comment,
+                }
+            ]
+
+    def add_block(self, user: str, expiry: str = "infinity"):
+        block = {"id": len(self.blocks) + 1, "user": user, "expiry": expiry}
+        self.blocks.append(block)
+        self.blocks_by_user.setdefault(user, []).append(block)
+
+    def add_page(self, title: str, text: str):
+        self.last_revid += 1
+        revid = self.last_revid
+        self.pages[title] = {
+            "revid": revid,
+            "timestamp": time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_700_000_000 + revid)
+            ),
+            "text": text,
+        }
+        return revid
+
+    def query_pages(self, params: dict) -> dict:
+        normalized = []
+        pages = []
+        for title in params["titles"].split("|"):
+            canonical = title.replace("_", " ")
+            if canonical != title:
+                normalized.append({"from": title, "to": canonical})
+            page = self.pages.get(canonical)
+            if page is None:
+                pages.append({"title": canonical, "missing": True})
+                continue
+            revision = {
+                "revid": page["revid"],
+                "timestamp": page["timestamp"],
+                "slots": {"main": {"content": page["text"]}},
+            }
+            pages.append({"title": canonical, "revisions": [revision]})
+        return {
+            "batchcomplete": True,
+            "query": {"normalized": normalized, "pages": pages},
+        }
+
+    def edit_page(self, data: dict) -> dict:
+        page = self.pages.get(data["title"])
+        if page is None and "nocreate" in data:
+            return {
+                "error": {"code": "missingtitle", "info": "The page doesn't exist."}
+            }
+        if page is not None and page["revid"] != int(
+            data.get("baserevid", page["revid"])
+        ):
+            return {"error": {"code": "editconflict", "info": "Edit conflict."}}
+        if "text" not in data:
+            old_text = page["text"] if page is not None else ""
+            data = dict(
+                data,
+                text=data.get("prependtext", "")
+                + old_text
+                + data.get("appendtext", ""),
+            )
+        if page is not None and page["text"] == data["text"]:
+            return {
+                "edit": {"result": "Success", "title": data["title"], "nochange": True}
+            }
+        old_revid = page["revid"] if page is not None else 0
+        revid = self.add_page(data["title"], data["text"])
+        return {
+            "edit": {
+                "result": "Success",
+                "title": data["title"],
+                "oldrevid": old_revid,
+                "newrevid": revid,
+            }
+        }
+
+    def lagged(self):
+        """Answer with a maxlag error if lagged_responses says to"""
+        if self.lagged_responses <= 0:
+            return None
+        self.lagged_responses -= 1
+        return FakeResponse(
+            {
+                "error": {
+                    "code": "maxlag",
+                    "info": "Waiting for a database server",
+                    "lag": 3,
+                }
+            },
+            headers={"Retry-After": "5"},
+        )
+
+    def list_blocks(self, params: dict) -> dict:
+        bkusers = params["bkusers"]
+        if bkusers.startswith("\x1f"):
+            users = bkusers[1:].split("\x1f")
+        else:
+            users = bkusers.split("|")
+        if any("#" in user or "<" in user for user in users):
+            return {"error": {"code": "baduser_bkusers", "info": "Bad username"}}
+        blocks = [
+            block
+            for user in users
+            for block in self.blocks_by_user.get(user, [])
+            if params.get("bkshow") != "!temp" or block["expiry"] == "infinity"
+        ]
+        offset = int(params.get("bkcontinue", 0))
+        page = blocks[offset : offset + self.page_size]  # noqa: E203
+        data = {"query": {"blocks": page}}
+        if offset + self.page_size < len(blocks):
+            data["continue"] = {"bkcontinue": str(offset + self.page_size)}
+        return data
+
+    def list_category_members(self, params: dict) -> dict:
+        members = self.categories.get(params["cmtitle"], [])
+        if "cmstart" in params:
+            members = [
+                member
+                for member in members
+                if member.get("timestamp", "2001-01-15T00:00:00Z") >= params["cmstart"]
+            ]
+        if "cmnamespace" in params:
+            namespaces = {int(ns) for ns in params["cmnamespace"].split("|")}
+            members = [member for member in members if member["ns"] in namespaces]
+        offset = int(params.get("cmcontinue", 0))
+        page = members[offset : offset + self.page_size]  # noqa: E203
+        data = {"query": {"categorymembers": page}}
+        if offset + self.page_size < len(members):
+            data["continue"] = {"cmcontinue": str(offset + self.page_size)}
+        return data
+
+    def query(self, params: dict) -> dict:
+        if params.get("prop") == "revisions":
+            return self.query_pages(params)
+        if params.get("list") == "blocks":
+            return self.list_blocks(params)
+        if params.get("list") == "logevents" and "lestart" in params:
+            events = [
+                event
+                for event in self.log
+                if event["type"] == params["letype"]
+                and event["timestamp"] >= params["lestart"]
+            ]
+            return {"query": {"logevents": events}}
+        if params.get("list") == "categorymembers":
+            return self.list_category_members(params)
+        query = {}
+        meta = params.get("meta", "").split("|")
+        if "globaluserinfo" in meta:
+            user = params["guiuser"]
+            query["globaluserinfo"] = self.global_users.get(user, {"missing": True})
+        if "tokens" in meta:
+            query["tokens"] = {"logintoken": "login+\\", "csrftoken": "csrf+\\"}
+        if "userinfo" in meta:
+            query["userinfo"] = {
+                "id": 1,
+                "name": self.username,
+                "rights": self.rights,
+            }
+        if "siteinfo" in meta:
+            query["namespaces"] = {
+                str(ns): {"id": ns, "name": name, "canonical": name}
+                for ns, name in NAMESPACES.items()
+            }
+            query["namespacealiases"] = [{"id": 6, "alias": "Image"}]
+        if params.get("list") == "users":
+            query["users"] = [
+                {"name": name, "groups": self.rights, "rights": self.rights}
+                for name in params["ususers"].split("|")
+            ]
+        if params.get("prop") == "categoryinfo":
+            query["pages"] = [
+                {
+                    "title": title,
+                    "categoryinfo": {
+                        "size": len(self.categories.get(title, [])),
+                        "pages": sum(
+                            member.get("ns") not in (6, 14)
+                            for member in self.categories.get(title, [])
+                        ),
+                    },
+                }
+                for title in params["titles"].split("|")
+            ]
+        if params.get("prop") == "pageprops":
+            query["pages"] = [
+                (
+                    {"title": title}
+                    if title in self.pages
+                    else {"title": title, "missing": True}
+                )
+                for title in params["titles"].split("|")
+            ]
+        if params.get("list") == "logevents":
+            events = self.lock_events.get(params.get("letitle"), [])
+            query["logevents"] = events[: int(params.get("lelimit", 10))]
+        return {"batchcomplete": True, "query": query}
+
+    def respond(self, params: dict) -> dict:
+        """Answer any api.php request"""
+        action = params.get("action", "query")
+        if action == "query":
+            return self.query(params)
+        if action == "edit":
+            return self.edit_page(params)
+        if action == "login":
+            return {"login": {"result": "Success", "lgusername": self.username}}
+        if action == "purge":
+            return {
+                "batchcomplete": True,
+                "purge": [
+                    {"title": title, "purged": True}
+                    for title in params["titles"].split("|")
+                ],
+            }
+        if action == "parse":
+            page = self.pages.get(params.get("page"))
+            if page is None:
+                return {"error": {"code": "missingtitle", "info": "Missing page"}}
+            return {"parse": {"title": params["page"], "text": page["text"]}}
+        return {"error": {"code": "badvalue", "info": f"Unknown action {action}"}}
+
+    def get(self, url: str, params: dict = None, **kwargs) -> FakeResponse:
+        params = params or {}
+        self.requests.append((url, params))
+        self.request_headers.append(kwargs.get("headers") or {})
+        if url in self.responses:
+            return self.responses[url]
+        if (lagged := self.lagged()) is not None:
+            return lagged
+        return FakeResponse(self.respond(params))
+
+    def post(self, url: str, data: dict = None, **kwargs) -> FakeResponse:
+        data = data or {}
+        self.requests.append((url, data))
+        if (lagged := self.lagged()) is not None:
+            return lagged
+        return FakeResponse(self.respond(data))
@@ -0,0 +1,14 @@
+"""A fake clock for rate limiter tests, where sleeping is instant"""
+
+
+class FakeClock:
+    def __init__(self, start: float = 1000):
+        self.time = start
+        self.sleeps = []
+
+    def now(self) -> float:
+        return self.time
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.time += seconds
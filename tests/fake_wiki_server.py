@@ -0,0 +1,202 @@
+"""A local stand-in for Wikimedia wikis, served over HTTP
+
+Each wiki's data is a FakeApiSession. Requests for
+http://127.0.0.1:<port>/<domain>/w/api.php (and index.php?action=raw) are
+answered from that wiki's data, after an optional delay to act like a real
+network. Sessions from session() send https://<domain>/... requests here.
+"""
+
+import json
+import random
+import requests
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+from tests.fake_api import FakeApiSession
+from urllib.parse import parse_qsl, urlsplit
+
+LOCK_COMMENTS = ["No longer works at WMF", "Contract ended", "Long-term abuse"]
+
+
+class RewriteAdapter(HTTPAdapter):
+    """Sends https://<domain>/<path> requests to the fake server instead"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = f"{self.base_url}/{url.netloc}{url.path}?{url.query}"
+        return super().send(request, **kwargs)
+
+
+class FakeWikiServer:
+    """A threaded HTTP server answering for any number of fake wikis"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.wikis = {}
+        self.request_count = 0
+        self.requests_by_wiki = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = None
+
+    def wiki(self, domain: str) -> FakeApiSession:
+        """Get a wiki's data, making it if it's new"""
+        with self.lock:
+            return self.wikis.setdefault(domain, FakeApiSession())
+
+    def api(self, domain: str) -> str:
+        return f"{self.base_url}/{domain}/w/api.php"
+
+    def session(self) -> requests.Session:
+        """Make a session whose https:// requests go to this server"""
+        session = requests.Session()
+        adapter = RewriteAdapter(self.base_url, pool_connections=50, pool_maxsize=50)
+        session.mount("https://", adapter)
+        return session
+
+    def start(self) -> "FakeWikiServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeWikiServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def handle(self, path: str, params: dict, post: bool) -> tuple:
+        """Answer one request, returning (status, content type, body)"""
+        domain, _, script = path.lstrip("/").partition("/")
+        with self.lock:
+            self.request_count += 1
+            self.requests_by_wiki[domain] = self.requests_by_wiki.get(domain, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        wiki = self.wiki(domain)
+        if script == "w/index.php" and params.get("action") == "raw":
+            page = wiki.pages.get(params.get("title"))
+            if page is None:
+                return 404, "text/plain", ""
+            return 200, "text/x-wiki", page["text"]
+        if script != "w/api.php":
+            return 404, "text/plain", ""
+        response = wiki.post(path, params) if post else wiki.get(path, params)
+        return response.status_code, "application/json", json.dumps(response.data)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, so don't let them
+            # wait on each other
+            disable_nagle_algorithm = True
+
+            def _reply(self, path: str, params: dict, post: bool) -> None:
+                status, content_type, body = server.handle(path, params, post)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                self._reply(url.path, dict(parse_qsl(url.query)), False)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode("utf-8")
+                params = dict(parse_qsl(urlsplit(self.path).query))
+                params.update(parse_qsl(body))
+                self._reply(urlsplit(self.path).path, params, True)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def seed_staff(
+    server: FakeWikiServer,
+    domain: str,
+    category: str,
+    users: int,
+    locked: float = 0.1,
+    seed: int = 1,
+) -> list[str]:
+    """Fill a wiki's staff category (and meta's lock data) with users"""
+    rng = random.Random(seed)
+    wiki = server.wiki(domain)
+    meta = server.wiki("meta.wikimedia.org")
+    wiki.add_page(category, "")
+    members = wiki.categories.setdefault(category, [])
+    titles = []
+    for i in range(users):
+        title = f"User:Staff {seed}-{i}"
+        titles.append(title)
+        members.append({"ns": 2, "title": title})
+        if rng.random() < locked:
+            meta.add_global_user(title, True, rng.choice(LOCK_COMMENTS))
+            wiki.add_page(
+                title,
+                "{{former staff}}\n{{user info\n| former = yes\n}}\n"
+                "[[Category:Wikimedia Foundation staff]]",
+            )
+        else:
+            meta.add_global_user(title)
+    return titles
+
+
+def seed_uaa(
+    server: FakeWikiServer,
+    category: str,
+    users: int,
+    blocked: float = 0.3,
+    seed: int = 1,
+) -> list[str]:
+    """Fill an enwiki UAA subcategory with users' talk pages"""
+    rng = random.Random(seed)
+    wiki = server.wiki("en.wikipedia.org")
+    wiki.add_page(category, "")
+    members = wiki.categories.setdefault(category, [])
+    titles = []
+    for i in range(users):
+        title = f"User talk:Username {seed}-{i}"
+        titles.append(title)
+        members.append({"ns": 3, "title": title})
+        wiki.add_page(
+            title,
+            "Hello\n<!-- THE FOLLOWING CATEGORY IS ADDED BY THE TEMPLATE -->"
+            f"[[{category}]]<!-- Template:Uw-username -->\n",
+        )
+        if rng.random() < blocked:
+            wiki.add_block(title.split(":", 1)[1])
+    return titles
+
+
+def seed_bad_images(
+    server: FakeWikiServer, sites: list[str], files: int, seed: int = 1
+) -> None:
+    """Give each site a bad image list drawn from a shared pool of files"""
+    rng = random.Random(seed)
+    pool = [f"Bad file {i}.jpg" for i in range(files)]
+    for site in sites:
+        lines = [
+            f"* [[:File:{file}]] except on [[Article {rng.randrange(1000)}]]"
+            for file in rng.sample(pool, rng.randrange(files // 2, files))
+        ]
+        server.wiki(site).add_page("MediaWiki:Bad image list", "\n".join(lines))
@@ -0,0 +1,129 @@
+import bad_image_bot
+import io
+import json
+from tests.fake_api import FakeApiSession
+
+RESULTS = {
+    "en.wikipedia.org": [["Bad.jpg", ["Some article"]], ["Worse.png", []]],
+    "de.wikipedia.org": [["Bad.jpg", []]],
+    "broken.wikipedia.org": None,
+}
+
+
+def test_build_index():
+    index = bad_image_bot.build_index(RESULTS)
+    assert index == {
+        "Bad.jpg": {"en.wikipedia.org", "de.wikipedia.org"},
+        "Worse.png": {"en.wikipedia.org"},
+    }
+
+
+def test_write_json():
+    output = io.StringIO()
+    bad_image_bot.write_json(bad_image_bot.build_index(RESULTS), RESULTS, output)
+    data = json.loads(output.getvalue())
+    assert data["sites"] == 3
+    assert data["failed_sites"] == ["broken.wikipedia.org"]
+    assert data["files"]["Bad.jpg"] == ["de.wikipedia.org", "en.wikipedia.org"]
+    assert data["exceptions"] == {"Bad.jpg": {"en.wikipedia.org": ["Some article"]}}
+
+
+def test_sync_only_refetches_changed_lists(monkeypatch):
+    revids = {"en.wikipedia.org": 5}
+    fetched = []
+
+    def fake_get_bad_images(session, site):
+        fetched.append(site)
+        return [["Bad.jpg", []]]
+
+    monkeypatch.setattr(
+        bad_image_bot, "get_revision_id", lambda session, site: revids[site]
+    )
+    monkeypatch.setattr(bad_image_bot, "get_bad_images", fake_get_bad_images)
+    state = {}
+    assert bad_image_bot.sync_bad_images(None, "en.wikipedia.org", state) == [
+        ["Bad.jpg", []]
+    ]
+    bad_image_bot.sync_bad_images(None, "en.wikipedia.org", state)
+    assert fetched == ["en.wikipedia.org"]
+    revids["en.wikipedia.org"] = 6
+    bad_image_bot.sync_bad_images(None, "en.wikipedia.org", state)
+    assert fetched == ["en.wikipedia.org", "en.wikipedia.org"]
+    assert state["en.wikipedia.org"]["revid"] == 6
+
+
+def test_fetch_all_fetches_each_site_once(monkeypatch):
+    calls = []
+    lists = {
+        "a.example.org": [["Bad.jpg", ["Page"]]],
+        "b.example.org": [],
+        "c.example.org": None,
+    }
+
+    def fake_get_bad_images(session, site):
+        calls.append(site)
+        if site == "d.example.org":
+            raise OSError("connection reset")
+        return lists[site]
+
+    monkeypatch.setattr(bad_image_bot, "get_bad_images", fake_get_bad_images)
+    sites = sorted(lists) + ["d.example.org"]
+    results = bad_image_bot.fetch_all(sites, session=object(), workers=2)
+    assert sorted(calls) == sites
+    assert results == {**lists, "d.example.org": None}
+
+
+def test_write_csv():
+    output = io.StringIO()
+    bad_image_bot.write_csv(bad_image_bot.build_index(RESULTS), RESULTS, output)
+    assert output.getvalue().splitlines() == [
+        "file,wiki_count,wikis",
+        "Bad.jpg,2,de.wikipedia.org en.wikipedia.org",
+        "Worse.png,1,en.wikipedia.org",
+    ]
+
+
+def revision_session(pages: list, error: dict = None) -> FakeApiSession:
+    session = FakeApiSession()
+    session.respond = lambda params: (
+        {"error": error} if error else {"query": {"pages": pages}}
+    )
+    return session
+
+
+def test_get_revision_id(capsys):
+    session = revision_session(
+        [{"title": "MediaWiki:Bad image list", "revisions": [{"revid": 42}]}]
+    )
+    assert bad_image_bot.get_revision_id(session, "a.example.org") == 42
+    assert session.requests[0][1]["prop"] == "revisions"
+    session = revision_session([{"title": "MediaWiki:Bad image list", "missing": True}])
+    assert bad_image_bot.get_revision_id(session, "a.example.org") == 0
+    session = revision_session([], {"code": "readapidenied", "info": "No reading"})
+    assert bad_image_bot.get_revision_id(session, "a.example.org") is None
+    assert "No reading" in capsys.readouterr().err
+
+
+def test_sync_skips_missing_and_unreadable_lists(monkeypatch):
+    revids = {"gone.example.org": 0, "down.example.org": None}
+
+    def fake_get_bad_images(session, site):
+        raise AssertionError(f"{site} shouldn't be fetched")
+
+    monkeypatch.setattr(
+        bad_image_bot, "get_revision_id", lambda session, site: revids[site]
+    )
+    monkeypatch.setattr(bad_image_bot, "get_bad_images", fake_get_bad_images)
+    state = {"down.example.org": {"revid": 3, "entries": [["Old.jpg", []]]}}
+    assert bad_image_bot.sync_bad_images(None, "gone.example.org", state) == []
+    assert state["gone.example.org"] == {"revid": 0, "entries": []}
+    assert bad_image_bot.sync_bad_images(None, "down.example.org", state) is None
+    assert state["down.example.org"]["revid"] == 3
+
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state" / "bad_images.json")
+    assert bad_image_bot.load_state(path) == {}
+    state = {"a.example.org": {"revid": 7, "entries": [["Bad.jpg", ["Page"]]]}}
+    bad_image_bot.save_state(path, state)
+    assert bad_image_bot.load_state(path) == state
@@ -0,0 +1,59 @@
+import bad_image_parser
+import pytest
+
+EXAMPLE = """The following is a list of images that may not be used inline.
+
+* [[:File:Bad_image.jpg]] except on [[Some article]], [[Another article|label]]
+* [[:Image:no exceptions.png]]
+*[[File:Tight  spacing.svg]] [[Talk:Page]]
+* [[:File:Bad image.jpg]] listed twice
+  * [[:File:Indented.jpg]]
+Some text that links [[:File:Not a list item.jpg]]
+* [[Not a file]]
+* [[:Category:Not a file.jpg]] [[Some article]]
+* [[:Datei:Local name.jpg]]
+* [[:  image :Spaced namespace.jpg]]
+* just text
+"""
+
+
+def test_parse_example():
+    assert list(bad_image_parser.parse_lines(EXAMPLE.splitlines())) == [
+        ("Bad image.jpg", ["Some article", "Another article"]),
+        ("No exceptions.png", []),
+        ("Tight spacing.svg", ["Talk:Page"]),
+        ("Bad image.jpg", []),
+        ("Spaced namespace.jpg", []),
+    ]
+
+
+def test_local_file_namespace_names():
+    file_namespaces = bad_image_parser.file_namespace_names(["Datei", "Bild"])
+    entries = bad_image_parser.parse_lines(EXAMPLE.splitlines(), file_namespaces)
+    files = [entry.file for entry in entries]
+    assert files[-2:] == ["Local name.jpg", "Spaced namespace.jpg"]
+    entry = bad_image_parser.parse_line("* [[datei:X.jpg]]", file_namespaces)
+    assert entry == ("X.jpg", [])
+    assert bad_image_parser.parse_line("* [[Datei:X.jpg]]") is None
+
+
+@pytest.mark.parametrize(
+    "line",
+    ["", "no star [[:File:A.jpg]]", "* [[No colon.jpg]]", "* [[:File:No dot]]", "*"],
+)
+def test_parse_line_ignores_non_entries(line):
+    assert bad_image_parser.parse_line(line) is None
+
+
+def test_parse_lines_streams():
+    lines = iter(["* [[:File:A.jpg]]", "* [[:File:B.jpg]]"])
+    entries = bad_image_parser.parse_lines(lines)
+    assert next(entries).file == "A.jpg"
+    assert next(lines) == "* [[:File:B.jpg]]"
+
+
+def test_normalize_title():
+    assert (
+        bad_image_parser.normalize_title(" some__file name.jpg ")
+        == "Some file name.jpg"
+    )
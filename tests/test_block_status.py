@@ -0,0 +1,84 @@
+import block_status
+import rate_limit
+from tests.fake_api import FakeApiSession, FakeResponse
+
+
+def make_api():
+    api = FakeApiSession()
+    api.add_block("Spammer")
+    api.add_block("Ünïcödé name")
+    api.add_block("Temporary", expiry="2030-01-01T00:00:00Z")
+    api.add_block("Twice")
+    api.add_block("Twice", expiry="2030-01-01T00:00:00Z")
+    api.add_block("Twice")
+    return api
+
+
+def test_join_values():
+    assert block_status.join_values(["A", "B"]) == "A|B"
+    assert block_status.join_values(["A|B", "C"]) == "\x1fA|B\x1fC"
+
+
+def test_normalize_username():
+    assert block_status.normalize_username("User talk:some_user") == "Some user"
+    assert block_status.normalize_username("ünïcödé name") == "Ünïcödé name"
+
+
+def test_resolve_blocks_batches_users():
+    api = make_api()
+    users = [f"User talk:Clean {i}" for i in range(120)] + [
+        "User talk:Spammer",
+        "User talk:ünïcödé_name",
+        "User talk:Temporary",
+        "User talk:Twice",
+    ]
+    blocks = block_status.resolve_blocks(users, api, workers=2)
+    assert len(api.requests) == 3
+    assert blocks["User talk:Spammer"] is True
+    assert blocks["User talk:ünïcödé_name"] is True
+    assert blocks["User talk:Temporary"] is False
+    assert blocks["User talk:Twice"] is True
+    assert blocks["User talk:Clean 0"] is False
+    assert len(blocks) == len(users)
+
+
+def test_resolve_blocks_follows_continuation():
+    api = make_api()
+    api.page_size = 1
+    blocks = block_status.resolve_blocks(
+        ["User talk:Spammer", "User talk:Twice", "User talk:Nobody"], api
+    )
+    assert blocks == {
+        "User talk:Spammer": True,
+        "User talk:Twice": True,
+        "User talk:Nobody": False,
+    }
+    assert len(api.requests) == 3
+
+
+def test_resolve_blocks_with_pipe_in_name():
+    api = make_api()
+    api.add_block("Odd|name")
+    blocks = block_status.resolve_blocks(
+        ["User talk:Odd|name", "User talk:Spammer"], api
+    )
+    assert blocks == {"User talk:Odd|name": True, "User talk:Spammer": True}
+    assert api.requests[0][1]["bkusers"].startswith("\x1f")
+
+
+def test_resolve_blocks_falls_back_on_bad_username():
+    api = make_api()
+    blocks = block_status.resolve_blocks(
+        ["User talk:Spammer", "User talk:Bad#name"], api
+    )
+    assert blocks == {"User talk:Spammer": True, "User talk:Bad#name": False}
+    assert len(api.requests) == 3
+
+
+def test_failed_batch_is_an_error_not_unblocked():
+    class ErrorSession:
+        def get(self, url, params=None, **kwargs):
+            return FakeResponse({"error": {"code": "internal", "info": "Oops"}})
+
+    blocks = block_status.resolve_blocks(["Spammer", "Other"], ErrorSession())
+    assert all(isinstance(error, rate_limit.ApiError) for error in blocks.values())
@@ -0,0 +1,50 @@
+import bot_logging
+import io
+import json
+
+
+def test_writes_text_and_terminal(tmp_path):
+    filename = str(tmp_path / "debug.log")
+    stream = io.StringIO()
+    logger = bot_logging.get_logger(filename, json_lines=False, stream=stream)
+    logger.info("to both", extra={"to_terminal": True})
+    logger.info("file only", extra={"to_terminal": False})
+    logger.info("terminal only", extra={"to_file": False, "to_terminal": True})
+    bot_logging.close(filename)
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    assert [line.split(": ", 1)[1] for line in lines] == ["to both", "file only"]
+    assert "to both" in stream.getvalue()
+    assert "terminal only" in stream.getvalue()
+    assert "file only" not in stream.getvalue()
+
+
+def test_json_lines(tmp_path):
+    filename = str(tmp_path / "debug.jsonl")
+    logger = bot_logging.get_logger(filename, json_lines=True, stream=io.StringIO())
+    logger.info("checking User talk:Example", extra={"to_terminal": False})
+    bot_logging.close(filename)
+    with open(filename) as f:
+        record = json.loads(f.readline())
+    assert record["message"] == "checking User talk:Example"
+    assert record["level"] == "INFO"
+
+
+def test_rotates_by_size(tmp_path):
+    filename = str(tmp_path / "debug.log")
+    logger = bot_logging.get_logger(
+        filename, max_bytes=200, backup_count=2, stream=io.StringIO()
+    )
+    for i in range(50):
+        logger.info(f"line {i}", extra={"to_terminal": False})
+    bot_logging.close(filename)
+    assert (tmp_path / "debug.log.1").exists()
+    assert not (tmp_path / "debug.log.3").exists()
+
+
+def test_no_file_without_file_records(tmp_path):
+    filename = str(tmp_path / "debug.log")
+    logger = bot_logging.get_logger(filename, stream=io.StringIO())
+    logger.info("terminal only", extra={"to_file": False, "to_terminal": True})
+    bot_logging.close(filename)
+    assert not (tmp_path / "debug.log").exists()
@@ -0,0 +1,56 @@
+import checkpoint
+
+
+def test_resume_skips_recorded_titles(tmp_path):
+    path = str(tmp_path / "checkpoints" / "run.jsonl")
+    journal = checkpoint.Journal(path)
+    journal.record("Category:A", "User talk:One", "removed")
+    journal.record("Category:B", "User talk:Two", "not blocked")
+    journal.finish("Category:B")
+    journal.close()
+
+    journal = checkpoint.Journal(path, resume=True)
+    assert journal.is_done("Category:A", "User talk:One")
+    assert journal.outcome("Category:A", "User talk:One") == "removed"
+    assert not journal.is_done("Category:A", "User talk:Two")
+    assert not journal.is_finished("Category:A")
+    assert journal.is_finished("Category:B")
+    journal.record("Category:A", "User talk:Three", "removed")
+    journal.close()
+    assert len(open(path).readlines()) == 4
+
+
+def test_without_resume_starts_afresh(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = checkpoint.Journal(path)
+    journal.record("Category:A", "User talk:One", "removed")
+    journal.close()
+    journal = checkpoint.Journal(path)
+    assert not journal.is_done("Category:A", "User talk:One")
+    journal.close()
+    assert open(path).read() == ""
+
+
+def test_cut_off_last_line_is_ignored(tmp_path):
+    path = tmp_path / "run.jsonl"
+    journal = checkpoint.Journal(str(path))
+    journal.record("Category:A", "User talk:One", "removed")
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"scope": "Category:A", "title": "User talk:Tw')
+    journal = checkpoint.Journal(str(path), resume=True)
+    assert journal.is_done("Category:A", "User talk:One")
+    assert not journal.is_done("Category:A", "User talk:Two")
+
+
+def test_each_mode_has_its_own_journal(tmp_path):
+    paths = {
+        checkpoint.journal_path(str(tmp_path), "run"),
+        checkpoint.journal_path(str(tmp_path), "run", dry=True),
+        checkpoint.journal_path(str(tmp_path), "run", dry=True, cache_only=True),
+    }
+    assert paths == {
+        str(tmp_path / "run.jsonl"),
+        str(tmp_path / "run-dry.jsonl"),
+        str(tmp_path / "run-cache-only.jsonl"),
+    }
@@ -0,0 +1,114 @@
+import checkpoint
+import cleanup_cat_uaa
+import defaults
+import pytest
+import rate_limit
+from tests.fake_api import FakeApiSession
+from tests.fake_clock import FakeClock
+from types import SimpleNamespace
+
+TALK_PAGE = (
+    "Hello\n<!-- THE FOLLOWING CATEGORY IS ADDED BY THE TEMPLATE -->"
+    "[[Category:Wikipedia usernames with possible policy issues]]"
+    "<!-- Template:Uw-username -->\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def fake_clock():
+    rate_limit.reset(FakeClock())
+    yield
+    rate_limit.reset()
+
+
+def test_make_log_message():
+    message = cleanup_cat_uaa.make_log_message("User talk:Spam", "Category:UAA", 123)
+    assert "Removed ([[Special:Diff/123|diff]]) {{noping|Spam}}" in message
+    message = cleanup_cat_uaa.make_log_message("User talk:Spam", "Category:UAA", None)
+    assert "diff" not in message
+
+
+def test_remove_blocked_users_logs_saved_revision(monkeypatch):
+    session = FakeApiSession()
+    session.add_page("User talk:Spam", TALK_PAGE)
+    session.add_page("User talk:Already done", "Hello\n")
+    wiki = SimpleNamespace(
+        client=session,
+        endpoint="https://en.wikipedia.org/w/api.php",
+        domain="en.wikipedia.org",
+        csrf_token="token+\\",
+        is_bot=True,
+    )
+    logged = []
+    monkeypatch.setattr(cleanup_cat_uaa, "get_wiki", lambda: wiki)
+    monkeypatch.setattr(cleanup_cat_uaa, "log_data", lambda *args, **kwargs: None)
+    monkeypatch.setattr(cleanup_cat_uaa, "log_to_wiki", logged.append)
+    monkeypatch.setattr(defaults, "DRY", False)
+    monkeypatch.setattr(defaults, "SUPERVISED", False)
+
+    failed = cleanup_cat_uaa.remove_blocked_users(
+        ["User talk:Spam", "User talk:Already done", "User talk:Gone"], "Category:UAA"
+    )
+    assert failed == []
+    revid = session.pages["User talk:Spam"]["revid"]
+    assert "[[Category:" not in session.pages["User talk:Spam"]["text"]
+    assert len(logged) == 1
+    assert f"[[Special:Diff/{revid}|diff]]" in logged[0]
+    # One query for the pages, then only the edit that changes something
+    assert len(session.requests) == 2
+
+
+def test_check_category_resumes(monkeypatch, tmp_path):
+    session = FakeApiSession()
+    session.categories["Category:UAA"] = [
+        {"ns": 3, "title": f"User talk:User {i}"} for i in range(5)
+    ]
+    wiki = SimpleNamespace(purge=lambda title: True, category_size=lambda title: 5)
+    journal = checkpoint.Journal(str(tmp_path / "run.jsonl"))
+    journal.record("Category:UAA", "User talk:User 0", "not blocked")
+    journal.record("Category:UAA", "User talk:User 1", "removed")
+    monkeypatch.setattr(cleanup_cat_uaa, "get_wiki", lambda: wiki)
+    monkeypatch.setattr(cleanup_cat_uaa, "get_session", lambda: session)
+    monkeypatch.setattr(cleanup_cat_uaa, "log_data", lambda *args, **kwargs: None)
+    monkeypatch.setattr(cleanup_cat_uaa, "journal", journal)
+
+    cleanup_cat_uaa.check_category("Category:UAA")
+    checked = [
+        params["bkusers"] for url, params in session.requests if "bkusers" in params
+    ]
+    assert "User 0" not in " ".join(checked)
+    assert "User 1" not in " ".join(checked)
+    assert journal.outcome("Category:UAA", "User talk:User 4") == "not blocked"
+    assert journal.is_finished("Category:UAA")
+
+    session.requests.clear()
+    cleanup_cat_uaa.check_category("Category:UAA")
+    assert session.requests == []
+
+
+def test_check_category_not_finished_after_failures(monkeypatch, tmp_path):
+    session = FakeApiSession()
+    session.categories["Category:UAA"] = [
+        {"ns": 3, "title": f"User talk:User {i}"} for i in range(3)
+    ]
+    wiki = SimpleNamespace(purge=lambda title: True, category_size=lambda title: 3)
+    journal = checkpoint.Journal(str(tmp_path / "run.jsonl"))
+
+    def iter_blocks(users, session=None):
+        for user in users:
+            if user == "User talk:User 1":
+                yield user, rate_limit.ApiError("en.wikipedia.org", "http", "503")
+            else:
+                yield user, False
+
+    monkeypatch.setattr(cleanup_cat_uaa, "get_wiki", lambda: wiki)
+    monkeypatch.setattr(cleanup_cat_uaa, "get_session", lambda: session)
+    monkeypatch.setattr(cleanup_cat_uaa, "log_data", lambda *args, **kwargs: None)
+    monkeypatch.setattr(cleanup_cat_uaa, "journal", journal)
+    monkeypatch.setattr(cleanup_cat_uaa.block_status, "iter_blocks", iter_blocks)
+
+    failed = cleanup_cat_uaa.check_category("Category:UAA")
+    assert failed == ["User talk:User 1"]
+    assert journal.is_done("Category:UAA", "User talk:User 0")
+    assert not journal.is_done("Category:UAA", "User talk:User 1")
+    assert not journal.is_finished("Category:UAA")
@@ -0,0 +1,136 @@
+import cleanup_cat_uaa
+import delta
+import pytest
+import rate_limit
+import wmf_staff_accounts
+from tests.fake_api import FakeApiSession
+from tests.fake_clock import FakeClock
+from types import SimpleNamespace
+
+API = "https://en.wikipedia.org/w/api.php"
+LAST_RUN = 1_700_000_000
+BEFORE = delta.timestamp(LAST_RUN - 86400)
+AFTER = delta.timestamp(LAST_RUN + 60)
+
+
+@pytest.fixture(autouse=True)
+def fake_clock():
+    rate_limit.reset(FakeClock())
+    yield
+    rate_limit.reset()
+
+
+def make_session():
+    session = FakeApiSession()
+    session.categories["Category:UAA"] = [
+        {"ns": 3, "title": "User talk:Old", "timestamp": BEFORE},
+        {"ns": 3, "title": "User talk:Old blocked", "timestamp": BEFORE},
+        {"ns": 3, "title": "User talk:New", "timestamp": AFTER},
+    ]
+    session.log = [
+        {"type": "block", "title": "User:Old blocked", "timestamp": AFTER},
+        {"type": "block", "title": "User:Not in category", "timestamp": AFTER},
+        {"type": "block", "title": "User:Old", "timestamp": BEFORE},
+    ]
+    return session
+
+
+def test_first_run_lists_everything(tmp_path):
+    session = make_session()
+    index = delta.DeltaIndex(str(tmp_path / "index.json"))
+    assert index.since is None
+    assert len(index.update(session, API, "Category:UAA", [3])) == 3
+    assert index.changed_titles(session, API, "block") == set()
+
+
+def test_later_runs_only_see_changes(tmp_path):
+    session = make_session()
+    path = str(tmp_path / "index.json")
+    index = delta.DeltaIndex(path)
+    index.update(session, API, "Category:UAA", [3])
+    index.started = LAST_RUN
+    index.save()
+
+    index = delta.DeltaIndex(path)
+    assert index.since == delta.timestamp(LAST_RUN - index.overlap)
+    assert index.update(session, API, "Category:UAA", [3]) == {"User talk:New"}
+    assert len(index.members("Category:UAA")) == 3
+    assert index.changed_titles(session, API, "block") == {
+        "User:Old blocked",
+        "User:Not in category",
+    }
+
+
+def test_cleanup_delta_candidates(monkeypatch, tmp_path):
+    session = make_session()
+    path = str(tmp_path / "index.json")
+    index = delta.DeltaIndex(path)
+    index.categories["Category:UAA"] = {"User talk:Old", "User talk:Old blocked"}
+    index.last_run = LAST_RUN
+    monkeypatch.setattr(cleanup_cat_uaa, "get_session", lambda: session)
+    candidates = cleanup_cat_uaa.delta_candidates(index, ["Category:UAA"])
+    assert candidates == {"Category:UAA": ["User talk:New", "User talk:Old blocked"]}
+
+
+def test_failed_lookups_are_retried(monkeypatch, tmp_path):
+    session = make_session()
+    path = str(tmp_path / "index.json")
+    index = delta.DeltaIndex(path)
+    index.categories["Category:UAA"] = {"User talk:Old", "User talk:Old blocked"}
+    index.last_run = LAST_RUN
+    wiki = SimpleNamespace(purge=lambda title: True, category_size=lambda title: 3)
+
+    def iter_blocks(users, session=None):
+        for user in users:
+            if user == "User talk:Old blocked":
+                yield user, rate_limit.ApiError("en.wikipedia.org", "http", "503")
+            else:
+                yield user, False
+
+    monkeypatch.setattr(cleanup_cat_uaa, "get_session", lambda: session)
+    monkeypatch.setattr(cleanup_cat_uaa, "get_wiki", lambda: wiki)
+    monkeypatch.setattr(cleanup_cat_uaa, "log_data", lambda *args, **kwargs: None)
+    monkeypatch.setattr(cleanup_cat_uaa, "journal", None)
+    monkeypatch.setattr(cleanup_cat_uaa.block_status, "iter_blocks", iter_blocks)
+    for subcat, members in cleanup_cat_uaa.delta_candidates(
+        index, ["Category:UAA"]
+    ).items():
+        for user in cleanup_cat_uaa.check_category(subcat, members):
+            index.record_failure(subcat, user)
+    index.started = LAST_RUN + 3600
+    index.save()
+
+    # Nothing changed since, but the failed lookup is still checked again
+    session.log = []
+    index = delta.DeltaIndex(path)
+    candidates = cleanup_cat_uaa.delta_candidates(index, ["Category:UAA"])
+    assert candidates == {"Category:UAA": ["User talk:Old blocked"]}
+    # Until a run gets through it
+    index.save()
+    assert delta.DeltaIndex(path).retries("Category:UAA") == set()
+
+
+def test_members_that_left_are_dropped(tmp_path):
+    session = make_session()
+    index = delta.DeltaIndex(str(tmp_path / "index.json"))
+    index.categories["Category:UAA"] = {
+        "User talk:Old",
+        "User talk:Old blocked",
+        "User talk:Gone",
+    }
+    index.last_run = LAST_RUN
+    assert index.update(session, API, "Category:UAA", [3]) == {"User talk:New"}
+    assert index.members("Category:UAA") == {
+        "User talk:Old",
+        "User talk:Old blocked",
+        "User talk:New",
+    }
+
+
+def test_wmf_locked_members_in_any_language():
+    members = {"Benutzer:Left (WMF)", "Benutzer:Staff (WMF)", "User:Old_one"}
+    titles = ["User:Left (WMF)@global", "User:Old one@global", "User:Other@global"]
+    assert wmf_staff_accounts.locked_members(members, titles) == {
+        "Benutzer:Left (WMF)",
+        "User:Old_one",
+    }
@@ -0,0 +1,62 @@
+import bad_image_bot
+import block_status
+import lock_status
+import pytest
+import wiki_pages
+from tests import fake_wiki_server
+
+pytest.importorskip("pwiki")
+
+
+@pytest.fixture
+def server():
+    with fake_wiki_server.FakeWikiServer() as server:
+        yield server
+
+
+def make_wiki(server, domain):
+    from pwiki.wiki import Wiki
+
+    return Wiki(domain, "TNTBot", "password", None, server.api(domain))
+
+
+def test_pwiki_logs_in_and_reads(server):
+    fake_wiki_server.seed_staff(
+        server, "meta.wikimedia.org", "Category:Staff", 20, locked=0.5
+    )
+    wiki = make_wiki(server, "meta.wikimedia.org")
+    assert wiki.is_bot
+    assert wiki.exists("Category:Staff")
+    assert wiki.category_size("Category:Staff") == 20
+    assert len(wiki.category_members("Category:Staff", ["User"])) == 20
+
+
+def test_lock_status_over_http(server):
+    users = fake_wiki_server.seed_staff(
+        server, "meta.wikimedia.org", "Category:Staff", 20, locked=0.5
+    )
+    statuses = lock_status.resolve_lock_statuses(users, server.session())
+    locked = [user for user, (status, event) in statuses.items() if "locked" in status]
+    assert 0 < len(locked) < 20
+    for user in locked:
+        assert statuses[user][1]["comment"] in fake_wiki_server.LOCK_COMMENTS
+
+
+def test_blocks_and_edits_over_http(server):
+    users = fake_wiki_server.seed_uaa(server, "Category:UAA", 20, blocked=0.5)
+    blocks = block_status.resolve_blocks(users, server.session())
+    assert 0 < sum(blocks.values()) < 20
+    wiki = make_wiki(server, "en.wikipedia.org")
+    page = wiki_pages.fetch_pages(wiki.client, wiki.endpoint, users[:1])[users[0]]
+    result = wiki_pages.edit(wiki, users[0], "Cleaned", "Test", base=page)
+    assert result.ok and not result.nochange
+    assert server.wiki("en.wikipedia.org").pages[users[0]]["text"] == "Cleaned"
+
+
+def test_raw_pages(server):
+    fake_wiki_server.seed_bad_images(server, ["a.example.org"], 10)
+    session = server.session()
+    assert bad_image_bot.get_bad_images(session, "a.example.org")
+    assert bad_image_bot.get_bad_images(session, "b.example.org") == []
+    # The list of b.example.org doesn't exist, so its namespaces aren't needed
+    assert server.request_count == 3
@@ -0,0 +1,39 @@
+import host_limiter
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_slot_bounds_concurrency():
+    host_limiter.configure(per_host=2)
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    def work(_):
+        with host_limiter.slot("en.wikipedia.org"):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            time.sleep(0.01)
+            with lock:
+                active["now"] -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(16)))
+    host_limiter.configure()
+    assert active["max"] == 2
+
+
+def test_slot_is_reentrant():
+    host_limiter.configure(overrides={"meta.wikimedia.org": 1})
+    with host_limiter.slot("meta.wikimedia.org"):
+        with host_limiter.slot("meta.wikimedia.org"):
+            pass
+    host_limiter.configure()
+
+
+def test_unconfigured_is_unbounded():
+    host_limiter.configure()
+    with host_limiter.slot("a.example"):
+        with host_limiter.slot("b.example"):
+            pass
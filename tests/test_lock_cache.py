@@ -0,0 +1,93 @@
+import json
+import lock_cache
+import os
+
+
+def test_upsert_and_lookup(tmp_path):
+    cache = lock_cache.LockCache(str(tmp_path / "cache.sqlite3"), ttl=100)
+    cache.upsert_many(
+        [("Active (WMF)", False, None), ("Gone (WMF)", True, "No longer at WMF")],
+        now=1000,
+    )
+    assert cache.is_unlocked("Active (WMF)", now=1050)
+    assert not cache.is_unlocked("Gone (WMF)", now=1050)
+    assert cache.get("Gone (WMF)", now=1050) == (True, "No longer at WMF")
+    assert cache.get("Unknown", now=1050) is None
+    assert cache.unlocked_users(now=1050) == {"Active (WMF)"}
+    cache.close()
+
+
+def test_entries_expire_individually(tmp_path):
+    cache = lock_cache.LockCache(str(tmp_path / "cache.sqlite3"), ttl=100)
+    cache.upsert_many([("Old", False, None)], now=1000)
+    cache.upsert_many([("New", False, None)], now=1080)
+    assert not cache.is_unlocked("Old", now=1150)
+    assert cache.is_unlocked("New", now=1150)
+    assert cache.count(now=1150) == 1
+    assert cache.purge_expired(now=1150) == 1
+    cache.close()
+
+
+def test_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = lock_cache.LockCache(path)
+    first.upsert_many([("Shared", False, None)])
+    second = lock_cache.LockCache(path)
+    assert not second.is_new
+    assert second.is_unlocked("Shared")
+    first.close()
+    second.close()
+
+
+def test_open_cache_imports_json_files(tmp_path):
+    for domain, users in [
+        ("en.wikipedia.org", ["User:Active (WMF)", "User:Other"]),
+        ("de.wikipedia.org", ["Benutzer:Active (WMF)", "Benutzer:Nur_hier"]),
+    ]:
+        with open(tmp_path / f"{domain}_unlocked_accounts.json", "w") as f:
+            f.write(json.dumps(users))
+    cache = lock_cache.open_cache(str(tmp_path))
+    assert os.path.isfile(tmp_path / lock_cache.CACHE_FILENAME)
+    assert cache.unlocked_users() == {"Active (WMF)", "Other", "Nur hier"}
+    cache.close()
+
+
+def test_import_keeps_newer_entries(tmp_path):
+    path = tmp_path / "en.wikipedia.org_unlocked_accounts.json"
+    with open(path, "w") as f:
+        f.write(json.dumps(["User:Gone (WMF)"]))
+    os.utime(path, (1000, 1000))
+    cache = lock_cache.LockCache(str(tmp_path / "cache.sqlite3"))
+    cache.upsert_many([("Gone (WMF)", True, "No longer at WMF")], now=2000)
+    assert cache.import_json_files(str(tmp_path)) == 0
+    assert cache.get("Gone (WMF)", now=2000) == (True, "No longer at WMF")
+    cache.close()
+
+
+def test_run_cache_loads_once_and_flushes_every_n(tmp_path):
+    store = lock_cache.LockCache(str(tmp_path / "cache.sqlite3"))
+    store.upsert_many([("Cached", False, None)])
+    cache = lock_cache.RunCache(store, flush_every=2)
+    assert "Cached" in cache
+    cache.record("First", False)
+    assert store.get("First") is None
+    cache.record("Second", True, "No longer at WMF")
+    assert store.is_unlocked("First")
+    assert store.get("Second")[0] is True
+    assert "First" in cache
+    assert "Second" not in cache
+    cache.record("Third", False)
+    cache.flush()
+    assert store.is_unlocked("Third")
+    store.close()
+
+
+def test_run_cache_forgets_newly_locked(tmp_path):
+    store = lock_cache.LockCache(str(tmp_path / "cache.sqlite3"))
+    store.upsert_many([("Was active", False, None)])
+    cache = lock_cache.RunCache(store)
+    cache.record("Was active", True, "laid off")
+    assert "Was active" not in cache
+    cache.flush()
+    assert not store.is_unlocked("Was active")
+    store.close()
@@ -0,0 +1,60 @@
+import common_regexes
+import lock_reasons
+import metrics
+import pytest
+from tests.test_regexes import lock_reason_doesnt_match, lock_reason_match
+
+
+@pytest.mark.parametrize("comment", lock_reason_match + lock_reason_doesnt_match)
+def test_rules_agree_with_comment_regex(comment):
+    verdict = lock_reasons.Classifier().classify(comment)
+    assert verdict.matched == (common_regexes.commentRegex.search(comment) is not None)
+
+
+@pytest.mark.parametrize(
+    "comment, rule, text",
+    [
+        ("No longer works at WMF", "no_longer_here", "No longer works at WMF"),
+        ("Staff member laid-off in May", "laid_off", "laid-off"),
+        ("WMF Contractor; Contract ended.", "contract_ended", "Contract ended"),
+        ("Offboarding", "offboarding", "Offboarding"),
+        ("Long-term abuse", None, None),
+    ],
+)
+def test_verdict_names_the_rule(comment, rule, text):
+    verdict = lock_reasons.Classifier().classify(comment)
+    assert verdict == (rule, text)
+
+
+def test_explain():
+    assert lock_reasons.Verdict("laid_off", "laid off").explain() == (
+        "laid_off matched 'laid off'"
+    )
+    assert lock_reasons.NO_MATCH.explain() == "no rule matched"
+
+
+def test_classify_many_matches_classify():
+    comments = (
+        lock_reason_match
+        + lock_reason_doesnt_match
+        + ["Spam\nno longer works here", "", "Offboarding", "No longer works at WMF"]
+    )
+    single = lock_reasons.Classifier()
+    verdicts = lock_reasons.Classifier().classify_many(iter(comments))
+    assert set(verdicts) == set(comments)
+    for comment in comments:
+        assert verdicts[comment] == single.classify(comment)
+
+
+def test_verdicts_are_cached_least_recently_used_first():
+    metrics.reset()
+    classifier = lock_reasons.Classifier(size=2)
+    classifier.classify("laid off")
+    classifier.classify("Spam")
+    classifier.classify("laid off")
+    classifier.classify("Offboarding")
+    assert list(classifier.cache) == ["laid off", "Offboarding"]
+    classifier.classify_many(["Spam", "Offboarding", "Contract ended"])
+    assert list(classifier.cache) == ["Spam", "Contract ended"]
+    assert metrics.get().caches["lock_reasons"] == [2, 5]
+    metrics.reset()
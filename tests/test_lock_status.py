@@ -0,0 +1,76 @@
+import lock_status
+import rate_limit
+from tests.fake_api import FakeApiSession, FakeResponse
+
+
+def make_api():
+    api = FakeApiSession()
+    api.add_global_user("User:Locked (WMF)", locked=True, comment="No longer at WMF")
+    api.add_global_user("User:Active (WMF)")
+    api.add_global_user("User:Old", locked=True)
+    return api
+
+
+def test_get_lock_info_locked():
+    api = make_api()
+    status, event = lock_status.get_lock_info(api, "User:Locked (WMF)")
+    assert "locked" in status
+    assert event["comment"] == "No longer at WMF"
+    assert len(api.requests) == 1
+
+
+def test_get_lock_info_no_event():
+    api = make_api()
+    status, event = lock_status.get_lock_info(api, "User:Old")
+    assert "locked" in status
+    assert event is False
+
+
+def test_resolve_lock_statuses_one_request_per_user():
+    api = make_api()
+    users = ["User:Locked (WMF)", "User:Active (WMF)", "User:Old", "User:Active (WMF)"]
+    lock_info = lock_status.resolve_lock_statuses(users, api)
+    assert set(lock_info) == {"User:Locked (WMF)", "User:Active (WMF)", "User:Old"}
+    assert "locked" not in lock_info["User:Active (WMF)"][0]
+    assert lock_info["User:Active (WMF)"][1] is False
+    assert len(api.requests) == 3
+    assert all(params["meta"] == "globaluserinfo" for url, params in api.requests)
+
+
+def test_iter_lock_statuses_is_lazy():
+    api = make_api()
+    statuses = lock_status.iter_lock_statuses(["User:Old", "User:Active (WMF)"], api)
+    assert len(api.requests) == 0
+    user, status, event = next(statuses)
+    assert user == "User:Old"
+    assert len(api.requests) == 1
+
+
+def test_failed_lookup_is_an_error_not_unlocked():
+    class ErrorSession:
+        def get(self, url, params=None, **kwargs):
+            return FakeResponse({"error": {"code": "internal", "info": "Oops"}})
+
+    (user, status, event) = next(
+        lock_status.iter_lock_statuses(["User:Active (WMF)"], ErrorSession())
+    )
+    assert isinstance(status, rate_limit.ApiError)
+    assert status.code == "internal"
+
+
+def test_iter_known_statuses_only_looks_up_missing_users():
+    api = make_api()
+    known = {"Locked (WMF)": ({"locked": ""}, {"comment": "Known"})}
+    results = list(
+        lock_status.iter_known_statuses(
+            ["Benutzer:Locked_(WMF)", "User:Active (WMF)", "User:Active (WMF)"],
+            known,
+            api,
+        )
+    )
+    assert results[0] == ("Benutzer:Locked_(WMF)", {"locked": ""}, {"comment": "Known"})
+    assert [user for user, status, event in results] == [
+        "Benutzer:Locked_(WMF)",
+        "User:Active (WMF)",
+    ]
+    assert len(api.requests) == 1
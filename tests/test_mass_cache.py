@@ -0,0 +1,131 @@
+import io
+import mass_cache
+import pytest
+import sys
+import threading
+from types import SimpleNamespace
+
+
+def test_thread_output_keeps_blocks_together():
+    stream = io.StringIO()
+    output = mass_cache.ThreadOutput(stream)
+    barrier = threading.Barrier(4)
+
+    def work(name):
+        output.capture()
+        barrier.wait()
+        for i in range(50):
+            output.write(f"{name} {i}\n")
+        output.emit(output.release())
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 200
+    for start in range(0, 200, 50):
+        block = lines[start:][:50]
+        assert len({line.split()[0] for line in block}) == 1
+
+
+def test_run_reports_each_wiki(monkeypatch):
+    projects = {
+        "enwiki": {
+            "title": "Category:Wikimedia Foundation staff",
+            "url": "https://en.wikipedia.org/wiki/Category:Wikimedia_Foundation_staff",
+        },
+        "dewiki": {
+            "title": "Kategorie:Wikimedia Foundation",
+            "url": "https://de.wikipedia.org/wiki/Kategorie:Wikimedia_Foundation",
+        },
+        "brokenwiki": {"title": "Category:Staff", "url": None},
+    }
+
+    def fake_do_cache(args, project, staff_accounts=None, lock_statuses=None):
+        print(f"caching {project}")
+        if project == "de.wikipedia.org":
+            raise RuntimeError("login failed")
+        return True
+
+    monkeypatch.setattr(mass_cache, "do_cache", fake_do_cache)
+    monkeypatch.setattr(mass_cache, "manually_login", lambda project: False)
+    results = mass_cache.run(projects, 2, "./cache")
+    assert sys.stdout is not None
+    statuses = {result["wiki"]: result["status"] for result in results}
+    assert statuses == {
+        "en.wikipedia.org": "ok",
+        "de.wikipedia.org": "failed",
+        "brokenwiki": "skipped",
+    }
+    errors = {result["wiki"]: result["error"] for result in results}
+    assert errors["de.wikipedia.org"] == "login failed"
+
+
+def test_build_staff_index():
+    members = {
+        "en.wikipedia.org": ["User:A", "User:B_(WMF)", "User:A/sandbox"],
+        "de.wikipedia.org": [
+            "Benutzer:B (WMF)",
+            "Benutzer:WMFOffice",
+            "User:WMFOffice",
+        ],
+    }
+    assert mass_cache.build_staff_index(members) == {
+        "A": {"en.wikipedia.org"},
+        "B (WMF)": {"en.wikipedia.org", "de.wikipedia.org"},
+        "WMFOffice": {"de.wikipedia.org"},
+    }
+
+
+def test_two_phase_looks_up_each_account_once(monkeypatch, tmp_path):
+    pytest.importorskip("pwiki")
+    import common_utils
+    import defaults
+    import rate_limit
+    import wiki_sessions
+    import wmf_staff_accounts
+    from tests import fake_wiki_server
+
+    category = "Category:Wikimedia Foundation staff"
+    domains = ["a.example.org", "b.example.org", "c.example.org"]
+    with fake_wiki_server.FakeWikiServer() as server:
+        # The same staff on every wiki, plus some only on the last one
+        for domain in domains:
+            users = fake_wiki_server.seed_staff(server, domain, category, 20, 0.5)
+        users += fake_wiki_server.seed_staff(server, domains[-1], category, 5, seed=2)
+
+        def make_wiki(domain, username, password, cookie_dir):
+            from pwiki.wiki import Wiki
+
+            return Wiki(domain, username, "password", None, server.api(domain))
+
+        monkeypatch.setattr(common_utils, "make_session", server.session)
+        monkeypatch.setattr(wiki_sessions, "make_wiki", make_wiki)
+        monkeypatch.setattr(wiki_sessions, "_managers", {})
+        monkeypatch.setattr(defaults, "COOKIE_DIR", str(tmp_path / "cookies"))
+        monkeypatch.setattr(
+            wmf_staff_accounts, "time", SimpleNamespace(sleep=lambda seconds: None)
+        )
+        rate_limit.reset()
+        projects = {
+            domain: {"title": category, "url": f"https://{domain}/wiki/{category}"}
+            for domain in domains + ["d.example.org"]
+        }
+        results = mass_cache.run(projects, 2, str(tmp_path / "cache"), two_phase=True)
+        meta = server.wiki("meta.wikimedia.org")
+        lookups = [
+            request
+            for request in meta.requests
+            if request[1].get("meta") == "globaluserinfo"
+        ]
+    rate_limit.reset()
+    statuses = {result["wiki"]: result["status"] for result in results}
+    assert statuses == {
+        "a.example.org": "ok",
+        "b.example.org": "ok",
+        "c.example.org": "ok",
+        "d.example.org": "failed",
+    }
+    assert len(lookups) == len(users)
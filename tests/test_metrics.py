@@ -0,0 +1,135 @@
+import argparse
+import json
+import metrics
+import pytest
+import rate_limit
+from types import SimpleNamespace
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    rate_limit.reset()
+    yield metrics.reset(clock=iter(range(100, 1000, 10)).__next__)
+    metrics.reset()
+
+
+def request(url: str, body=None):
+    return SimpleNamespace(url=url, body=body)
+
+
+def test_endpoint_names():
+    api = "https://meta.wikimedia.org/w/api.php"
+    assert (
+        metrics.endpoint_name(
+            request(f"{api}?action=query&meta=globaluserinfo&list=logevents")
+        )
+        == "query:logevents+globaluserinfo"
+    )
+    assert metrics.endpoint_name(request(api, "action=edit&title=A")) == "edit"
+    assert metrics.endpoint_name(request(api, b"action=login")) == "login"
+    assert metrics.endpoint_name(request(f"{api}?action=query")) == "query"
+    assert (
+        metrics.endpoint_name(request("https://a.org/w/index.php?action=raw"))
+        == "index.php"
+    )
+
+
+def test_histogram_percentiles():
+    histogram = metrics.Histogram()
+    for _ in range(90):
+        histogram.add(0.004)
+    for _ in range(10):
+        histogram.add(0.2)
+    assert 0.0025 < histogram.percentile(50) <= 0.005
+    assert 0.1 < histogram.percentile(99) <= 0.2
+    assert histogram.percentile(100) == pytest.approx(0.2)
+    assert metrics.Histogram().percentile(50) == 0
+
+
+def test_report_groups_by_wiki_and_endpoint(fresh_metrics):
+    fresh_metrics.record_request("en.wikipedia.org", "query:blocks", 0.02, 100)
+    fresh_metrics.record_request("en.wikipedia.org", "edit", 0.5, 50, error=True)
+    fresh_metrics.record_request("meta.wikimedia.org", "query:blocks", 0.04, 10)
+    metrics.cache("lock_status", True)
+    metrics.cache("lock_status", True)
+    metrics.cache("lock_status", False)
+    metrics.count("checked_users", 3)
+    report = fresh_metrics.report("tool")
+    assert report["wall_seconds"] == 10
+    assert report["requests"]["requests"] == 3
+    assert report["requests"]["errors"] == 1
+    assert report["requests"]["bytes"] == 160
+    assert report["by_wiki"]["en.wikipedia.org"]["requests"] == 2
+    assert report["by_endpoint"]["query:blocks"]["requests"] == 2
+    assert len(report["by_wiki_endpoint"]) == 3
+    assert report["caches"]["lock_status"] == {
+        "hits": 2,
+        "misses": 1,
+        "hit_rate": 0.6667,
+    }
+    assert report["counters"] == {"checked_users": 3}
+
+
+def test_report_includes_rate_limit_sleeps():
+    limiter = rate_limit.for_wiki("en.wikipedia.org")
+    limiter.reads.slept = 1.5
+    report = metrics.get().report("tool")
+    assert report["slept_by_wiki"] == {"en.wikipedia.org": 1.5}
+    assert report["slept_seconds"] == 1.5
+
+
+def test_instrumented_session_records_responses(fresh_metrics):
+    fake_wiki_server = pytest.importorskip("tests.fake_wiki_server")
+    with fake_wiki_server.FakeWikiServer() as server:
+        server.wiki("en.wikipedia.org").add_page("A", "Text")
+        session = metrics.instrument(server.session())
+        metrics.instrument(session)
+        session.get(
+            "https://en.wikipedia.org/w/api.php",
+            params={"action": "query", "prop": "revisions", "titles": "A"},
+        )
+        session.get(
+            "https://en.wikipedia.org/w/index.php",
+            params={"action": "raw", "title": "Missing"},
+            stream=True,
+        ).close()
+    assert len(session.hooks["response"]) == 1
+    by_endpoint = fresh_metrics.report("tool")["by_endpoint"]
+    assert by_endpoint["query:revisions"]["requests"] == 1
+    assert by_endpoint["query:revisions"]["bytes"] > 0
+    assert by_endpoint["index.php"]["errors"] == 1
+
+
+def test_writes_report_and_prometheus_textfile(fresh_metrics, tmp_path):
+    fresh_metrics.record_request("en.wikipedia.org", "query:blocks", 0.02, 100)
+    metrics.cache("lock_status", False)
+    report = metrics.write_report(str(tmp_path / "reports" / "tool.json"), "tool")
+    with open(tmp_path / "reports" / "tool.json") as f:
+        assert json.load(f) == report
+    metrics.write_prometheus(str(tmp_path / "tool.prom"), report)
+    text = (tmp_path / "tool.prom").read_text()
+    assert "# TYPE tntbot_api_request_duration_seconds histogram" in text
+    assert (
+        'tntbot_api_requests{tool="tool",wiki="en.wikipedia.org",endpoint="query:blocks"} 1'
+        in text
+    )
+    assert (
+        'tntbot_api_request_duration_seconds_bucket{tool="tool",wiki="en.wikipedia.org",endpoint="query:blocks",le="0.025"} 1'
+        in text
+    )
+    assert (
+        'tntbot_api_request_duration_seconds_bucket{tool="tool",wiki="en.wikipedia.org",endpoint="query:blocks",le="0.01"} 0'
+        in text
+    )
+    assert (
+        'tntbot_cache_lookups{tool="tool",cache="lock_status",result="miss"} 1' in text
+    )
+    assert not (tmp_path / "tool.prom.tmp").exists()
+
+
+def test_add_arguments():
+    parser = argparse.ArgumentParser()
+    metrics.add_arguments(parser)
+    args = parser.parse_args(["--report", "run.json"])
+    assert args.report == "run.json"
+    assert args.prometheus is None
@@ -0,0 +1,71 @@
+import block_status
+import pipeline
+import pytest
+import random
+from tests.fake_api import FakeApiSession
+
+
+def test_window_shuffle_is_a_bounded_permutation():
+    items = list(range(1000))
+    shuffled = list(pipeline.window_shuffle(items, 10, random.Random(1)))
+    assert sorted(shuffled) == items
+    assert shuffled != items
+    # An item can't come out before the window has filled up to it
+    assert all(item <= position + 10 for position, item in enumerate(shuffled))
+
+
+def test_window_shuffle_short_input():
+    assert sorted(pipeline.window_shuffle([3, 1, 2], 10)) == [1, 2, 3]
+
+
+def test_window_shuffle_is_lazy():
+    def endless():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    shuffled = pipeline.window_shuffle(endless(), 5)
+    assert len([next(shuffled) for _ in range(20)]) == 20
+
+
+def test_prefetch_keeps_order():
+    assert list(pipeline.prefetch(iter(range(100)), 3)) == list(range(100))
+
+
+def test_prefetch_raises_producer_errors():
+    def broken():
+        yield 1
+        raise RuntimeError("API went away")
+
+    items = pipeline.prefetch(broken())
+    assert next(items) == 1
+    with pytest.raises(RuntimeError):
+        next(items)
+
+
+def test_iter_category_members_pages_lazily():
+    api = FakeApiSession()
+    api.page_size = 2
+    api.categories["Category:UAA"] = [
+        {"ns": 3, "title": f"User talk:User {i}"} for i in range(5)
+    ] + [{"ns": 2, "title": "User:Not a talk page"}]
+    members = pipeline.iter_category_members(api, "api", "Category:UAA", [3])
+    assert next(members) == "User talk:User 0"
+    assert len(api.requests) == 1
+    assert list(members) == [f"User talk:User {i}" for i in range(1, 5)]
+    assert len(api.requests) == 3
+
+
+def test_iter_blocks_streams_in_order():
+    api = FakeApiSession()
+    api.add_block("User 3")
+    users = (f"User talk:User {i}" for i in range(10))
+    blocks = block_status.iter_blocks(users, api, batch_size=4, workers=2)
+    assert next(blocks) == ("User talk:User 0", False)
+    results = [("User talk:User 0", False)] + list(blocks)
+    assert [user for user, blocked in results] == [
+        f"User talk:User {i}" for i in range(10)
+    ]
+    assert [user for user, blocked in results if blocked] == ["User talk:User 3"]
+    assert len(api.requests) == 3
@@ -0,0 +1,192 @@
+import pytest
+import rate_limit
+from tests.fake_api import FakeApiSession, FakeResponse
+from tests.fake_clock import FakeClock
+
+
+def test_token_bucket_allows_bursts_then_paces():
+    clock = FakeClock()
+    bucket = rate_limit.TokenBucket(rate=2, burst=2, clock=clock)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [0.5]
+    clock.time += 10
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.5]
+    assert bucket.slept == 0.5
+
+
+def test_token_bucket_pause():
+    clock = FakeClock()
+    bucket = rate_limit.TokenBucket(rate=100, burst=100, clock=clock)
+    bucket.pause(30)
+    bucket.acquire()
+    assert clock.sleeps == [30]
+
+
+def test_reads_and_writes_have_separate_budgets():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(read_rate=10, write_interval=5, clock=clock)
+    limiter.write()
+    for _ in range(10):
+        limiter.read()
+    assert clock.sleeps == []
+    limiter.write()
+    assert clock.sleeps == [5]
+
+
+def test_lag_delay():
+    assert rate_limit.lag_delay(FakeResponse({}), {}) is None
+    assert (
+        rate_limit.lag_delay(FakeResponse({}, headers={"Retry-After": "7"}), {}) is None
+    )
+    maxlag = {"error": {"code": "maxlag", "lag": 3}}
+    assert rate_limit.lag_delay(FakeResponse(maxlag), maxlag) == 3
+    assert (
+        rate_limit.lag_delay(FakeResponse(maxlag, headers={"Retry-After": "7"}), maxlag)
+        == 7
+    )
+    assert rate_limit.lag_delay(FakeResponse({}, 429, {"Retry-After": "2"}), {}) == 2
+
+
+def test_api_get_retries_when_lagged():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(clock=clock)
+    api = FakeApiSession()
+    api.lagged_responses = 2
+    json = rate_limit.api_get(
+        api,
+        "https://en.wikipedia.org/w/api.php",
+        {"list": "blocks", "bkusers": "A"},
+        limiter,
+    )
+    assert "error" not in json
+    assert len(api.requests) == 3
+    assert api.requests[0][1]["maxlag"] == 5
+    assert clock.sleeps == [5, 5]
+
+
+def test_for_wiki_shares_limiters():
+    rate_limit.reset(FakeClock())
+    assert rate_limit.for_wiki("en.wikipedia.org") is rate_limit.for_wiki(
+        "en.wikipedia.org"
+    )
+    assert rate_limit.for_wiki("en.wikipedia.org") is not rate_limit.for_wiki(
+        "meta.wikimedia.org"
+    )
+    rate_limit.reset()
+
+
+class FlakySession:
+    """Answers with each of a list of responses (or raises them) in turn"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_backoff_delay_doubles_with_jitter():
+    class Rng:
+        def uniform(self, low, high):
+            return high
+
+    assert [rate_limit.backoff_delay(attempt, Rng()) for attempt in range(8)] == [
+        1,
+        2,
+        4,
+        8,
+        16,
+        32,
+        60,
+        60,
+    ]
+    for _ in range(20):
+        assert 2 <= rate_limit.backoff_delay(2) <= 4
+
+
+def test_api_get_retries_timeouts_and_server_errors():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(clock=clock)
+    session = FlakySession(
+        TimeoutError("timed out"),
+        FakeResponse({}, 503, {"Retry-After": "30"}),
+        FakeResponse({"query": {}}),
+    )
+    json = rate_limit.api_get(session, "https://a.org/w/api.php", {}, limiter)
+    assert json == {"query": {}}
+    assert session.requests == 3
+    assert 0.5 <= clock.sleeps[0] <= 1
+    assert clock.sleeps[1] == pytest.approx(30)
+    assert limiter.breaker.failures == 0
+
+
+def test_api_get_gives_up_with_a_typed_error():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(clock=clock)
+    session = FlakySession(*[FakeResponse({}, 500)] * 5)
+    with pytest.raises(rate_limit.RequestFailed) as error:
+        rate_limit.api_get(session, "https://a.org/w/api.php", {}, limiter)
+    assert error.value.host == "a.org"
+    assert "HTTP 500" in error.value.info
+    assert session.requests == 5
+    # No pointless wait after the last try
+    assert len(clock.sleeps) == 4
+
+    session = FlakySession(FakeResponse(ValueError("not JSON")))
+    with pytest.raises(rate_limit.RequestFailed):
+        rate_limit.api_get(
+            session, "https://b.org/w/api.php", {}, rate_limit.RateLimiter(clock=clock)
+        )
+
+
+def test_api_get_gives_up_when_still_lagged():
+    limiter = rate_limit.RateLimiter(clock=FakeClock())
+    lagged = FakeResponse({"error": {"code": "maxlag", "lag": 1}})
+    session = FlakySession(*[lagged] * rate_limit.MAX_LAG_RETRIES)
+    with pytest.raises(rate_limit.RequestFailed) as error:
+        rate_limit.api_get(session, "https://a.org/w/api.php", {}, limiter)
+    assert error.value.code == "maxlag"
+
+
+def test_circuit_breaker_opens_then_lets_a_trial_through():
+    clock = FakeClock()
+    breaker = rate_limit.CircuitBreaker(threshold=3, cooldown=60, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.failure()
+    assert not breaker.allow()
+    clock.time += 60
+    assert breaker.allow()
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.failure()
+    clock.time += 30
+    assert not breaker.allow()
+    clock.time += 30
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_open_circuit_fails_without_sending():
+    clock = FakeClock()
+    limiter = rate_limit.RateLimiter(clock=clock)
+    limiter.breaker = rate_limit.CircuitBreaker(threshold=2, clock=clock)
+    session = FlakySession(*[ConnectionError("refused")] * 2)
+    with pytest.raises(rate_limit.CircuitOpen):
+        rate_limit.http_get(session, "https://a.org/domains.json", limiter)
+    assert session.requests == 2
+    with pytest.raises(rate_limit.CircuitOpen):
+        rate_limit.http_get(session, "https://a.org/domains.json", limiter)
+    assert session.requests == 2
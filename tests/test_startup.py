@@ -0,0 +1,10 @@
+import pytest
+from benchmarks import bench_startup
+
+
+@pytest.mark.parametrize("tool", bench_startup.TOOLS)
+def test_help_skips_heavy_imports(tool):
+    result = bench_startup.measure(tool)
+    assert result["returncode"] == 0
+    for name in bench_startup.HEAVY_MODULES:
+        assert name not in result["modules"]
@@ -1,7 +1,15 @@
 import common_utils
+import json
+import rate_limit
+from tests.fake_api import FakeApiSession, FakeResponse
 
 
-def test_get_project_info_by_domain():
+def test_get_project_info_by_domain(monkeypatch):
+    monkeypatch.setattr(
+        common_utils,
+        "_directory",
+        common_utils.ProjectDirectory.from_file("tests/test_data/sitelinks.json"),
+    )
     title, wiki_domain = common_utils.get_project_info_by_domain("en.wikipedia.org")
     assert title == "Category:Wikimedia Foundation staff"
     assert wiki_domain == "en.wikipedia.org"
@@ -12,3 +20,51 @@ def test_get_wiki_domain_from_url():
         "https://en.wikipedia.org/wiki/Category:Wikimedia Foundation staff"
     )
     assert wiki_domain == "en.wikipedia.org"
+
+
+def test_global_username():
+    assert common_utils.global_username("User:Some_Name (WMF)") == "Some Name (WMF)"
+    assert common_utils.global_username("Benutzer:Name") == "Name"
+    assert common_utils.global_username("Name") == "Name"
+
+
+def test_project_directory_from_file():
+    directory = common_utils.ProjectDirectory.from_file(
+        "tests/test_data/sitelinks.json"
+    )
+    assert len(directory) == 5
+    assert directory.lookup("en.wikipedia.org") == (
+        "enwiki",
+        "Category:Wikimedia Foundation staff",
+    )
+    assert directory.lookup("de.wikipedia.org")[0] == "dewiki"
+    assert directory.lookup("nowhere.example") is None
+
+
+def test_project_directory_disk_cache(tmp_path):
+    rate_limit.reset()
+    with open("tests/test_data/sitelinks.json") as f:
+        sitelinks = json.load(f)
+    cache_file = str(tmp_path / "projects.json")
+    session = FakeApiSession()
+    session.responses[common_utils.SITELINKS_URL] = FakeResponse(
+        sitelinks, headers={"ETag": '"123"'}
+    )
+    directory = common_utils.ProjectDirectory.load(cache_file, 3600, session)
+    assert directory.lookup("en.wikipedia.org")[0] == "enwiki"
+    assert len(session.requests) == 1
+
+    # Fresh cache: no request at all
+    directory = common_utils.ProjectDirectory.load(cache_file, 3600, session)
+    assert len(session.requests) == 1
+    assert directory.lookup("meta.wikimedia.org")[0] == "metawiki"
+
+    # Expired cache: conditional request, and a 304 reuses the cached data
+    session = FakeApiSession()
+    session.responses[common_utils.SITELINKS_URL] = FakeResponse(None, 304)
+    directory = common_utils.ProjectDirectory.load(cache_file, 0, session)
+    assert session.request_headers == [{"If-None-Match": '"123"'}]
+    assert directory.lookup("de.wikipedia.org")[0] == "dewiki"
+    assert common_utils.ProjectDirectory.from_file(cache_file).lookup(
+        "en.wikiquote.org"
+    )
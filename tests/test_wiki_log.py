@@ -0,0 +1,74 @@
+import defaults
+import pytest
+import rate_limit
+import wiki_log
+from tests.fake_clock import FakeClock
+
+
+class FakeWiki:
+    domain = "en.wikipedia.org"
+
+    def __init__(self):
+        self.edits = []
+
+    def page_text(self, title):
+        raise AssertionError("The log page should never be downloaded")
+
+    def edit(self, **kwargs):
+        self.edits.append(kwargs)
+        return True
+
+
+@pytest.fixture(autouse=True)
+def live_run(monkeypatch):
+    rate_limit.reset(FakeClock())
+    monkeypatch.setattr(defaults, "DRY", False)
+    yield
+    rate_limit.reset()
+
+
+def make_log(wiki, clock, flush_every=3, flush_interval=60):
+    return wiki_log.WikiLog(
+        wiki, "User:TNTBot/Logs/Test", "Logging", flush_every, flush_interval, clock.now
+    )
+
+
+def test_flushes_every_n_entries():
+    wiki = FakeWiki()
+    log = make_log(wiki, FakeClock())
+    log.add("one")
+    log.add("two")
+    assert wiki.edits == []
+    log.add("three")
+    assert len(wiki.edits) == 1
+    assert wiki.edits[0]["append"] == "\n* one\n* two\n* three"
+    assert wiki.edits[0]["title"] == "User:TNTBot/Logs/Test"
+    assert "text" not in wiki.edits[0]
+
+
+def test_flushes_after_interval():
+    wiki = FakeWiki()
+    clock = FakeClock()
+    log = make_log(wiki, clock)
+    log.add("one")
+    log.maybe_flush()
+    assert wiki.edits == []
+    clock.time += 61
+    log.maybe_flush()
+    assert wiki.edits[0]["append"] == "\n* one"
+
+
+def test_flush_with_nothing_queued_does_nothing():
+    wiki = FakeWiki()
+    log = make_log(wiki, FakeClock())
+    log.flush()
+    assert wiki.edits == []
+
+
+def test_dry_run_doesnt_edit(monkeypatch):
+    wiki = FakeWiki()
+    log = make_log(wiki, FakeClock())
+    monkeypatch.setattr(defaults, "DRY", True)
+    log.add("one")
+    log.flush()
+    assert wiki.edits == []
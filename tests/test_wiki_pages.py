@@ -0,0 +1,114 @@
+import pytest
+import rate_limit
+import wiki_pages
+from tests.fake_api import FakeApiSession
+from tests.fake_clock import FakeClock
+from types import SimpleNamespace
+
+API = "https://en.wikipedia.org/w/api.php"
+
+
+@pytest.fixture(autouse=True)
+def fake_clock():
+    rate_limit.reset(FakeClock())
+    yield
+    rate_limit.reset()
+
+
+def make_wiki(session):
+    return SimpleNamespace(
+        client=session,
+        endpoint=API,
+        domain="en.wikipedia.org",
+        csrf_token="token+\\\\",
+        is_bot=True,
+    )
+
+
+def test_iter_pages_batches_titles():
+    session = FakeApiSession()
+    titles = [f"User talk:User {i}" for i in range(120)]
+    for title in titles[:100]:
+        session.add_page(title, f"Text of {title}")
+    pages = dict(wiki_pages.iter_pages(titles, session, API))
+    assert len(session.requests) == 3
+    assert pages["User talk:User 5"].text == "Text of User talk:User 5"
+    assert pages["User talk:User 5"].revid == session.pages["User talk:User 5"]["revid"]
+    assert pages["User talk:User 110"] is None
+
+
+def test_fetch_pages_maps_normalized_titles():
+    session = FakeApiSession()
+    session.add_page("User:Some one", "Hello")
+    pages = wiki_pages.fetch_pages(session, API, ["User:Some_one"])
+    assert pages["User:Some_one"].title == "User:Some one"
+    assert pages["User:Some_one"].text == "Hello"
+
+
+def test_edit_with_base_revision():
+    session = FakeApiSession()
+    wiki = make_wiki(session)
+    session.add_page("User:A", "Old")
+    base = wiki_pages.fetch_pages(session, API, ["User:A"])["User:A"]
+    result = wiki_pages.edit(wiki, "User:A", "New", "Summary", base=base)
+    assert result.ok
+    assert result.revid == session.pages["User:A"]["revid"]
+    assert not result.nochange
+    url, data = session.requests[-1]
+    assert data["baserevid"] == base.revid
+    assert data["basetimestamp"] == base.timestamp
+    assert data["bot"] == 1
+    assert session.pages["User:A"]["text"] == "New"
+
+
+def test_edit_conflict_is_refused(capsys):
+    session = FakeApiSession()
+    wiki = make_wiki(session)
+    session.add_page("User:A", "Old")
+    base = wiki_pages.fetch_pages(session, API, ["User:A"])["User:A"]
+    session.add_page("User:A", "Someone else's edit")
+    result = wiki_pages.edit(wiki, "User:A", "New", "Summary", base=base)
+    assert not result.ok
+    assert result.conflict
+    assert result.revid is None
+    assert session.pages["User:A"]["text"] == "Someone else's edit"
+    assert "Edit conflict" in capsys.readouterr().out
+
+
+def test_edit_waits_out_maxlag():
+    session = FakeApiSession()
+    wiki = make_wiki(session)
+    session.add_page("User:A", "Old")
+    session.lagged_responses = 1
+    assert wiki_pages.edit(wiki, "User:A", "New", "Summary").ok
+    assert len(session.requests) == 2
+
+
+def test_edit_without_changes():
+    session = FakeApiSession()
+    wiki = make_wiki(session)
+    session.add_page("User:A", "Same")
+    result = wiki_pages.edit(wiki, "User:A", "Same", "Summary")
+    assert result == wiki_pages.EditResult(None, True, False, None)
+    assert result.ok
+
+
+def test_iter_pages_keeps_errors_apart_from_missing_pages(monkeypatch):
+    session = FakeApiSession()
+    session.add_page("User talk:A", "Text")
+    fetch_pages = wiki_pages.fetch_pages
+
+    def flaky_fetch_pages(session, api, titles):
+        if "User talk:C" in titles:
+            raise rate_limit.ApiError("en.wikipedia.org", "http", "503")
+        return fetch_pages(session, api, titles)
+
+    monkeypatch.setattr(wiki_pages, "fetch_pages", flaky_fetch_pages)
+    pages = dict(
+        wiki_pages.iter_pages(
+            ["User talk:A", "User talk:B", "User talk:C"], session, API, 2
+        )
+    )
+    assert pages["User talk:A"].text == "Text"
+    assert pages["User talk:B"] is None
+    assert isinstance(pages["User talk:C"], rate_limit.ApiError)
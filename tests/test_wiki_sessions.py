@@ -0,0 +1,87 @@
+import pickle
+import wiki_sessions
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session
+
+
+class FakeWiki:
+    """Stands in for pwiki's Wiki: it reuses saved cookies if they're valid"""
+
+    logins = []
+
+    def __init__(self, domain, username, password, cookie_jar):
+        self.domain = domain
+        self.client = Session()
+        family = domain.split(".", 1)[1]
+        cookie_path = cookie_jar / f"{domain}_{username}.pickle"
+        if cookie_path.is_file():
+            with cookie_path.open("rb") as f:
+                self.client.cookies = pickle.load(f)
+        if self.client.cookies.get("centralauth_Token", domain=f".{family}") is None:
+            FakeWiki.logins.append(domain)
+            self.client.cookies.set("centralauth_Token", password, domain=f".{family}")
+
+
+def make_manager(monkeypatch, tmp_path, ttl=3600):
+    FakeWiki.logins = []
+    monkeypatch.setattr(wiki_sessions, "make_wiki", FakeWiki)
+    return wiki_sessions.SessionManager("TNTBot", "secret", tmp_path, ttl)
+
+
+def test_one_login_per_family(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch, tmp_path)
+    enwiki = manager.get_wiki("en.wikipedia.org")
+    dewiki = manager.get_wiki("de.wikipedia.org")
+    manager.get_wiki("meta.wikimedia.org")
+    assert manager.get_wiki("en.wikipedia.org") is enwiki
+    assert FakeWiki.logins == ["en.wikipedia.org", "meta.wikimedia.org"]
+    assert enwiki.client.cookies is dewiki.client.cookies
+    assert enwiki.client.get_adapter("https://x") is manager.adapter
+    # pwiki's per-wiki cookie files are only used to hand over the cookies
+    assert list(tmp_path.glob("*_TNTBot.pickle")) == []
+
+
+def test_wikis_logged_in_at_the_same_time(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch, tmp_path)
+    domains = [f"wiki{i}.example.org" for i in range(16)]
+    with ThreadPoolExecutor(8) as executor:
+        wikis = list(executor.map(manager.get_wiki, domains))
+    assert [wiki.domain for wiki in wikis] == domains
+    assert manager.jar_path.is_file()
+
+
+def test_cookies_are_reused_by_later_runs(monkeypatch, tmp_path):
+    make_manager(monkeypatch, tmp_path).get_wiki("en.wikipedia.org")
+    manager = make_manager(monkeypatch, tmp_path)
+    manager.get_wiki("de.wikipedia.org")
+    assert FakeWiki.logins == []
+
+
+def test_old_cookies_expire(monkeypatch, tmp_path):
+    make_manager(monkeypatch, tmp_path).get_wiki("en.wikipedia.org")
+    manager = make_manager(monkeypatch, tmp_path, ttl=0)
+    manager.get_wiki("en.wikipedia.org")
+    assert FakeWiki.logins == ["en.wikipedia.org"]
+
+
+def test_login_starts_again(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch, tmp_path)
+    enwiki = manager.get_wiki("en.wikipedia.org")
+    assert manager.login("en.wikipedia.org") is not enwiki
+    assert FakeWiki.logins == ["en.wikipedia.org", "en.wikipedia.org"]
+
+
+def test_login_keeps_other_wikis_logged_in(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch, tmp_path)
+    enwiki = manager.get_wiki("en.wikipedia.org")
+    meta = manager.get_wiki("meta.wikimedia.org")
+    manager.login("de.wikipedia.org")
+    assert manager.get_wiki("en.wikipedia.org") is enwiki
+    assert manager.get_wiki("meta.wikimedia.org") is meta
+    assert meta.client.cookies.get("centralauth_Token", domain=".wikimedia.org")
+    assert enwiki.client.cookies.get("centralauth_Token", domain=".wikipedia.org")
+    assert FakeWiki.logins == [
+        "en.wikipedia.org",
+        "meta.wikimedia.org",
+        "de.wikipedia.org",
+    ]
@@ -1,4 +1,5 @@
 import defaults
+import rate_limit
 import wmf_staff_accounts
 
 
@@ -35,16 +36,83 @@ def test_rm_formerstaff():
     )
 
 
-def test_complete_userinfo_modification():
+def test_complete_userinfo_modification(monkeypatch):
     """Test the complete modification of a user page."""
     with open("tests/test_data/example_userinfo_pre.txt", "r") as file:
         example_userinfo_pre = file.read()
     with open("tests/test_data/example_userinfo_post.txt", "r") as file:
         example_userinfo_post = file.read()
 
-    defaults.DRY = True
+    monkeypatch.setattr(defaults, "DRY", True)
     wiki = object()
     assert (
         wmf_staff_accounts.modify_user_page(wiki, "TNTBot", example_userinfo_pre)
         == example_userinfo_post
     )
+
+
+def chain(page_content: str) -> str:
+    """The rules applied one after the other, as modify_user_page() used to"""
+    page_content = wmf_staff_accounts.rm_formerstaff(page_content)
+    page_content = wmf_staff_accounts.rm_category(page_content)
+    page_content = wmf_staff_accounts.cleanup_params(page_content)
+    return wmf_staff_accounts.add_formerparam(page_content)
+
+
+golden_pages = [
+    "",
+    "Just some text about me.\n",
+    "{{former staff}}\n{{user info\n| former = yes\n}}\n[[Category:Wikimedia Foundation staff]]",
+    "{{Former_Staff}}\n{{User_info\n|former=yes\n| name = A\n}}\n",
+    "{{user info\n| former = true\n}}\n",
+    "[[Category:Wikimedia_Foundation_staff]]\n[[category:wikimedia foundation staff]]\n",
+    "{{formerstaff}}\n{{formerstaff}}\n{{user info}}{{user info}}",
+    "{{former staff}}{{user info\n",
+    "| former = yes\n{{babel|en}}\n{{User info\n}}",
+    # Rules that only match once an earlier rule has removed some text
+    "| former = yes[[Category:Wikimedia Foundation staff]]\n",
+    "{{user[[Category:Wikimedia Foundation staff]] info\n",
+]
+
+
+def test_transform_user_page_matches_chain():
+    with open("tests/test_data/example_userinfo_pre.txt", "r") as file:
+        pages = golden_pages + [file.read()]
+    for page in pages:
+        assert wmf_staff_accounts.transform_user_page(page)[0] == chain(page)
+
+
+def test_transform_user_page_reports_rules():
+    _, fired = wmf_staff_accounts.transform_user_page(golden_pages[2])
+    assert fired == ["former_staff", "category", "former_yes", "user_info"]
+    assert wmf_staff_accounts.transform_user_page(golden_pages[1]) == (
+        golden_pages[1],
+        [],
+    )
+
+
+def test_unchanged_page_is_not_edited(monkeypatch, capsys):
+    class NoEditWiki:
+        def edit(self, *args, **kwargs):
+            raise AssertionError("should not edit")
+
+    monkeypatch.setattr(defaults, "DRY", False)
+    page = "Nothing to see here\n"
+    assert wmf_staff_accounts.modify_user_page(NoEditWiki(), "User:A", page) == page
+    assert "Nothing to change" in capsys.readouterr().out
+
+
+def test_check_lock_reasons_only_classifies_locked_accounts():
+    error = rate_limit.ApiError("meta.wikimedia.org", "http", "503")
+    verdicts = wmf_staff_accounts.check_lock_reasons(
+        [
+            ("User:A", {"locked": ""}, {"comment": "Contract ended"}),
+            ("User:B", {"locked": ""}, {"comment": "Long-term abuse"}),
+            ("User:C", {}, {"comment": "Unlocked again"}),
+            ("User:D", error, False),
+            ("User:E", {"locked": ""}, False),
+        ]
+    )
+    assert set(verdicts) == {"Contract ended", "Long-term abuse"}
+    assert verdicts["Contract ended"].rule == "contract_ended"
+    assert not verdicts["Long-term abuse"].matched
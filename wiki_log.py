@@ -0,0 +1,72 @@
+import defaults
+import rate_limit
+import threading
+import time
+
+
+class WikiLog:
+    """Queues log lines for a wiki page and appends them in one edit
+
+    Queued lines are written every flush_every lines, once flush_interval
+    seconds have passed since the last write, and whenever flush() is
+    called (e.g. at exit). The existing page is never downloaded.
+    """
+
+    def __init__(
+        self,
+        wiki,
+        page: str,
+        summary: str,
+        flush_every: int = None,
+        flush_interval: float = None,
+        clock=time.monotonic,
+    ):
+        self.wiki = wiki
+        self.page = page
+        self.summary = summary
+        self.flush_every = (
+            flush_every if flush_every is not None else defaults.LOG_FLUSH_EVERY
+        )
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else defaults.LOG_FLUSH_INTERVAL
+        )
+        self.clock = clock
+        self.entries = []
+        self.last_flush = clock()
+        self.lock = threading.Lock()
+
+    def add(self, entry: str) -> None:
+        """Queue a line for the log page"""
+        with self.lock:
+            self.entries.append(entry)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """Write the queued lines if there are enough, or they're old enough"""
+        with self.lock:
+            due = len(self.entries) >= self.flush_every or (
+                self.entries and self.clock() - self.last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write any queued lines to the log page in one edit"""
+        with self.lock:
+            entries = self.entries
+            self.entries = []
+            self.last_flush = self.clock()
+        if not entries:
+            return
+        text = "".join(f"\n* {entry}" for entry in entries)
+        if defaults.DRY:
+            for entry in entries:
+                print(f"Dry run, not logging {entry}")
+            return
+        rate_limit.for_wiki(self.wiki.domain).write()
+        if not self.wiki.edit(
+            title=self.page, append=text, summary=self.summary, minor=True
+        ):
+            print(f"Failed to log {len(entries)} entries to {self.page}:{text}")
@@ -0,0 +1,130 @@
+import common_utils
+import rate_limit
+from collections import namedtuple
+from urllib.parse import urlparse
+
+# Most titles per query without apihighlimits
+PROP_TITLE_MAX = 50
+Page = namedtuple("Page", ["title", "text", "revid", "timestamp"])
+
+
+class EditResult(namedtuple("EditResult", ["revid", "nochange", "conflict", "error"])):
+    """What happened to an edit
+
+    revid is the ID of the saved revision (None if nothing was saved),
+    nochange is set if the new text was the same as the old, conflict if
+    the page changed since it was fetched, and error holds any API error.
+    """
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def fetch_pages(session, api: str, titles: list[str]) -> dict:
+    """Get the current text and revision of several pages in one query
+
+    Returns a dict of title -> Page, with None for pages that don't exist.
+    Raises rate_limit.ApiError if the pages couldn't be fetched, rather than
+    have them look missing.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "prop": "revisions",
+        "rvprop": "ids|timestamp|content",
+        "rvslots": "main",
+        "titles": "|".join(titles),
+    }
+    pages = {}
+    # MediaWiki answers with normalized titles, so map them back
+    asked_as = {title: title for title in titles}
+    while True:
+        json = rate_limit.api_get(session, api, params)
+        if "error" in json:
+            raise rate_limit.ApiError.from_json(api, json)
+        query = json.get("query", {})
+        for alias in query.get("normalized", []):
+            asked_as[alias["to"]] = alias["from"]
+        for page in query.get("pages", []):
+            title = asked_as.get(page["title"], page["title"])
+            if "missing" in page or "invalid" in page:
+                pages[title] = None
+            elif "revisions" in page:
+                revision = page["revisions"][0]
+                pages[title] = Page(
+                    page["title"],
+                    revision["slots"]["main"]["content"],
+                    revision["revid"],
+                    revision["timestamp"],
+                )
+        # Very large pages can push some content into a continuation
+        if "continue" not in json:
+            return pages
+        params.update(json["continue"])
+
+
+def iter_pages(titles, session, api: str, batch_size: int = PROP_TITLE_MAX):
+    """Fetch pages batch_size at a time, yielding (title, page)
+
+    The page is a Page, or None if it doesn't exist. If it couldn't be
+    fetched, it's the rate_limit.ApiError instead, which must not be taken
+    to mean the page doesn't exist.
+    """
+    for batch in common_utils.chunked(titles, batch_size):
+        try:
+            pages = fetch_pages(session, api, batch)
+        except rate_limit.ApiError as e:
+            for title in batch:
+                yield title, e
+            continue
+        for title in batch:
+            if title in pages:
+                yield title, pages[title]
+            else:
+                yield title, rate_limit.ApiError(
+                    urlparse(api).hostname, "nopage", f"{title} wasn't in the response"
+                )
+
+
+def edit(
+    wiki, title: str, text: str, summary: str, minor: bool = False, base: Page = None
+) -> EditResult:
+    """Replace the text of a page within the wiki's write budget
+
+    If base is given, MediaWiki refuses the edit when the page has changed
+    since base was fetched, instead of overwriting the newer revision.
+    """
+    data = {
+        "action": "edit",
+        "format": "json",
+        "formatversion": 2,
+        "title": title,
+        "text": text,
+        "summary": summary,
+        "token": wiki.csrf_token,
+    }
+    if minor:
+        data["minor"] = 1
+    if wiki.is_bot:
+        data["bot"] = 1
+    if base is not None:
+        data["baserevid"] = base.revid
+        data["basetimestamp"] = base.timestamp
+        data["nocreate"] = 1
+    try:
+        json = rate_limit.api_post(
+            wiki.client, wiki.endpoint, data, rate_limit.for_wiki(wiki.domain)
+        )
+    except rate_limit.ApiError as e:
+        print(f"{title}: Edit failed: {e}")
+        return EditResult(None, False, False, str(e))
+    if "error" in json:
+        print(f"{title}: Edit failed: {json['error']['info']}")
+        conflict = json["error"]["code"] == "editconflict"
+        return EditResult(None, False, conflict, json["error"]["info"])
+    result = json.get("edit", {})
+    if result.get("result") != "Success":
+        return EditResult(None, False, False, f"Edit result: {result.get('result')}")
+    return EditResult(result.get("newrevid"), "nochange" in result, False, None)
@@ -0,0 +1,173 @@
+import config
+import defaults
+import metrics
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pwiki.wiki import Wiki
+    from requests.cookies import RequestsCookieJar
+
+JAR_FILENAME = "sessions.pickle"
+# Account name -> config setting holding its bot password
+ACCOUNTS = {"TNTBot": "TNT_BOT_PASS", "TNTBot-badimage": "TNT_BOT_BADIMAGE_PASS"}
+POOL_CONNECTIONS = 50
+POOL_SIZE = 10
+
+
+def make_wiki(domain: str, username: str, password: str, cookie_dir: Path) -> "Wiki":
+    """Make a pwiki client (pwiki and requests are only imported here)"""
+    from pwiki.wiki import Wiki
+
+    return Wiki(domain, username, password, cookie_dir)
+
+
+class SessionManager:
+    """Hands out logged in Wiki clients that share one set of cookies
+
+    With SUL (CentralAuth), the cookies from one login are good for every
+    wiki in the same family, so a wiki is only logged in to when the shared
+    cookies don't already work there. The cookies are kept on disk for
+    ttl seconds, so later runs can skip logging in too. Every client uses
+    the same pooled HTTP adapter.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        cookie_dir: str = None,
+        ttl: float = None,
+    ):
+        self.username = username
+        self.password = password
+        self.cookie_dir = Path(
+            cookie_dir if cookie_dir is not None else defaults.COOKIE_DIR
+        )
+        self.ttl = ttl if ttl is not None else defaults.COOKIE_TTL_HOURS * 60 * 60
+        from requests.adapters import HTTPAdapter
+
+        self.adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_SIZE
+        )
+        self.jar = self._load_jar()
+        self.wikis = {}
+        self.lock = threading.Lock()
+        self.domain_locks = {}
+        # Saves share a temporary file, so only one may write at a time
+        self.save_lock = threading.Lock()
+
+    @property
+    def jar_path(self) -> Path:
+        return self.cookie_dir / JAR_FILENAME
+
+    def _load_jar(self) -> "RequestsCookieJar":
+        """Load the saved cookies, unless they're missing or too old"""
+        from requests.cookies import RequestsCookieJar
+
+        path = self.jar_path
+        if path.is_file() and time.time() - path.stat().st_mtime < self.ttl:
+            with path.open("rb") as f:
+                jar = pickle.load(f)
+            jar.clear_expired_cookies()
+            return jar
+        return RequestsCookieJar()
+
+    def save(self) -> None:
+        """Save the shared cookies to disk"""
+        self.cookie_dir.mkdir(parents=True, exist_ok=True)
+        with self.save_lock:
+            with self.lock:
+                data = pickle.dumps(self.jar)
+            with open(f"{self.jar_path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{self.jar_path}.tmp", self.jar_path)
+
+    def _pwiki_cookie_path(self, domain: str) -> Path:
+        # Where pwiki looks for saved cookies (see Wiki._cookie_path())
+        return self.cookie_dir / f"{domain}_{self.username}.pickle"
+
+    def _domain_lock(self, domain: str) -> threading.Lock:
+        with self.lock:
+            return self.domain_locks.setdefault(domain, threading.Lock())
+
+    def _connect(self, domain: str, fresh: bool = False) -> "Wiki":
+        """Make a client for a wiki that uses the shared cookies
+
+        Unless fresh, pwiki is handed the shared cookies, which it checks
+        with the wiki; it only logs in if they don't work there. Either way,
+        the cookies it ends up with are merged into the shared jar.
+        """
+        self.cookie_dir.mkdir(parents=True, exist_ok=True)
+        cookie_path = self._pwiki_cookie_path(domain)
+        if fresh:
+            cookie_path.unlink(missing_ok=True)
+        else:
+            with self.lock:
+                data = pickle.dumps(self.jar)
+            with cookie_path.open("wb") as f:
+                f.write(data)
+        try:
+            wiki = make_wiki(domain, self.username, self.password, self.cookie_dir)
+        finally:
+            cookie_path.unlink(missing_ok=True)
+        with self.lock:
+            self.jar.update(wiki.client.cookies)
+            wiki.client.cookies = self.jar
+        wiki.client.mount("https://", self.adapter)
+        wiki.client.headers.update(defaults.HEADERS)
+        metrics.instrument(wiki.client)
+        return wiki
+
+    def get_wiki(self, domain: str) -> "Wiki":
+        """Get a logged in client for a wiki, logging in only if needed"""
+        with self._domain_lock(domain):
+            metrics.cache("wiki_clients", domain in self.wikis)
+            if domain in self.wikis:
+                return self.wikis[domain]
+            wiki = self.wikis[domain] = self._connect(domain)
+        self.save()
+        return wiki
+
+    def forget(self, domain: str) -> None:
+        """Drop a wiki's client, so the next get_wiki() starts again"""
+        with self._domain_lock(domain):
+            self.wikis.pop(domain, None)
+
+    def login(self, domain: str) -> "Wiki":
+        """Log in to a wiki from scratch, refreshing its shared cookies
+
+        Only this wiki's client is replaced. The new login's cookies replace
+        the old ones for its domain (and SUL family) in the shared jar, and
+        every other wiki's client carries on as it was.
+        """
+        with self._domain_lock(domain):
+            self.wikis.pop(domain, None)
+            wiki = self.wikis[domain] = self._connect(domain, fresh=True)
+        self.save()
+        return wiki
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(account: str = "TNTBot") -> SessionManager:
+    """Get the shared session manager for one of the bot's accounts"""
+    with _managers_lock:
+        if account not in _managers:
+            _managers[account] = SessionManager(
+                "TNTBot",
+                getattr(config, ACCOUNTS[account]),
+                Path(defaults.COOKIE_DIR) / account,
+            )
+        return _managers[account]
+
+
+def get_wiki(domain: str, account: str = "TNTBot") -> "Wiki":
+    """Get a logged in client for a wiki"""
+    return get_manager(account).get_wiki(domain)
@@ -1,29 +1,42 @@
 import argparse
+import checkpoint
 import common_regexes
+import common_utils
 import config
-import datetime
 import defaults
-import json
+import delta
+import lock_cache
+import lock_reasons
+import lock_status
+import metrics
 import os
+import rate_limit
 import re
-import requests
 import sys
 import time
+import wiki_pages
+import wiki_sessions
 from difflib import unified_diff
-from pwiki.wiki import Wiki
 from termcolor import colored, cprint
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pwiki.wiki import Wiki
 
 SW_VERSION = "1.1"
+NS_USER = 2
 
 
-def get_staff_accounts(wiki: Wiki) -> list[str]:
+def get_staff_accounts(wiki: "Wiki", category: str = None) -> list[str]:
     """Get a list of staff accounts from the category page"""
-    wiki.purge(defaults.CATEGORY)
+    if category is None:
+        category = defaults.CATEGORY
+    wiki.purge(category)
     time.sleep(3)
-    return wiki.category_members(defaults.CATEGORY, ["User"])
+    return wiki.category_members(category, ["User"])
 
 
-def check_category_exists(wiki: Wiki, category: str) -> bool:
+def check_category_exists(wiki: "Wiki", category: str) -> bool:
     """Check if a category exists"""
     return wiki.exists(category)
 
@@ -33,59 +46,45 @@ def validate_user(user: str):
     return re.search(common_regexes.userRegex, user)
 
 
-def get_user_rights(wiki: Wiki, user: str):
+def get_user_rights(wiki: "Wiki", user: str):
     """Get a user's rights"""
     return wiki.list_user_rights(user)
 
 
-def get_lock_status(user: str):
-    """Get the lock status of a user"""
-    response = requests.get(
-        f"https://meta.wikimedia.org/w/api.php?action=query&format=json&meta=globaluserinfo&formatversion=2&guiuser={user}",
-        headers=defaults.HEADERS,
-    )
-    json = response.json()
-    if "error" in json:
-        print(f"Error: {json['error']['info']}")
-        return False
-    return json["query"]["globaluserinfo"]
-
-
-def get_lock_event(user: str):
-    """Get the lock event of a user"""
-    response = requests.get(
-        f"https://meta.wikimedia.org/w/api.php?action=query&format=json&list=logevents&formatversion=2&letype=globalauth&letitle={user}%40global&lelimit=1",
-        headers=defaults.HEADERS,
+def check_lock_reasons(statuses: list[tuple]) -> dict:
+    """Check which rule (if any) each locked account's lock reason matches
+
+    statuses are (user, lock status, lock event) tuples, as from
+    lock_status.iter_lock_statuses(). The reasons are classified together;
+    returns a dict of reason -> lock_reasons.Verdict.
+    """
+    return lock_reasons.classify_many(
+        lock_event["comment"]
+        for user, user_status, lock_event in statuses
+        if isinstance(user_status, dict)
+        and "locked" in user_status
+        and lock_event is not False
+        and "comment" in lock_event
     )
-    json = response.json()
-    if "error" in json:
-        print(f"Error: {json['error']['info']}")
-        return False
-    if len(json["query"]["logevents"]) == 0:
-        return False  # https://w.wiki/6bLq ??
-    return json["query"]["logevents"][0]
-
 
-def check_lock_reason(reason: str):
-    """Check if the lock reason matches the regex"""
-    return re.search(common_regexes.commentRegex, reason)
 
+def locked_members(members: set, log_titles) -> set:
+    """Find the category members with globalauth log entries
 
-def check_cache(cache_file: str, user: str) -> bool:
-    """Check if a user is in the cache file"""
-    if os.path.isfile(cache_file):
-        unlocked_cache = open(cache_file, "r")
-        unlocked_accounts = json.loads(unlocked_cache.read())
-        unlocked_cache.close()
-        if user in unlocked_accounts:
-            return True
-    return False
+    Log titles come from meta (User:X@global), while members use the
+    wiki's own name for the User namespace (e.g. Benutzer:X), so both are
+    compared as global usernames.
+    """
+    locked = {
+        common_utils.global_username(title.removesuffix("@global"))
+        for title in log_titles
+    }
+    return {user for user in members if common_utils.global_username(user) in locked}
 
 
-def modification_date(filename: str) -> datetime:
-    """Get the modification date of a file"""
-    t = os.path.getmtime(filename)
-    return datetime.datetime.fromtimestamp(t)
+def check_cache(cache: lock_cache.RunCache, user: str) -> bool:
+    """Check if a user is cached as not locked"""
+    return common_utils.global_username(user) in cache
 
 
 def rm_formerstaff(page_content: str) -> str:
@@ -110,16 +109,46 @@ def cleanup_params(page_content: str) -> str:
     return common_regexes.cleanupRegex.sub("", page_content)
 
 
-def modify_user_page(wiki: Wiki, user: str, page_content: str) -> str:
-    """Modify a user page"""
-    old_content = page_content
-    new_content = rm_formerstaff(page_content)
-    new_content = rm_category(new_content)
-    new_content = cleanup_params(new_content)
-    new_content = add_formerparam(new_content)
-    diff = unified_diff(old_content.splitlines(1), new_content.splitlines(1))
+# The user page rules, in the order they're applied
+USERPAGE_RULES = [
+    ("former_staff", rm_formerstaff),
+    ("category", rm_category),
+    ("former_yes", cleanup_params),
+    ("user_info", add_formerparam),
+]
+
+
+def transform_user_page(page_content: str) -> tuple[str, list[str]]:
+    """Apply every user page rule, one after the other
+
+    Returns the new text and the names of the rules that changed it.
+    """
+    fired = []
+    for name, rule in USERPAGE_RULES:
+        new_content = rule(page_content)
+        if new_content != page_content:
+            fired.append(name)
+        page_content = new_content
+    return page_content, fired
+
+
+def modify_user_page(
+    wiki: "Wiki", user: str, page_content: str, base: wiki_pages.Page = None
+) -> str:
+    """Modify a user page (base is the revision page_content came from)
+
+    Returns the new text, or None if the edit failed.
+    """
+    new_content, fired = transform_user_page(page_content)
+    if new_content == page_content:
+        print(f" - {user}: Nothing to change, skipping.")
+        return page_content
     if defaults.DRY is False:
-        wiki.edit(title=user, text=new_content, summary=defaults.SUMMARY, minor=True)
+        if not wiki_pages.edit(
+            wiki, user, new_content, defaults.SUMMARY, minor=True, base=base
+        ).ok:
+            cprint(f" - {user}: Edit failed, page left as it was.", "red")
+            return None
         print(
             f" - {user}: Edited page and left the following summary: {defaults.SUMMARY}"
         )
@@ -128,16 +157,15 @@ def modify_user_page(wiki: Wiki, user: str, page_content: str) -> str:
             f" - {user}: Would have edited page and left the following summary: {defaults.SUMMARY}"
         )
     if defaults.VIEW_DIFF is True:
-        print("Diff:")
-        sys.stdout.writelines(diff)
+        print(f"Diff ({', '.join(sorted(set(fired)))}):")
+        sys.stdout.writelines(
+            unified_diff(page_content.splitlines(1), new_content.splitlines(1))
+        )
         print("\n----\n")
-    if defaults.DRY is False:
-        print(f"Sleeping for {defaults.DELAY} seconds...")
-        time.sleep(defaults.DELAY)
     return new_content
 
 
-def should_I_run(wiki: Wiki, wiki_domain: str) -> None:
+def should_I_run(args, wiki: "Wiki", wiki_domain: str) -> None:
     """Check if the bot should run on this wiki"""
     # Check if the wiki domain is in the enabled projects list
     if wiki_domain not in config.ENABLED_PROJECTS:
@@ -160,22 +188,30 @@ def should_I_run(wiki: Wiki, wiki_domain: str) -> None:
             time.sleep(1)
 
 
-def main(args, wiki_domain: str, cache_only: bool, verbose: bool, cache_dir: str):
-    """Main function"""
+def main(
+    args,
+    wiki_domain: str,
+    cache_only: bool,
+    verbose: bool,
+    cache_dir: str,
+    staff_accounts: list[str] = None,
+    lock_statuses: dict = None,
+):
+    """Main function
+
+    staff_accounts (the category's members) and lock_statuses (global
+    username -> (lock status, lock event)) can be passed in if they were
+    already fetched, e.g. by mass_cache's cross-wiki index. Then the
+    category isn't listed, and only accounts missing from lock_statuses
+    are looked up.
+    """
     # Init
     defaults.DRY = args.dry
     defaults.VIEW_DIFF = args.diff
-    defaults.CATEGORY = args.category
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    cache_file = f"{cache_dir}/{wiki_domain}_unlocked_accounts.json"
+    category = args.category
 
     # Print settings
-    print(f"Running on https://{wiki_domain} with category {defaults.CATEGORY}")
-    if args.regen_cache:
-        if os.path.isfile(cache_file):
-            print(f"I will regenerate cache file '{cache_file}'...")
-            os.remove(cache_file)
+    print(f"Running on https://{wiki_domain} with category {category}")
     if cache_only:
         print(
             "Cache-only mode enabled: Locked accounts will be ignored, and no edits will be made."
@@ -191,102 +227,205 @@ def main(args, wiki_domain: str, cache_only: bool, verbose: bool, cache_dir: str
 
     # Start
     try:
-        wiki = Wiki(wiki_domain, "TNTBot", config.TNT_BOT_PASS)
+        wiki = wiki_sessions.get_wiki(wiki_domain)
     except Exception as e:
         # Throw error and exit
         cprint(f"Error: {e}", "red")
         return False
-    # Check if I should run on this wiki
-    should_I_run(wiki, wiki_domain)
-    if check_category_exists(wiki, defaults.CATEGORY) is False:
-        cprint(f"Category {defaults.CATEGORY} on {wiki_domain} does not exist.", "red")
+    # Check if I should run on this wiki (cache-only runs never edit)
+    if not cache_only:
+        should_I_run(args, wiki, wiki_domain)
+    if staff_accounts is None and check_category_exists(wiki, category) is False:
+        cprint(f"Category {category} on {wiki_domain} does not exist.", "red")
         return False
-    print(f"Purging {defaults.CATEGORY} and getting staff accounts...")
-    staff_accounts = get_staff_accounts(wiki)
+    # Accounts locked since the last delta run, which the cache can't know
+    # about, and accounts the last delta run couldn't finish
+    recheck = set()
+    index = None
+    if staff_accounts is not None:
+        print(f"Using the {len(staff_accounts)} staff accounts already listed...")
+    elif args.delta:
+        index = delta.DeltaIndex(
+            os.path.join(cache_dir, f"delta_index-{wiki_domain}.json")
+        )
+        print(f"Getting staff accounts added or locked since {index.since}...")
+        added = index.update(wiki.client, wiki.endpoint, category, [NS_USER])
+        recheck = locked_members(
+            index.members(category),
+            index.changed_titles(
+                common_utils.make_session(), lock_status.META_API, "globalauth"
+            ),
+        ) | (index.retries(category) & index.members(category))
+        staff_accounts = sorted(added | recheck)
+    else:
+        print(f"Purging {category} and getting staff accounts...")
+        staff_accounts = get_staff_accounts(wiki, category)
     unlocked_accounts = []
     locked_accounts = []
     edited_accounts = []
+    # Locked accounts whose user pages need editing, fetched in batches later
+    pages_to_edit = []
     cached_accounts = []
     excluded_accounts = []
-
-    print(f"Got {len(staff_accounts)} staff accounts. Checking cache file...")
-
-    if os.path.isfile(cache_file):
-        print(f"Cache file found: {cache_file}")
-        print(f"Cache file last modified: {modification_date(cache_file)}")
-        if datetime.datetime.now() - modification_date(cache_file) > datetime.timedelta(
-            hours=48
-        ):
-            print("Cache file is older than 48 hours, deleting...")
-            os.remove(cache_file)
-        else:
-            print("Cache file is less than 48 hours old — OK to use.")
-    else:
-        print("No cache file found — will create one.")
+    resumed_accounts = []
+    # Accounts whose lock status couldn't be looked up
+    failed_accounts = []
+    # Locked accounts whose user pages couldn't be fetched or edited
+    failed_pages = []
+
+    print(f"Got {len(staff_accounts)} staff accounts. Checking cache...")
+    store = lock_cache.open_cache(cache_dir)
+    cache = lock_cache.RunCache(store)
+    print(f"Cache file: {store.path} ({len(cache)} cached unlocked accounts)")
+    if args.regen_cache:
+        print("Cached entries will be ignored and regenerated.")
+    journal = checkpoint.Journal(
+        checkpoint.journal_path(
+            os.path.join(cache_dir, "checkpoints"),
+            f"wmf_staff_accounts-{wiki_domain}",
+            defaults.DRY,
+            cache_only,
+        ),
+        args.resume,
+    )
+    if args.resume:
+        print(f"Resuming from {journal.path}.")
 
     if args.yes is False:
         input("\nPress Enter to continue...")
     print("\nChecking staff accounts, please wait...")
     print("")
 
+    pending_accounts = []
     for user in staff_accounts:
         if verbose:
             print(f" - {user}: checking...")
+        if journal.is_done(category, user):
+            resumed_accounts.append(user)
+            if verbose:
+                print(f" - {user}: done in the last run")
+            continue
         if validate_user(user) is not None:
             print(f" - {user}: not a user page")
+            journal.record(category, user, "not a user page")
             continue
         if user in defaults.EXCEPTIONS:
             excluded_accounts.append(user)
             print(f" - {user}: in exceptions list")
+            journal.record(category, user, "excluded")
             continue
-        if check_cache(cache_file, user) is True:
+        if (
+            not args.regen_cache
+            and user not in recheck
+            and check_cache(cache, user) is True
+        ):
             cached_accounts.append(user)
             if verbose:
                 print(f" - {user}: found in cache")
+            journal.record(category, user, "cached")
             continue
-        user_status = get_lock_status(user)
-        if user_status is not False and "locked" in user_status:
-            lock_event = get_lock_event(user)
-            if lock_event is not False and "comment" in lock_event:
-                locked_accounts.append(user)
-                if check_lock_reason(lock_event["comment"]) is None:
-                    cprint(
-                        f" - {user}: locked, but for another reason ({lock_event['comment']})",
-                        "yellow",
-                    )
+        pending_accounts.append(user)
+
+    if lock_statuses is None:
+        statuses = lock_status.iter_lock_statuses(pending_accounts)
+    else:
+        statuses = lock_status.iter_known_statuses(pending_accounts, lock_statuses)
+    try:
+        for batch in common_utils.chunked(statuses, defaults.LOCK_REASON_BATCH):
+            verdicts = check_lock_reasons(batch)
+            for user, user_status, lock_event in batch:
+                username = common_utils.global_username(user)
+                if isinstance(user_status, rate_limit.ApiError):
+                    # Not cached or recorded, so the next run checks them again
+                    cprint(f" - {user}: couldn't check ({user_status})", "red")
+                    failed_accounts.append(user)
                     continue
-                cprint(
-                    f" - {user}: locked, regex match ({lock_event['comment']})", "green"
-                )
-                if cache_only:
+                if user_status is not False and "locked" in user_status:
+                    if lock_event is not False and "comment" in lock_event:
+                        locked_accounts.append(user)
+                        cache.record(username, True, lock_event["comment"])
+                        verdict = verdicts[lock_event["comment"]]
+                        metrics.count(f"lock_rule:{verdict.rule or 'other'}")
+                        if not verdict.matched:
+                            cprint(
+                                f" - {user}: locked, but for another reason ({lock_event['comment']})",
+                                "yellow",
+                            )
+                            journal.record(category, user, "locked, other reason")
+                            continue
+                        cprint(
+                            f" - {user}: locked, {verdict.explain()} ({lock_event['comment']})",
+                            "green",
+                        )
+                        if cache_only:
+                            if verbose:
+                                print(
+                                    " - Cache-only mode enabled: Not editing user page."
+                                )
+                            journal.record(category, user, "locked")
+                            continue
+                        pages_to_edit.append(user)
+                else:
                     if verbose:
-                        print(" - Cache-only mode enabled: Not editing user page.")
-                    continue
-                page_content = wiki.page_text(user)
-                if page_content is not None:
-                    modify_user_page(wiki, user, page_content)
-                    edited_accounts.append(user)
-        else:
-            if verbose:
-                print(f" - {user}: not locked")
-            unlocked_accounts.append(user)
+                        print(f" - {user}: not locked")
+                    unlocked_accounts.append(user)
+                    cache.record(username, False)
+                    journal.record(category, user, "not locked")
+    finally:
+        # Keep whatever was learned, even if the run was interrupted
+        cache.flush()
+        store.close()
+
+    if pages_to_edit:
+        print(f"\nFetching {len(pages_to_edit)} user pages to edit...")
+    for user, page in wiki_pages.iter_pages(pages_to_edit, wiki.client, wiki.endpoint):
+        if isinstance(page, rate_limit.ApiError):
+            # Not recorded, so a resumed run tries again
+            cprint(f" - {user}: Couldn't fetch the user page ({page})", "red")
+            failed_pages.append(user)
+            continue
+        if page is None:
+            print(f" - {user}: No user page, skipping.")
+            journal.record(category, user, "no user page")
+            continue
+        new_content = modify_user_page(wiki, user, page.text, page)
+        if new_content is None:
+            # Not recorded, so a resumed run tries again
+            failed_pages.append(user)
+            continue
+        if new_content != page.text:
+            edited_accounts.append(user)
+        journal.record(
+            category, user, "edited" if new_content != page.text else "unchanged"
+        )
+    if not failed_accounts and not failed_pages:
+        journal.finish(category)
+    journal.close()
+    if index is not None:
+        # Not covered by anything changing since this run, so keep them
+        for user in failed_accounts + failed_pages:
+            index.record_failure(category, user)
+        index.save()
 
     print("\nDone.")
     print(f"Staff accounts locked: {len(locked_accounts)}")
     print(f"Staff accounts not locked: {len(unlocked_accounts) + len(cached_accounts)}")
     print(f"Staff accounts cached: {len(cached_accounts)}")
     print(f"Staff accounts excluded: {len(excluded_accounts)}")
+    if failed_accounts:
+        cprint(
+            f"Staff accounts that couldn't be checked: {len(failed_accounts)}", "red"
+        )
+    if failed_pages:
+        cprint(
+            f"Staff account user pages that couldn't be edited: {len(failed_pages)}",
+            "red",
+        )
+    if args.resume:
+        print(f"Staff accounts done in the last run: {len(resumed_accounts)}")
     print(f"Staff account user pages edited: {len(edited_accounts)}")
     print(f"Total: {len(staff_accounts)}")
 
-    if os.path.isfile(cache_file) is False:
-        print("\nCreating cache file...")
-        unlocked_json = json.dumps(unlocked_accounts)
-        unlocked_cache = open(cache_file, "w")
-        unlocked_cache.write(unlocked_json)
-        unlocked_cache.close()
-        print("Unlocked accounts cached.")
-
     return True
 
 
@@ -325,9 +464,21 @@ if __name__ == "__main__":
         "--yes", help="Skip confirmation before start", action="store_true"
     )
     parser.add_argument("--regen-cache", help="Regenerate cache", action="store_true")
+    parser.add_argument(
+        "--delta",
+        help="Only check accounts added or locked since the last --delta run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip accounts the last run on this wiki already finished",
+        action="store_true",
+    )
     parser.add_argument("--dry", help="Don't make any edits", action="store_true")
     parser.add_argument("-v", "--verbose", help="Be verbose", action="store_true")
+    metrics.add_arguments(parser)
     args = parser.parse_args()
+    metrics.start("wmf_staff_accounts", args.report, args.prometheus)
     defaults.DRY = args.dry
     defaults.VIEW_DIFF = args.diff
     defaults.CATEGORY = args.category